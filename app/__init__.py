@@ -3,12 +3,23 @@ import secrets
 from flask import Flask, session, request, abort
 from markupsafe import Markup
 from .config import Config
+from .audit import init_audit
+from .cache import init_page_cache, init_user_cache
+from .metrics import init_metrics
+from .passwords import init_passwords
+from .perf import init_perf
+from .thumbnails import init_thumbnails
 from .db import init_db_if_needed, close_db
 from .routes import bp as main_bp
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    if config:
+        app.config.update(config)
+    # First, so that its hooks time the whole request, CSRF check included.
+    init_perf(app)
+    init_metrics(app)
 
     # --- Minimal CSRF protection (session-based) ---
     def _csrf_token() -> str:
@@ -34,9 +45,15 @@ def create_app():
             "csrf_field": lambda: Markup(f'<input type="hidden" name="_csrf" value="{tok}">'),
         }
 
+    # Before the DB init, so that first-run seed users get the configured hash method.
+    init_passwords(app)
     app.register_blueprint(main_bp)
 
-    # DB lifecycle
-    init_db_if_needed(app)
+    # DB lifecycle (teardown first, so the connection used by init_db goes back to the pool)
     app.teardown_appcontext(close_db)
+    init_db_if_needed(app)
+    init_page_cache(app)
+    init_user_cache(app)
+    init_audit(app)
+    init_thumbnails(app)
     return app
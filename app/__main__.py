@@ -1,6 +1,85 @@
+import argparse
+import sys
+
 from . import create_app
 
-app = create_app()
 
-if __name__ == "__main__":
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app", description="GreenLink management commands.")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("run", help="run the development server (default)")
+    sub.add_parser("migrate", help="apply pending database schema migrations (and seed a new database)")
+    sub.add_parser("recount", help="recompute denormalized application counters on events/tasks")
+    sub.add_parser("migrate-uploads", help="move legacy report media files into the deduplicated attachment store")
+    sub.add_parser("gc-uploads", help="delete attachments no report refers to and stray blob/spool files")
+    seed = sub.add_parser("seed", help="bulk-load synthetic users, events, tasks and applications (disposable databases)")
+    seed.add_argument("--users", type=int, default=1000, help="volunteers (plus one organizer per 1000)")
+    seed.add_argument("--events", type=int, default=100)
+    seed.add_argument("--tasks", type=int, default=None, help="default: half the events")
+    seed.add_argument("--apps-per-event", type=int, default=20, help="applications per event and per task")
+    seed.add_argument("--seed", type=int, default=0, help="random seed")
+    worker = sub.add_parser("worker", help="run background jobs (exports, media processing) until stopped")
+    worker.add_argument("--processes", type=int, default=None, help="worker processes (default: JOB_WORKERS)")
+    worker.add_argument("--burst", action="store_true", help="exit once no job is due")
+    args = parser.parse_args(argv)
+
+    # The migrate command migrates while the app starts, whatever DB_MIGRATE_ON_START says.
+    app = create_app({"DB_MIGRATE_ON_START": True} if args.command == "migrate" else None)
+
+    if args.command == "migrate":
+        from .db import SCHEMA_VERSION, get_db, schema_version
+        with app.app_context():
+            version = schema_version(get_db())
+        print(f"Database schema is at version {version} (code expects {SCHEMA_VERSION}).")
+        return 0
+
+    if args.command == "recount":
+        from .db import get_db, recount_application_counters
+        with app.app_context():
+            db = get_db()
+            fixed = recount_application_counters(db)
+            db.commit()
+        print(f"Counters recomputed, {fixed} item(s) corrected.")
+        return 0
+
+    if args.command in ("migrate-uploads", "gc-uploads"):
+        import os
+        from . import storage
+        from .db import get_db, now_iso
+        with app.app_context():
+            db = get_db()
+            root = os.path.join(os.path.dirname(app.config["DB_PATH"]), "uploads")
+            if args.command == "migrate-uploads":
+                stats = storage.migrate_media_paths(db, root, now_iso())
+                print(
+                    f"Migrated {stats['migrated']} file(s) ({stats['deduplicated']} deduplicated), "
+                    f"{stats['missing']} report(s) point at missing files."
+                )
+            else:
+                removed = storage.collect_garbage(db, root)
+                print(f"Removed {removed} unreferenced file(s).")
+        return 0
+
+    if args.command == "seed":
+        import time
+        from .db import get_db
+        from .seed import BULK_PASSWORD, bulk_load, seed_bulk
+        started = time.perf_counter()
+        with app.app_context():
+            db = get_db()
+            with bulk_load(db, app.config):
+                result = seed_bulk(db, args.users, args.events, args.apps_per_event, tasks=args.tasks, seed=args.seed)
+        counts = ", ".join(f"{k}={v}" for k, v in result["counts"].items())
+        print(f"Seeded in {time.perf_counter() - started:.1f}s: {counts}. Password for new users: {BULK_PASSWORD}.")
+        return 0
+
+    if args.command == "worker":
+        from .jobs import run_workers
+        return run_workers(app, args.processes or app.config.get("JOB_WORKERS", 2), burst=args.burst)
+
     app.run(host="0.0.0.0", port=8000, debug=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""Buffered audit trail.
+
+audit_log() in routes only appends an event to an in-memory buffer. A
+background thread per worker process flushes the buffer every
+AUDIT_FLUSH_INTERVAL seconds (or as soon as AUDIT_BUFFER_SIZE events are
+waiting) to two places:
+
+* data/audit.log - tab-separated lines, rotated by size and by time period;
+* the audit_events table - indexed, queried by /admin/audit.
+
+The file is fsynced according to AUDIT_FSYNC: "always" (every flush),
+"interval" (at most every AUDIT_FSYNC_INTERVAL seconds) or "never".
+"""
+import atexit
+import glob
+import os
+import sqlite3
+import threading
+import time
+
+from flask import current_app
+
+try:
+    import fcntl
+except ImportError:  # Windows: rotation is not coordinated between processes
+    fcntl = None
+
+
+class AuditWriter:
+    def __init__(self, log_path, db_path, pragmas=(), flush_interval=1.0, buffer_size=100,
+                 fsync="interval", fsync_interval=5.0, max_bytes=10 * 1024 * 1024,
+                 rotate_seconds=86400, backup_count=14):
+        self.log_path = log_path
+        self.db_path = db_path
+        self.pragmas = list(pragmas)
+        self.flush_interval = flush_interval
+        self.buffer_size = max(1, int(buffer_size))
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self._reset()
+        atexit.register(self.close)
+
+    def _reset(self):
+        # Also called in a forked child: threads and file handles do not survive fork.
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._buffer = []
+        self._thread = None
+        self._stopping = False
+        self._file = None
+        self._conn = None
+        self._last_fsync = 0.0
+
+    # --- producer side ---
+
+    def emit(self, created_at, actor_id, actor, role, action, target="", extra=""):
+        if self._pid != os.getpid():
+            self._reset()
+        with self._cond:
+            self._buffer.append((created_at, actor_id, actor, role, action, target, extra))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audit-flush", daemon=True)
+                self._thread.start()
+            if len(self._buffer) >= self.buffer_size:
+                self._cond.notify()
+
+    def flush(self):
+        """Write everything buffered so far, synchronously."""
+        if self._pid != os.getpid():
+            return
+        with self._cond:
+            batch, self._buffer = self._buffer, []
+        self._write(batch)
+
+    def close(self):
+        if self._pid != os.getpid():
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self.flush()
+        with self._io_lock:
+            if self._file is not None:
+                self._sync(force=True)
+                self._file.close()
+                self._file = None
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # --- background side ---
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopping and len(self._buffer) < self.buffer_size:
+                    self._cond.wait(self.flush_interval)
+                if self._stopping:
+                    return
+                batch, self._buffer = self._buffer, []
+            self._write(batch)
+
+    def _write(self, batch):
+        if not batch:
+            return
+        with self._io_lock:
+            try:
+                self._write_file(batch)
+            except OSError:
+                pass
+            try:
+                self._write_db(batch)
+            except sqlite3.Error:
+                # Keep the file copy; the table is a query aid, not the record of truth.
+                pass
+
+    def _write_file(self, batch):
+        lines = []
+        for created_at, actor_id, actor, role, action, target, extra in batch:
+            who = f"{actor_id}:{actor}:{role}" if actor_id is not None else actor
+            lines.append(f"{created_at}\t{who}\t{action}\t{target or ''}\t{extra or ''}\n")
+        data = "".join(lines).encode("utf-8")
+        self._maybe_rotate(len(data))
+        f = self._open()
+        f.write(data)
+        f.flush()
+        self._sync()
+
+    def _sync(self, force=False):
+        if self.fsync == "never" and not force:
+            return
+        now = time.monotonic()
+        if force or self.fsync == "always" or now - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_fsync = now
+
+    def _open(self):
+        # Reopen when another process has rotated the file under us.
+        if self._file is not None:
+            try:
+                if os.stat(self.log_path).st_ino == os.fstat(self._file.fileno()).st_ino:
+                    return self._file
+            except FileNotFoundError:
+                pass
+            self._file.close()
+        os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+        self._file = open(self.log_path, "ab")
+        return self._file
+
+    def _needs_rotation(self, incoming: int) -> bool:
+        try:
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            return False
+        if st.st_size == 0:
+            return False
+        if self.max_bytes and st.st_size + incoming > self.max_bytes:
+            return True
+        # Time rotation: a file never spans two periods.
+        if self.rotate_seconds:
+            return int(st.st_mtime // self.rotate_seconds) < int(time.time() // self.rotate_seconds)
+        return False
+
+    def _maybe_rotate(self, incoming: int):
+        if not self._needs_rotation(incoming):
+            return
+        lock_path = self.log_path + ".lock"
+        with open(lock_path, "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # Another worker may have rotated while we waited for the lock.
+                if not self._needs_rotation(incoming):
+                    return
+                stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+                target = f"{self.log_path}.{stamp}"
+                n = 1
+                while os.path.exists(target):
+                    target = f"{self.log_path}.{stamp}-{n}"
+                    n += 1
+                os.rename(self.log_path, target)
+                self._prune()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _prune(self):
+        rotated = [p for p in glob.glob(self.log_path + ".*") if not p.endswith(".lock")]
+        rotated.sort(key=lambda p: (os.path.getmtime(p), len(p), p))  # oldest first
+        for path in rotated[: max(0, len(rotated) - self.backup_count)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _write_db(self, batch):
+        if self._conn is None:
+            # Used by the flush thread and by flush() callers, always under _io_lock.
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            for pragma in self.pragmas:
+                self._conn.execute(f"PRAGMA {pragma};")
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO audit_events(created_at, actor_id, actor, role, action, target, extra) VALUES(?,?,?,?,?,?,?)",
+                batch,
+            )
+
+
+def init_audit(app):
+    from .db import _pool_pragmas
+    cfg = app.config
+    db_path = cfg["DB_PATH"]
+    log_path = cfg.get("AUDIT_LOG_PATH") or os.path.join(os.path.dirname(os.path.abspath(db_path)), "audit.log")
+    writer = AuditWriter(
+        log_path,
+        db_path,
+        pragmas=_pool_pragmas(cfg),
+        flush_interval=float(cfg.get("AUDIT_FLUSH_INTERVAL", 1.0)),
+        buffer_size=int(cfg.get("AUDIT_BUFFER_SIZE", 100)),
+        fsync=(cfg.get("AUDIT_FSYNC") or "interval").lower(),
+        fsync_interval=float(cfg.get("AUDIT_FSYNC_INTERVAL", 5.0)),
+        max_bytes=int(cfg.get("AUDIT_MAX_BYTES", 10 * 1024 * 1024)),
+        rotate_seconds=int(cfg.get("AUDIT_ROTATE_SECONDS", 86400)),
+        backup_count=int(cfg.get("AUDIT_BACKUP_COUNT", 14)),
+    )
+    app.extensions["audit"] = writer
+    return writer
+
+
+def get_audit_writer():
+    return current_app.extensions.get("audit")
@@ -1,22 +1,49 @@
 from functools import wraps
-from flask import session, redirect, url_for, flash, request, g
+from flask import current_app, has_app_context, session, redirect, url_for, flash, request, g
 from werkzeug.security import generate_password_hash, check_password_hash
 from .db import get_db
+from .passwords import DEFAULT_METHOD
+
+def _hash_pool():
+    return current_app.extensions.get("passwords") if has_app_context() else None
 
 def hash_password(pw: str) -> str:
-    return generate_password_hash(pw)
+    """Hash with PASSWORD_HASH_METHOD; in the app, on the bounded pool (may raise HashPoolBusy)."""
+    pool = _hash_pool()
+    if pool is None:
+        return generate_password_hash(pw, DEFAULT_METHOD)
+    return pool.hash(pw)
 
 def verify_password(hash_: str, pw: str) -> bool:
-    return check_password_hash(hash_, pw)
+    pool = _hash_pool()
+    if pool is None:
+        return check_password_hash(hash_, pw)
+    return pool.verify(hash_, pw)
+
+def password_needs_rehash(hash_: str) -> bool:
+    pool = _hash_pool()
+    return pool is not None and pool.needs_rehash(hash_)
 
 def current_user():
     if "user_id" not in session:
         return None
     if getattr(g, "_current_user", None) is None:
         db = get_db()
-        g._current_user = db.execute("SELECT * FROM users WHERE id=?", (session["user_id"],)).fetchone()
+        cache = current_app.extensions.get("user_cache")
+        if cache is not None:
+            g._current_user = cache.load(db, session["user_id"])
+        else:
+            g._current_user = db.execute("SELECT * FROM users WHERE id=?", (session["user_id"],)).fetchone()
     return g._current_user
 
+def invalidate_user(user_id: int):
+    """Drop a changed user from this worker's cache (other workers follow user_changes)."""
+    cache = current_app.extensions.get("user_cache")
+    if cache is not None:
+        cache.invalidate(user_id)
+    if getattr(g, "_current_user", None) is not None and g._current_user["id"] == user_id:
+        g._current_user = None
+
 def login_required(view):
     @wraps(view)
     def wrapped(*args, **kwargs):
@@ -0,0 +1,305 @@
+"""Rendered-fragment cache for the public listing pages.
+
+Entries are keyed on endpoint + role + query string + a version stamp. The
+stamp lives in the main database (cache_versions) so that a write handled by
+one gunicorn worker invalidates the fragments cached by every other worker.
+Two backends: an in-process LRU (default) and a shared on-disk SQLite file.
+
+UserCache keeps the users rows behind current_user() per worker; a trigger
+logs changed user ids in user_changes, which each worker polls.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with a per-entry TTL."""
+
+    def __init__(self, max_entries: int = 512, ttl: float = 300.0):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """Cache shared by all worker processes through a side SQLite file."""
+
+    _PRUNE_EVERY = 200
+
+    def __init__(self, path: str, max_entries: int = 5000, ttl: float = 300.0):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL;")
+            conn.execute("PRAGMA synchronous = OFF;")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fragments (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_fragments_expires ON fragments(expires_at)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        try:
+            row = self._conn().execute(
+                "SELECT value FROM fragments WHERE key=? AND expires_at>?", (key, time.time())
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    def set(self, key, value):
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO fragments(key, value, expires_at) VALUES(?,?,?)",
+                (key, value, time.time() + self.ttl),
+            )
+            self._writes += 1
+            if self._writes % self._PRUNE_EVERY == 0:
+                self._prune(conn)
+        except sqlite3.Error:
+            # A busy cache file must never fail the request.
+            pass
+
+    def _prune(self, conn):
+        conn.execute("DELETE FROM fragments WHERE expires_at<=?", (time.time(),))
+        conn.execute(
+            "DELETE FROM fragments WHERE key IN ("
+            " SELECT key FROM fragments ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self):
+        try:
+            self._conn().execute("DELETE FROM fragments")
+        except sqlite3.Error:
+            pass
+
+    def __len__(self):
+        try:
+            return self._conn().execute("SELECT COUNT(1) FROM fragments").fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+
+class PageCache:
+    """Backend + versioning + hit/miss statistics."""
+
+    def __init__(self, backend, version_ttl: float = 1.0):
+        self.backend = backend
+        self.version_ttl = version_ttl
+        self._version = None
+        self._version_read_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.by_endpoint = {}
+
+    def version(self, db) -> int:
+        # Re-read the shared stamp at most every version_ttl seconds per worker.
+        now = time.monotonic()
+        if self._version is None or now - self._version_read_at > self.version_ttl:
+            row = db.execute("SELECT version FROM cache_versions WHERE scope='pages'").fetchone()
+            self._version = int(row["version"]) if row else 0
+            self._version_read_at = now
+        return self._version
+
+    def invalidate(self, db):
+        """Bump the shared version stamp; commits."""
+        db.execute(
+            "INSERT INTO cache_versions(scope, version) VALUES('pages', 1) "
+            "ON CONFLICT(scope) DO UPDATE SET version = version + 1"
+        )
+        db.commit()
+        row = db.execute("SELECT version FROM cache_versions WHERE scope='pages'").fetchone()
+        with self._lock:
+            self._version = int(row["version"])
+            self._version_read_at = time.monotonic()
+            self.invalidations += 1
+
+    def get(self, endpoint: str, key: str):
+        value = self.backend.get(key)
+        with self._lock:
+            stats = self.by_endpoint.setdefault(endpoint, {"hits": 0, "misses": 0})
+            if value is None:
+                self.misses += 1
+                stats["misses"] += 1
+            else:
+                self.hits += 1
+                stats["hits"] += 1
+        return value
+
+    def set(self, key: str, value: str):
+        self.backend.set(key, value)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+            "version": self._version,
+            "pid": os.getpid(),
+            "endpoints": dict(self.by_endpoint),
+        }
+
+
+def init_page_cache(app):
+    backend_name = (app.config.get("PAGE_CACHE_BACKEND") or "memory").lower()
+    ttl = float(app.config.get("PAGE_CACHE_TTL", 300))
+    max_entries = int(app.config.get("PAGE_CACHE_MAX_ENTRIES", 512))
+    if backend_name == "off":
+        backend = None
+    elif backend_name == "sqlite":
+        path = app.config.get("PAGE_CACHE_PATH") or os.path.join(
+            os.path.dirname(os.path.abspath(app.config["DB_PATH"])), "cache.db"
+        )
+        backend = SQLiteCache(path, max_entries=max_entries, ttl=ttl)
+    else:
+        backend = LRUCache(max_entries=max_entries, ttl=ttl)
+    cache = PageCache(backend, version_ttl=float(app.config.get("PAGE_CACHE_VERSION_TTL", 1.0))) if backend is not None else None
+    app.extensions["page_cache"] = cache
+    return cache
+
+
+def get_page_cache():
+    return current_app.extensions.get("page_cache")
+
+
+class UserCache:
+    """Per-worker cache of users rows for current_user(), keyed by id.
+
+    A trigger appends the id of every updated or deleted user to user_changes.
+    Each worker reads the new rows at most every version_ttl seconds and drops
+    just those users, so a block, role or points change made by another worker
+    is seen within that window while everyone else stays cached. The worker
+    that made the change drops the row at once (invalidate).
+    """
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 4096, version_ttl: float = 1.0):
+        self.rows = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.version_ttl = version_ttl
+        self._seq = None
+        self._polled_at = 0.0
+        # Bumped whenever rows are dropped, so a load that raced with a change does not store a stale row.
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+
+    def _poll(self, db):
+        now = time.monotonic()
+        if self._seq is not None and now - self._polled_at <= self.version_ttl:
+            return
+        with self._lock:
+            if self._seq is None:
+                self._seq = db.execute("SELECT COALESCE(MAX(seq), 0) FROM user_changes").fetchone()[0]
+                self.rows.clear()
+            else:
+                changes = db.execute(
+                    "SELECT seq, user_id FROM user_changes WHERE seq > ? ORDER BY seq", (self._seq,)
+                ).fetchall()
+                if changes:
+                    if changes[0]["seq"] != self._seq + 1:
+                        # Older rows were pruned before this worker saw them.
+                        self.rows.clear()
+                        self.flushes += 1
+                    else:
+                        for change in changes:
+                            self.rows.pop(change["user_id"])
+                    self._seq = changes[-1]["seq"]
+                    self._generation += 1
+            self._polled_at = now
+
+    def load(self, db, user_id: int):
+        self._poll(db)
+        row = self.rows.get(user_id)
+        if row is not None:
+            self.hits += 1
+            return row
+        self.misses += 1
+        generation = self._generation
+        row = db.execute("SELECT * FROM users WHERE id=?", (user_id,)).fetchone()
+        if row is not None and generation == self._generation:
+            self.rows.set(user_id, row)
+        return row
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self.rows.pop(user_id)
+            self._generation += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.rows),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "flushes": self.flushes,
+            "seq": self._seq,
+        }
+
+
+def init_user_cache(app):
+    ttl = float(app.config.get("USER_CACHE_TTL", 30))
+    cache = None
+    if ttl > 0:
+        cache = UserCache(
+            ttl=ttl,
+            max_entries=int(app.config.get("USER_CACHE_MAX_ENTRIES", 4096)),
+            version_ttl=float(app.config.get("USER_CACHE_VERSION_TTL", 1.0)),
+        )
+    app.extensions["user_cache"] = cache
+    return cache
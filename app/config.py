@@ -5,3 +5,89 @@ class Config:
     DB_PATH = os.getenv("DB_PATH", os.path.join(os.path.dirname(__file__), "..", "data", "app.db"))
     SEED_ON_FIRST_RUN = os.getenv("SEED_ON_FIRST_RUN", "1") == "1"
     BASE_URL = os.getenv("BASE_URL", "")
+    PAGE_SIZE = int(os.getenv("PAGE_SIZE", "50"))
+
+    # SQLite connection pool (one per worker process) and per-connection tuning
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+    DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+    DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL")
+    DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+    DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+    DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+    # Apply pending schema migrations at startup (under a file lock); 0: workers only check
+    # PRAGMA user_version and refuse to start until `python -m app migrate` has run
+    DB_MIGRATE_ON_START = os.getenv("DB_MIGRATE_ON_START", "1") == "1"
+
+    # Password hashing: werkzeug method string (cost; older hashes are redone on login), hashing
+    # threads per worker, hashes allowed in flight per worker before login/registration answer 503
+    # (keep the queue below gunicorn's threads per worker, GUNICORN_THREADS, or it never fills)
+    PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "4"))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+
+    # Rendered-fragment cache for public listings: memory (per worker), sqlite (shared file) or off
+    PAGE_CACHE_BACKEND = os.getenv("PAGE_CACHE_BACKEND", "memory")
+    PAGE_CACHE_PATH = os.getenv("PAGE_CACHE_PATH", "")
+    PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "300"))
+    PAGE_CACHE_MAX_ENTRIES = int(os.getenv("PAGE_CACHE_MAX_ENTRIES", "512"))
+    PAGE_CACHE_VERSION_TTL = float(os.getenv("PAGE_CACHE_VERSION_TTL", "1.0"))
+
+    # Per-worker cache of the logged-in user's row (0 disables); changes made in another
+    # worker are picked up within USER_CACHE_VERSION_TTL seconds
+    USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+    USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "4096"))
+    USER_CACHE_VERSION_TTL = float(os.getenv("USER_CACHE_VERSION_TTL", "1.0"))
+
+    # Audit trail: buffered writer flushing to audit.log (rotated) and the audit_events table
+    AUDIT_LOG_PATH = os.getenv("AUDIT_LOG_PATH", "")
+    AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+    AUDIT_BUFFER_SIZE = int(os.getenv("AUDIT_BUFFER_SIZE", "100"))
+    AUDIT_FSYNC = os.getenv("AUDIT_FSYNC", "interval")  # always | interval | never
+    AUDIT_FSYNC_INTERVAL = float(os.getenv("AUDIT_FSYNC_INTERVAL", "5"))
+    AUDIT_MAX_BYTES = int(os.getenv("AUDIT_MAX_BYTES", str(10 * 1024 * 1024)))
+    AUDIT_ROTATE_SECONDS = int(os.getenv("AUDIT_ROTATE_SECONDS", "86400"))
+    AUDIT_BACKUP_COUNT = int(os.getenv("AUDIT_BACKUP_COUNT", "14"))
+
+    # Report media delivery after authorization: direct (worker, sendfile + Range), x-accel (nginx) or x-sendfile
+    MEDIA_SERVE_MODE = os.getenv("MEDIA_SERVE_MODE", "direct")
+    MEDIA_ACCEL_PREFIX = os.getenv("MEDIA_ACCEL_PREFIX", "/protected-uploads/")
+
+    # Report image previews (requires Pillow): longest side in px and generator threads per worker
+    THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "320"))
+    THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+
+    # Background job queue (`python -m app worker`): idle poll interval, retry backoff, history kept
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+    JOB_BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", "5"))
+    JOB_BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX", "600"))
+    JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(7 * 86400)))
+    JOB_SHUTDOWN_GRACE = float(os.getenv("JOB_SHUTDOWN_GRACE", "30"))
+
+    # Volunteer notifications: sink (file | smtp | off | module:factory), batch size and messages per second
+    NOTIFY_SINK = os.getenv("NOTIFY_SINK", "file")
+    NOTIFY_FILE_PATH = os.getenv("NOTIFY_FILE_PATH", "")
+    NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "100"))
+    NOTIFY_RATE = float(os.getenv("NOTIFY_RATE", "20"))
+    NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+    NOTIFY_DISPATCH_SECONDS = float(os.getenv("NOTIFY_DISPATCH_SECONDS", "30"))
+    NOTIFY_SMTP_HOST = os.getenv("NOTIFY_SMTP_HOST", "localhost")
+    NOTIFY_SMTP_PORT = int(os.getenv("NOTIFY_SMTP_PORT", "25"))
+    NOTIFY_SMTP_FROM = os.getenv("NOTIFY_SMTP_FROM", "greenlink@localhost")
+    NOTIFY_SMTP_RECIPIENT = os.getenv("NOTIFY_SMTP_RECIPIENT", "{username}@localhost")
+
+    # SQL instrumentation: Server-Timing header, slow-query log with query plans (rotated) and /admin/perf totals
+    PERF_ENABLED = os.getenv("PERF_ENABLED", "1") == "1"
+    PERF_SLOW_QUERY_MS = float(os.getenv("PERF_SLOW_QUERY_MS", "100"))
+    PERF_SLOW_LOG_PATH = os.getenv("PERF_SLOW_LOG_PATH", "")
+    PERF_SLOW_LOG_MAX_BYTES = int(os.getenv("PERF_SLOW_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+    PERF_SLOW_LOG_BACKUP_COUNT = int(os.getenv("PERF_SLOW_LOG_BACKUP_COUNT", "5"))
+    PERF_STATS_PATH = os.getenv("PERF_STATS_PATH", "")
+    PERF_FLUSH_INTERVAL = float(os.getenv("PERF_FLUSH_INTERVAL", "5"))
+
+    # Prometheus /metrics (needs prometheus_client): scrapers send "Authorization: Bearer <METRICS_TOKEN>";
+    # without a token only direct requests from loopback are answered, everyone else gets 404
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
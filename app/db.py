@@ -1,24 +1,468 @@
 import os
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from flask import current_app, g
 
 SCHEMA_SQL = "\nPRAGMA foreign_keys = ON;\n\nCREATE TABLE IF NOT EXISTS universities (\n  id INTEGER PRIMARY KEY AUTOINCREMENT,\n  name TEXT NOT NULL UNIQUE\n);\n\nCREATE TABLE IF NOT EXISTS users (\n  id INTEGER PRIMARY KEY AUTOINCREMENT,\n  username TEXT NOT NULL UNIQUE,\n  password_hash TEXT NOT NULL,\n  role TEXT NOT NULL CHECK(role IN ('admin','organizer','volunteer')),\n  created_at TEXT NOT NULL,\n  is_blocked INTEGER NOT NULL DEFAULT 0,\n  warnings_count INTEGER NOT NULL DEFAULT 0,\n  last_warning_at TEXT,\n  full_name TEXT,\n  group_name TEXT,\n  faculty TEXT,\n  age INTEGER,\n  university_id INTEGER,\n  points INTEGER NOT NULL DEFAULT 0,\n  FOREIGN KEY (university_id) REFERENCES universities(id)\n);\n\nCREATE TABLE IF NOT EXISTS subscribers (\n  user_id INTEGER PRIMARY KEY,\n  is_subscribed INTEGER NOT NULL DEFAULT 1,\n  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE\n);\n\nCREATE TABLE IF NOT EXISTS events (\n  id INTEGER PRIMARY KEY AUTOINCREMENT,\n  name TEXT NOT NULL,\n  description TEXT,\n  link TEXT,\n  points INTEGER NOT NULL DEFAULT 0,\n  start_time TEXT,\n  end_time TEXT,\n  max_participants INTEGER NOT NULL DEFAULT 0,\n  created_by INTEGER,\n  created_at TEXT NOT NULL,\n  FOREIGN KEY (created_by) REFERENCES users(id)\n);\n\nCREATE TABLE IF NOT EXISTS event_applications (\n  id INTEGER PRIMARY KEY AUTOINCREMENT,\n  event_id INTEGER NOT NULL,\n  user_id INTEGER NOT NULL,\n  needs_release INTEGER NOT NULL DEFAULT 0,\n  needs_volunteer_hours INTEGER NOT NULL DEFAULT 0,\n  status TEXT NOT NULL DEFAULT 'на рассмотрении',\n  created_at TEXT NOT NULL,\n  UNIQUE(event_id, user_id),\n  FOREIGN KEY (event_id) REFERENCES events(id) ON DELETE CASCADE,\n  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE\n);\n\nCREATE TABLE IF NOT EXISTS event_reports (\n  id INTEGER PRIMARY KEY AUTOINCREMENT,\n  event_id INTEGER NOT NULL,\n  user_id INTEGER NOT NULL,\n  report_text TEXT,\n  media_path TEXT,\n  status TEXT NOT NULL DEFAULT 'на рассмотрении',\n  created_at TEXT NOT NULL,\n  UNIQUE(event_id, user_id),\n  FOREIGN KEY (event_id) REFERENCES events(id) ON DELETE CASCADE,\n  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE\n);\n\nCREATE TABLE IF NOT EXISTS tasks (\n  id INTEGER PRIMARY KEY AUTOINCREMENT,\n  name TEXT NOT NULL,\n  description TEXT,\n  points INTEGER NOT NULL DEFAULT 0,\n  start_time TEXT,\n  end_time TEXT,\n  max_participants INTEGER NOT NULL DEFAULT 0,\n  created_by INTEGER,\n  created_at TEXT NOT NULL,\n  FOREIGN KEY (created_by) REFERENCES users(id)\n);\n\nCREATE TABLE IF NOT EXISTS task_applications (\n  id INTEGER PRIMARY KEY AUTOINCREMENT,\n  task_id INTEGER NOT NULL,\n  user_id INTEGER NOT NULL,\n  status TEXT NOT NULL DEFAULT 'на рассмотрении',\n  created_at TEXT NOT NULL,\n  UNIQUE(task_id, user_id),\n  FOREIGN KEY (task_id) REFERENCES tasks(id) ON DELETE CASCADE,\n  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE\n);\n\nCREATE TABLE IF NOT EXISTS task_reports (\n  id INTEGER PRIMARY KEY AUTOINCREMENT,\n  task_id INTEGER NOT NULL,\n  user_id INTEGER NOT NULL,\n  report_text TEXT,\n  media_path TEXT,\n  status TEXT NOT NULL DEFAULT 'на рассмотрении',\n  created_at TEXT NOT NULL,\n  UNIQUE(task_id, user_id),\n  FOREIGN KEY (task_id) REFERENCES tasks(id) ON DELETE CASCADE,\n  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE\n);\n"
 
+class PoolTimeout(RuntimeError):
+    """Raised when no pooled connection became free within DB_POOL_TIMEOUT."""
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of pre-configured SQLite connections.
+
+    One pool lives per worker process: if the pool notices it was inherited
+    across a fork it drops the parent's connections and starts over.
+    """
+
+    def __init__(self, db_path: str, size: int = 8, timeout: float = 10.0, pragmas=None, factory=None):
+        self.db_path = db_path
+        self.factory = factory or sqlite3.Connection
+        self.size = max(1, int(size))
+        self.timeout = timeout
+        self.pragmas = list(pragmas or [])
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle = []
+        self._pid = os.getpid()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        for pragma in self.pragmas:
+            conn.execute(f"PRAGMA {pragma};")
+        return conn
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # Connections must never be shared between processes; forget them.
+            with self._lock:
+                self._idle = []
+                self._slots = threading.BoundedSemaphore(self.size)
+                self._pid = os.getpid()
+
+    @staticmethod
+    def _healthy(conn) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        self._check_fork()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"no free DB connection after {self.timeout}s")
+        try:
+            while True:
+                with self._lock:
+                    conn = self._idle.pop() if self._idle else None
+                if conn is None:
+                    return self._connect()
+                if self._healthy(conn):
+                    return conn
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, broken: bool = False):
+        if self._pid != os.getpid():
+            return
+        try:
+            if not broken and conn.in_transaction:
+                # Uncommitted request work is dropped, exactly as close() used to do.
+                conn.rollback()
+        except sqlite3.Error:
+            broken = True
+        if broken:
+            self._discard(conn)
+        else:
+            with self._lock:
+                self._idle.append(conn)
+        self._slots.release()
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn)
+
+
+def _pool_pragmas(cfg) -> list:
+    return [
+        "foreign_keys = ON",
+        f"busy_timeout = {int(cfg.get('DB_BUSY_TIMEOUT_MS', 5000))}",
+        f"journal_mode = {cfg.get('DB_JOURNAL_MODE', 'WAL')}",
+        f"synchronous = {cfg.get('DB_SYNCHRONOUS', 'NORMAL')}",
+        f"cache_size = {-abs(int(cfg.get('DB_CACHE_SIZE_KB', 16384)))}",
+        f"mmap_size = {int(cfg.get('DB_MMAP_SIZE', 0))}",
+        "temp_store = MEMORY",
+    ]
+
+
+def get_pool(app=None) -> ConnectionPool:
+    app = app or current_app
+    pool = app.extensions.get("db_pool")
+    if pool is None:
+        from .perf import InstrumentedConnection
+        pool = ConnectionPool(
+            app.config["DB_PATH"],
+            size=app.config.get("DB_POOL_SIZE", 8),
+            timeout=app.config.get("DB_POOL_TIMEOUT", 10.0),
+            pragmas=_pool_pragmas(app.config),
+            factory=InstrumentedConnection if app.config.get("PERF_ENABLED", True) else None,
+        )
+        app.extensions["db_pool"] = pool
+    return pool
+
+
+# Secondary indexes. Kept apart from SCHEMA_SQL so they are (re)applied after the
+# column migrations below on databases created by older versions.
+INDEX_SQL = """
+-- listings and their keyset cursors: ORDER BY COALESCE(start_time,'') DESC, id DESC
+-- (same order as "start_time IS NULL, start_time DESC": undated items last)
+DROP INDEX IF EXISTS idx_events_start;
+DROP INDEX IF EXISTS idx_tasks_start;
+CREATE INDEX IF NOT EXISTS idx_events_sort ON events(COALESCE(start_time,'') DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_tasks_sort ON tasks(COALESCE(start_time,'') DESC, id DESC);
+
+-- organizer ownership filters
+CREATE INDEX IF NOT EXISTS idx_events_created_by ON events(created_by);
+CREATE INDEX IF NOT EXISTS idx_tasks_created_by ON tasks(created_by);
+
+-- applications: status tabs (rowid order gives ORDER BY id for free),
+-- covering per-item counters, per-user lists in the profile
+CREATE INDEX IF NOT EXISTS idx_event_apps_status ON event_applications(status);
+CREATE INDEX IF NOT EXISTS idx_event_apps_event_status ON event_applications(event_id, status);
+CREATE INDEX IF NOT EXISTS idx_event_apps_user ON event_applications(user_id);
+CREATE INDEX IF NOT EXISTS idx_task_apps_status ON task_applications(status);
+CREATE INDEX IF NOT EXISTS idx_task_apps_task_status ON task_applications(task_id, status);
+CREATE INDEX IF NOT EXISTS idx_task_apps_user ON task_applications(user_id);
+
+-- reports: status tabs, per-item tab counters, per-user lists, and partial
+-- indexes over the (small) set of reports still waiting for moderation
+CREATE INDEX IF NOT EXISTS idx_event_reports_status ON event_reports(status);
+CREATE INDEX IF NOT EXISTS idx_event_reports_event_status ON event_reports(event_id, status);
+CREATE INDEX IF NOT EXISTS idx_event_reports_user ON event_reports(user_id);
+CREATE INDEX IF NOT EXISTS idx_event_reports_open ON event_reports(event_id) WHERE status NOT IN ('принят','отклонен','отклонён');
+CREATE INDEX IF NOT EXISTS idx_event_reports_open_id ON event_reports(id) WHERE status NOT IN ('принят','отклонен','отклонён');
+CREATE INDEX IF NOT EXISTS idx_task_reports_status ON task_reports(status);
+CREATE INDEX IF NOT EXISTS idx_task_reports_task_status ON task_reports(task_id, status);
+CREATE INDEX IF NOT EXISTS idx_task_reports_user ON task_reports(user_id);
+CREATE INDEX IF NOT EXISTS idx_task_reports_open ON task_reports(task_id) WHERE status NOT IN ('принят','отклонен','отклонён');
+CREATE INDEX IF NOT EXISTS idx_task_reports_open_id ON task_reports(id) WHERE status NOT IN ('принят','отклонен','отклонён');
+"""
+
+# Denormalized per-item application counters (events/tasks.active_count and
+# .approved_count), kept exact by triggers on the application tables.
+# "active" = pending or approved, i.e. everything that occupies a seat.
+_COUNTER_TRIGGERS_TEMPLATE = """
+CREATE TRIGGER IF NOT EXISTS trg_{apps}_counters_ins AFTER INSERT ON {apps}
+BEGIN
+  UPDATE {items} SET
+    active_count = active_count + (NEW.status IN ('на рассмотрении','подтверждена')),
+    approved_count = approved_count + (NEW.status = 'подтверждена')
+  WHERE id = NEW.{fk};
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_{apps}_counters_del AFTER DELETE ON {apps}
+BEGIN
+  UPDATE {items} SET
+    active_count = active_count - (OLD.status IN ('на рассмотрении','подтверждена')),
+    approved_count = approved_count - (OLD.status = 'подтверждена')
+  WHERE id = OLD.{fk};
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_{apps}_counters_upd AFTER UPDATE OF status, {fk} ON {apps}
+BEGIN
+  UPDATE {items} SET
+    active_count = active_count - (OLD.status IN ('на рассмотрении','подтверждена')),
+    approved_count = approved_count - (OLD.status = 'подтверждена')
+  WHERE id = OLD.{fk};
+  UPDATE {items} SET
+    active_count = active_count + (NEW.status IN ('на рассмотрении','подтверждена')),
+    approved_count = approved_count + (NEW.status = 'подтверждена')
+  WHERE id = NEW.{fk};
+END;
+"""
+
+COUNTER_TRIGGERS_SQL = (
+    _COUNTER_TRIGGERS_TEMPLATE.format(items="events", apps="event_applications", fk="event_id")
+    + _COUNTER_TRIGGERS_TEMPLATE.format(items="tasks", apps="task_applications", fk="task_id")
+)
+
+_COUNTER_TABLES = (("events", "event_applications", "event_id"), ("tasks", "task_applications", "task_id"))
+
+# Version stamps for cached rendered pages (see cache.py); bumped by write paths.
+CACHE_SQL = """
+CREATE TABLE IF NOT EXISTS cache_versions (scope TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0);
+"""
+
+# Per-row (events/tasks.row_version) and per-table (cache_versions scope = table
+# name) change counters for conditional GET. Counter updates from the
+# application triggers above are UPDATEs too, so seat counts bump them as well.
+_VERSION_TRIGGERS_TEMPLATE = """
+INSERT OR IGNORE INTO cache_versions(scope, version) VALUES ('{items}', 0);
+
+CREATE TRIGGER IF NOT EXISTS trg_{items}_version_ins AFTER INSERT ON {items}
+BEGIN
+  UPDATE cache_versions SET version = version + 1 WHERE scope = '{items}';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_{items}_version_del AFTER DELETE ON {items}
+BEGIN
+  UPDATE cache_versions SET version = version + 1 WHERE scope = '{items}';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_{items}_version_upd AFTER UPDATE ON {items}
+BEGIN
+  UPDATE {items} SET row_version = OLD.row_version + 1 WHERE id = NEW.id AND NEW.row_version = OLD.row_version;
+  UPDATE cache_versions SET version = version + 1 WHERE scope = '{items}';
+END;
+"""
+
+VERSION_TRIGGERS_SQL = _VERSION_TRIGGERS_TEMPLATE.format(items="events") + _VERSION_TRIGGERS_TEMPLATE.format(items="tasks")
+
+# Change log for the per-worker user cache (cache.UserCache): one row per
+# changed user, so each worker drops only the users that changed. password_hash
+# is left out so that rehashing on login does not touch the caches. The
+# trigger keeps the newest USER_CHANGES_KEEP rows; a worker that fell further
+# behind sees a gap in seq and flushes its whole cache.
+USER_CHANGES_KEEP = 10000
+USER_CHANGES_SQL = f"""
+CREATE TABLE IF NOT EXISTS user_changes (
+  seq INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_users_changed_upd AFTER UPDATE OF
+  username, role, is_blocked, warnings_count, last_warning_at, full_name, group_name, faculty, age,
+  university_id, points, education_text, bio_text
+ON users
+BEGIN
+  INSERT INTO user_changes(user_id) VALUES (NEW.id);
+  DELETE FROM user_changes WHERE seq <= last_insert_rowid() - {USER_CHANGES_KEEP};
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_users_changed_del AFTER DELETE ON users
+BEGIN
+  INSERT INTO user_changes(user_id) VALUES (OLD.id);
+  DELETE FROM user_changes WHERE seq <= last_insert_rowid() - {USER_CHANGES_KEEP};
+END;
+"""
+
+# Deduplicated report media (see storage.py). refcount = number of report rows
+# pointing at the attachment, kept by triggers like the application counters.
+ATTACHMENT_SQL = """
+CREATE TABLE IF NOT EXISTS attachments (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  sha256 TEXT NOT NULL UNIQUE,
+  size INTEGER NOT NULL,
+  mime TEXT NOT NULL,
+  original_name TEXT,
+  refcount INTEGER NOT NULL DEFAULT 0,
+  created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_attachments_orphans ON attachments(id) WHERE refcount <= 0;
+"""
+
+_ATTACHMENT_TRIGGERS_TEMPLATE = """
+CREATE INDEX IF NOT EXISTS idx_{reports}_attachment ON {reports}(attachment_id) WHERE attachment_id IS NOT NULL;
+
+CREATE TRIGGER IF NOT EXISTS trg_{reports}_attachment_ins AFTER INSERT ON {reports}
+WHEN NEW.attachment_id IS NOT NULL
+BEGIN
+  UPDATE attachments SET refcount = refcount + 1 WHERE id = NEW.attachment_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_{reports}_attachment_del AFTER DELETE ON {reports}
+WHEN OLD.attachment_id IS NOT NULL
+BEGIN
+  UPDATE attachments SET refcount = refcount - 1 WHERE id = OLD.attachment_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_{reports}_attachment_upd AFTER UPDATE OF attachment_id ON {reports}
+WHEN OLD.attachment_id IS NOT NEW.attachment_id
+BEGIN
+  UPDATE attachments SET refcount = refcount - 1 WHERE id = OLD.attachment_id;
+  UPDATE attachments SET refcount = refcount + 1 WHERE id = NEW.attachment_id;
+END;
+"""
+
+ATTACHMENT_TRIGGERS_SQL = (
+    _ATTACHMENT_TRIGGERS_TEMPLATE.format(reports="event_reports")
+    + _ATTACHMENT_TRIGGERS_TEMPLATE.format(reports="task_reports")
+)
+
+# Basename of a legacy media_path ("/srv/data/uploads/a.png", "C:\\x\\a.png" or
+# "a.png" -> "a.png") as an indexable expression, so uploads() can look a file
+# up by name with an index seek instead of LIKE '%/name'.
+def media_name_sql(col: str = "media_path") -> str:
+    norm = f"replace({col}, '\\', '/')"
+    return f"substr({norm}, length(rtrim({norm}, replace({norm}, '/', ''))) + 1)"
+
+
+MEDIA_NAME_INDEX_SQL = "".join(
+    f"CREATE INDEX IF NOT EXISTS idx_{t}_media_name ON {t}({media_name_sql()});\n"
+    for t in ("event_reports", "task_reports")
+)
+
+# Queryable copy of the audit trail (written in batches by audit.AuditWriter).
+AUDIT_SQL = """
+CREATE TABLE IF NOT EXISTS audit_events (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  created_at TEXT NOT NULL,
+  actor_id INTEGER,
+  actor TEXT NOT NULL,
+  role TEXT,
+  action TEXT NOT NULL,
+  target TEXT,
+  extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_audit_events_actor ON audit_events(actor, id);
+CREATE INDEX IF NOT EXISTS idx_audit_events_action ON audit_events(action, id);
+CREATE INDEX IF NOT EXISTS idx_audit_events_created ON audit_events(created_at);
+"""
+
+# Durable background jobs (see jobs.py). run_at is a unix timestamp: for a
+# queued job the earliest time it may start, for a running job the end of its
+# visibility timeout, after which another worker may claim it again.
+JOBS_SQL = """
+CREATE TABLE IF NOT EXISTS jobs (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  name TEXT NOT NULL,
+  payload TEXT NOT NULL DEFAULT '{}',
+  status TEXT NOT NULL DEFAULT 'queued' CHECK(status IN ('queued','running','done','failed')),
+  attempts INTEGER NOT NULL DEFAULT 0,
+  max_attempts INTEGER NOT NULL DEFAULT 5,
+  run_at REAL NOT NULL,
+  locked_by TEXT,
+  last_error TEXT,
+  result TEXT,
+  created_by INTEGER,
+  created_at TEXT NOT NULL,
+  finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs(run_at) WHERE status IN ('queued','running');
+CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs(finished_at) WHERE status IN ('done','failed');
+"""
+
+# jobs.enqueue_once(): is a job of this name already waiting?
+JOBS_QUEUED_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_jobs_queued_name ON jobs(name) WHERE status='queued';
+"""
+
+# Deleting a university: the dependent-user count, the UPDATE that clears
+# university_id and the foreign-key check on DELETE FROM universities.
+USERS_UNIVERSITY_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_users_university ON users(university_id);
+"""
+
+# Report CSV export: ORDER BY created_at DESC (and the from/to filter) read
+# in index order, so the UNION ALL of both tables is merged, not sorted.
+REPORTS_CREATED_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_event_reports_created ON event_reports(created_at);
+CREATE INDEX IF NOT EXISTS idx_task_reports_created ON task_reports(created_at);
+"""
+
+# Outbox of volunteer notifications (see notify.py). One row per recipient;
+# UNIQUE(user_id, kind, ref) makes a retried fan-out a no-op.
+NOTIFY_SQL = """
+CREATE TABLE IF NOT EXISTS notifications (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL,
+  kind TEXT NOT NULL,
+  ref TEXT NOT NULL,
+  subject TEXT NOT NULL,
+  body TEXT NOT NULL,
+  status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending','sending','sent','failed')),
+  attempts INTEGER NOT NULL DEFAULT 0,
+  locked_until REAL,
+  last_error TEXT,
+  created_at TEXT NOT NULL,
+  sent_at TEXT,
+  UNIQUE(user_id, kind, ref),
+  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_notifications_due ON notifications(id) WHERE status IN ('pending','sending');
+"""
+
+# Full-text search. Contentless FTS5 tables (rowid = source id) kept in sync by
+# triggers. unicode61 folds case for Cyrillic too; "ё" is folded to "е" on both
+# the indexed text and the query (see search.fts_query), which unicode61 does not do.
+FTS_SOURCES = (
+    ("events_fts", "events", ("name", "description")),
+    ("tasks_fts", "tasks", ("name", "description")),
+    ("users_fts", "users", ("username", "full_name", "faculty")),
+    ("event_reports_fts", "event_reports", ("report_text",)),
+    ("task_reports_fts", "task_reports", ("report_text",)),
+)
+
+def _fts_norm(expr: str) -> str:
+    return f"replace(replace(COALESCE({expr},''),'ё','е'),'Ё','Е')"
+
+def _fts_sql(fts: str, table: str, cols) -> str:
+    col_list = ", ".join(cols)
+    new_vals = ", ".join(_fts_norm(f"NEW.{c}") for c in cols)
+    old_vals = ", ".join(_fts_norm(f"OLD.{c}") for c in cols)
+    return f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+  {col_list}, content='', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_{fts}_ins AFTER INSERT ON {table}
+BEGIN
+  INSERT INTO {fts}(rowid, {col_list}) VALUES (NEW.id, {new_vals});
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_{fts}_del AFTER DELETE ON {table}
+BEGIN
+  INSERT INTO {fts}({fts}, rowid, {col_list}) VALUES ('delete', OLD.id, {old_vals});
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_{fts}_upd AFTER UPDATE OF {col_list} ON {table}
+BEGIN
+  INSERT INTO {fts}({fts}, rowid, {col_list}) VALUES ('delete', OLD.id, {old_vals});
+  INSERT INTO {fts}(rowid, {col_list}) VALUES (NEW.id, {new_vals});
+END;
+"""
+
 def get_db():
     if "db" not in g:
-        db_path = current_app.config["DB_PATH"]
-        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
-        g.db = sqlite3.connect(db_path)
-        g.db.row_factory = sqlite3.Row
-        # foreign keys
-        g.db.execute("PRAGMA foreign_keys = ON;")
+        g.db = get_pool().acquire()
     return g.db
 
 def close_db(error=None):
     db = g.pop("db", None)
     if db is not None:
-        db.close()
+        get_pool().release(db, broken=isinstance(error, sqlite3.DatabaseError))
+
+
+@contextmanager
+def immediate_transaction(db):
+    """Run a block under BEGIN IMMEDIATE: the write lock is taken before the
+    first read, so check-then-write sequences cannot interleave across workers.
+    Commits on success, rolls back on error."""
+    if not db.in_transaction:
+        db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    db.commit()
 
 
 def ensure_user_columns(db):
@@ -33,29 +477,208 @@ def ensure_user_columns(db):
 
 
 def ensure_report_columns(db):
-    """Lightweight schema migration for report award tracking."""
+    """Lightweight schema migration for report award tracking and attachments."""
     for table in ("event_reports", "task_reports"):
         cols = {row["name"] for row in db.execute(f"PRAGMA table_info({table})").fetchall()}
         if "points_awarded" not in cols:
             db.execute(f"ALTER TABLE {table} ADD COLUMN points_awarded INTEGER DEFAULT 0")
+        if "attachment_id" not in cols:
+            db.execute(f"ALTER TABLE {table} ADD COLUMN attachment_id INTEGER REFERENCES attachments(id)")
+
+
+def ensure_counter_columns(db):
+    """Lightweight schema migration for denormalized application counters.
+
+    Returns True if the columns were just added (and therefore need a backfill).
+    """
+    added = False
+    for items, _, _ in _COUNTER_TABLES:
+        cols = {row["name"] for row in db.execute(f"PRAGMA table_info({items})").fetchall()}
+        for col in ("active_count", "approved_count"):
+            if col not in cols:
+                db.execute(f"ALTER TABLE {items} ADD COLUMN {col} INTEGER NOT NULL DEFAULT 0")
+                added = True
+    return added
+
+
+def ensure_version_columns(db):
+    """Lightweight schema migration for events/tasks.row_version."""
+    for items, _, _ in _COUNTER_TABLES:
+        cols = {row["name"] for row in db.execute(f"PRAGMA table_info({items})").fetchall()}
+        if "row_version" not in cols:
+            db.execute(f"ALTER TABLE {items} ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0")
+
+
+def recount_application_counters(db) -> int:
+    """Recompute active_count/approved_count from the application tables.
+
+    Repairs drift (e.g. rows edited with triggers disabled). Returns the number
+    of items whose counters were wrong. Does not commit.
+    """
+    fixed = 0
+    for items, apps, fk in _COUNTER_TABLES:
+        cur = db.execute(
+            f"""
+            UPDATE {items} SET
+              active_count = (SELECT COUNT(1) FROM {apps} a WHERE a.{fk}={items}.id AND a.status IN ('на рассмотрении','подтверждена')),
+              approved_count = (SELECT COUNT(1) FROM {apps} a WHERE a.{fk}={items}.id AND a.status = 'подтверждена')
+            WHERE active_count IS NOT (SELECT COUNT(1) FROM {apps} a WHERE a.{fk}={items}.id AND a.status IN ('на рассмотрении','подтверждена'))
+               OR approved_count IS NOT (SELECT COUNT(1) FROM {apps} a WHERE a.{fk}={items}.id AND a.status = 'подтверждена')
+            """
+        )
+        fixed += cur.rowcount
+    return fixed
+
+
+def ensure_search_index(db):
+    """Create the FTS5 tables/triggers; backfill any table that did not exist yet."""
+    existing = {
+        row["name"] for row in db.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
+    }
+    for fts, table, cols in FTS_SOURCES:
+        db.executescript(_fts_sql(fts, table, cols))
+        if fts not in existing:
+            rebuild_search_index(db, only=fts)
 
 
-def init_db():
-    db = get_db()
+def rebuild_search_index(db, only=None):
+    """Re-index the FTS tables from their source tables. Does not commit."""
+    for fts, table, cols in FTS_SOURCES:
+        if only and fts != only:
+            continue
+        db.execute(f"INSERT INTO {fts}({fts}) VALUES ('delete-all')")
+        db.execute(
+            f"INSERT INTO {fts}(rowid, {', '.join(cols)}) "
+            f"SELECT id, {', '.join(_fts_norm(c) for c in cols)} FROM {table}"
+        )
+
+
+def _migrate_baseline(db):
+    """Version 1: the schema built on every start before migrations were versioned.
+
+    Each step is idempotent (IF NOT EXISTS, column checks), so this also brings
+    databases created by any older release up to date.
+    """
     db.executescript(SCHEMA_SQL)
     ensure_user_columns(db)
     ensure_report_columns(db)
-    db.commit()
+    counters_added = ensure_counter_columns(db)
+    db.executescript(INDEX_SQL)
+    db.executescript(COUNTER_TRIGGERS_SQL)
+    db.executescript(CACHE_SQL)
+    ensure_version_columns(db)
+    db.executescript(VERSION_TRIGGERS_SQL)
+    db.executescript(AUDIT_SQL)
+    db.executescript(ATTACHMENT_SQL)
+    db.executescript(ATTACHMENT_TRIGGERS_SQL)
+    db.executescript(MEDIA_NAME_INDEX_SQL)
+    db.executescript(JOBS_SQL)
+    notifications_added = not db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='notifications'"
+    ).fetchone()
+    db.executescript(NOTIFY_SQL)
+    if notifications_added:
+        # Volunteers who registered before subscriptions were used start subscribed.
+        db.execute(
+            "INSERT OR IGNORE INTO subscribers(user_id, is_subscribed) SELECT id, 1 FROM users WHERE role='volunteer'"
+        )
+    ensure_search_index(db)
+    if counters_added:
+        recount_application_counters(db)
+
+
+def _migrate_user_changes(db):
+    """Version 2: per-user change log for the user cache."""
+    db.executescript(USER_CHANGES_SQL)
+
+
+def _migrate_jobs_queued_index(db):
+    """Version 3: partial index for jobs.enqueue_once()."""
+    db.executescript(JOBS_QUEUED_INDEX_SQL)
+
+
+def _migrate_users_university_index(db):
+    """Version 4: index on users.university_id."""
+    db.executescript(USERS_UNIVERSITY_INDEX_SQL)
+
+
+def _migrate_reports_created_index(db):
+    """Version 5: created_at indexes for the report export."""
+    db.executescript(REPORTS_CREATED_INDEX_SQL)
+
+
+# Schema migrations, applied once each and in order; PRAGMA user_version holds
+# how many have run. Append new steps, never edit or reorder released ones.
+# executescript() commits, so a step is not atomic: keep steps idempotent.
+MIGRATIONS = (
+    _migrate_baseline,
+    _migrate_user_changes,
+    _migrate_jobs_queued_index,
+    _migrate_users_university_index,
+    _migrate_reports_created_index,
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(db) -> int:
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+
+@contextmanager
+def _migration_lock(db_path: str):
+    """Exclusive lock file next to the database: one process migrates, the others wait."""
+    try:
+        import fcntl
+    except ImportError:  # Windows: no concurrent workers to coordinate
+        yield
+        return
+    with open(os.path.abspath(db_path) + ".migrate.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def migrate(db, db_path: str):
+    """Apply pending migrations. Returns (version before, version after).
+
+    The version is re-read under the lock, so processes that waited for the
+    leader find nothing left to do.
+    """
+    with _migration_lock(db_path):
+        before = version = schema_version(db)
+        for step in MIGRATIONS[version:]:
+            step(db)
+            version += 1
+            db.execute(f"PRAGMA user_version = {version}")
+            db.commit()
+    return before, version
+
 
 def init_db_if_needed(app):
-    # Create DB and optionally seed if missing
+    """Check the schema version at startup (one PRAGMA read when up to date).
+
+    Pending migrations run here only with DB_MIGRATE_ON_START; otherwise
+    `python -m app migrate` must be run before the workers start.
+    """
     with app.app_context():
-        db_path = app.config["DB_PATH"]
-        first_run = not os.path.exists(db_path)
-        init_db()
-        if first_run and app.config.get("SEED_ON_FIRST_RUN", True):
-            from .seed import seed_data
-            seed_data()
+        db = get_db()
+        version = schema_version(db)
+        if version >= SCHEMA_VERSION:
+            return
+        if not app.config.get("DB_MIGRATE_ON_START", True):
+            raise RuntimeError(
+                f"Database schema is at version {version}, this code needs {SCHEMA_VERSION}: run `python -m app migrate`."
+            )
+        # An empty database is seeded; decided under the lock by whoever migrates from scratch.
+        fresh = not db.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='users'").fetchone()
+        before, after = migrate(db, app.config["DB_PATH"])
+        if before < after:
+            app.logger.info("Database schema migrated from version %d to %d", before, after)
+            if fresh and before == 0 and app.config.get("SEED_ON_FIRST_RUN", True):
+                from .seed import seed_data
+                seed_data()
 
 def now_iso():
     return datetime.utcnow().isoformat(timespec="seconds") + "Z"
@@ -0,0 +1,295 @@
+"""Durable background jobs in the `jobs` table.
+
+Routes call enqueue() inside their own transaction, so a job exists only if the
+request's writes commit. `python -m app worker` runs a small pool of worker
+processes that claim due jobs, run the registered handler inside an app
+context, and record the outcome:
+
+* success          -> status 'done', result (JSON) stored;
+* exception        -> retried with exponential backoff and jitter until
+                      max_attempts, then 'failed' (PermanentJobError fails at once);
+* worker died      -> a running job becomes claimable again once its
+                      visibility timeout (run_at) has passed.
+
+Handlers must therefore be idempotent. Register one with:
+
+    @jobs.task("export_csv", timeout=1800, max_attempts=3)
+    def export_csv(payload): ...
+
+A task registered with every=<seconds> is periodic: the supervisor queues it
+at start (and re-checks hourly), and each successful run queues the next one
+`every` seconds later.
+
+A handler may return a JSON-serializable result. If it writes a file under
+data/exports it returns {"file": <name>, ...}; prune() removes the file
+together with the job row.
+"""
+import json
+import os
+import random
+import signal
+import socket
+import sqlite3
+import time
+import traceback
+
+from .db import get_db, immediate_transaction, now_iso
+
+DEFAULT_TIMEOUT = 300
+DEFAULT_MAX_ATTEMPTS = 5
+
+TASKS = {}
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying cannot help (bad payload, missing row)."""
+
+
+def task(name: str, timeout: int = DEFAULT_TIMEOUT, max_attempts: int = DEFAULT_MAX_ATTEMPTS, every=None):
+    def register(fn):
+        TASKS[name] = {"fn": fn, "timeout": timeout, "max_attempts": max_attempts, "every": every}
+        return fn
+    return register
+
+
+def exports_dir(app) -> str:
+    return os.path.join(os.path.dirname(app.config["DB_PATH"]), "exports")
+
+
+def enqueue(db, name: str, payload=None, delay: float = 0, created_by=None, max_attempts=None) -> int:
+    """Queue a job and return its id. Does not commit: the job becomes visible
+    to workers with the caller's transaction."""
+    if name not in TASKS:
+        raise ValueError(f"unknown job: {name}")
+    cur = db.execute(
+        "INSERT INTO jobs(name, payload, max_attempts, run_at, created_by, created_at) VALUES(?,?,?,?,?,?)",
+        (
+            name,
+            json.dumps(payload or {}, ensure_ascii=False),
+            max_attempts or TASKS[name]["max_attempts"],
+            time.time() + delay,
+            created_by,
+            now_iso(),
+        ),
+    )
+    return cur.lastrowid
+
+
+def enqueue_once(db, name: str, payload=None, delay: float = 0, **kwargs) -> int:
+    """Like enqueue(), unless a job of this name is already waiting to start.
+
+    A running one does not count: it may already be past the work the caller
+    is about to add. Call inside the caller's write transaction."""
+    row = db.execute("SELECT id FROM jobs WHERE status='queued' AND name=? LIMIT 1", (name,)).fetchone()
+    if row is not None:
+        return row["id"]
+    return enqueue(db, name, payload, delay=delay, **kwargs)
+
+
+def schedule_periodic(db) -> None:
+    """Queue every periodic task that has no job waiting."""
+    with immediate_transaction(db):
+        for name, spec in TASKS.items():
+            if spec["every"]:
+                enqueue_once(db, name)
+
+
+def claim(db, worker_id: str):
+    """Lock the next due job for `worker_id` and return its row, or None."""
+    now = time.time()
+    with immediate_transaction(db):
+        while True:
+            row = db.execute(
+                "SELECT * FROM jobs WHERE status IN ('queued','running') AND run_at <= ? ORDER BY run_at, id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            if row["status"] == "running" and row["attempts"] >= row["max_attempts"]:
+                # Its last worker vanished mid-run and there are no attempts left.
+                db.execute(
+                    "UPDATE jobs SET status='failed', locked_by=NULL, last_error=?, finished_at=? WHERE id=?",
+                    (f"visibility timeout expired ({row['locked_by']})", now_iso(), row["id"]),
+                )
+                continue
+            timeout = TASKS.get(row["name"], {}).get("timeout", DEFAULT_TIMEOUT)
+            db.execute(
+                "UPDATE jobs SET status='running', attempts=attempts+1, run_at=?, locked_by=? WHERE id=?",
+                (now + timeout, worker_id, row["id"]),
+            )
+            return db.execute("SELECT * FROM jobs WHERE id=?", (row["id"],)).fetchone()
+
+
+def _finish(db, job, worker_id: str, sql: str, params: tuple) -> bool:
+    # The WHERE on locked_by drops the outcome if the lease expired and another
+    # worker has claimed the job meanwhile.
+    with immediate_transaction(db):
+        cur = db.execute(sql + " WHERE id=? AND status='running' AND locked_by=?", params + (job["id"], worker_id))
+    return cur.rowcount == 1
+
+
+def complete(db, job, worker_id: str, result=None) -> bool:
+    return _finish(
+        db, job, worker_id,
+        "UPDATE jobs SET status='done', locked_by=NULL, last_error=NULL, result=?, finished_at=?",
+        (json.dumps(result, ensure_ascii=False) if result is not None else None, now_iso()),
+    )
+
+
+def backoff(attempts: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter for the given (1-based) attempt."""
+    return random.uniform(0, min(cap, base * (2 ** (attempts - 1))))
+
+
+def fail(db, job, worker_id: str, error: str, permanent: bool = False, base: float = 5, cap: float = 600) -> bool:
+    if permanent or job["attempts"] >= job["max_attempts"]:
+        return _finish(
+            db, job, worker_id,
+            "UPDATE jobs SET status='failed', locked_by=NULL, last_error=?, finished_at=?",
+            (error, now_iso()),
+        )
+    return _finish(
+        db, job, worker_id,
+        "UPDATE jobs SET status='queued', locked_by=NULL, last_error=?, run_at=?",
+        (error, time.time() + backoff(job["attempts"], base, cap)),
+    )
+
+
+def retry(db, job_id: int) -> bool:
+    """Put a failed job back in the queue with a fresh set of attempts. Does not commit."""
+    cur = db.execute(
+        "UPDATE jobs SET status='queued', attempts=0, run_at=?, finished_at=NULL WHERE id=? AND status='failed'",
+        (time.time(), job_id),
+    )
+    return cur.rowcount == 1
+
+
+def prune(db, root: str, keep_seconds: float) -> int:
+    """Delete finished jobs older than keep_seconds and the files they produced."""
+    cutoff = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - keep_seconds))
+    with immediate_transaction(db):
+        rows = db.execute(
+            "SELECT id, result FROM jobs WHERE status IN ('done','failed') AND finished_at < ?", (cutoff,)
+        ).fetchall()
+        for row in rows:
+            name = (json.loads(row["result"]) or {}).get("file") if row["result"] else None
+            if isinstance(name, str):
+                try:
+                    os.remove(os.path.join(root, os.path.basename(name)))
+                except FileNotFoundError:
+                    pass
+        db.executemany("DELETE FROM jobs WHERE id=?", [(row["id"],) for row in rows])
+    return len(rows)
+
+
+def run_one(app, worker_id: str) -> bool:
+    """Claim and run a single job. Returns False when nothing was due."""
+    cfg = app.config
+    with app.app_context():
+        job = claim(get_db(), worker_id)
+    if job is None:
+        return False
+    spec = TASKS.get(job["name"])
+    with app.app_context():
+        try:
+            if spec is None:
+                raise PermanentJobError(f"unknown job: {job['name']}")
+            result = spec["fn"](json.loads(job["payload"] or "{}"))
+        except Exception as e:
+            # Roll back whatever the handler left half-done before recording the failure.
+            db = get_db()
+            if db.in_transaction:
+                db.rollback()
+            error = "".join(traceback.format_exception_only(type(e), e)).strip()
+            fail(
+                db, job, worker_id, error,
+                permanent=isinstance(e, PermanentJobError),
+                base=float(cfg.get("JOB_BACKOFF_BASE", 5)),
+                cap=float(cfg.get("JOB_BACKOFF_MAX", 600)),
+            )
+        else:
+            db = get_db()
+            if complete(db, job, worker_id, result) and spec["every"]:
+                with immediate_transaction(db):
+                    enqueue_once(db, job["name"], delay=spec["every"])
+    return True
+
+
+def _worker_loop(app, index: int, burst: bool):
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor decides when to stop
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    poll = float(app.config.get("JOB_POLL_INTERVAL", 1.0))
+    while not stopping:
+        try:
+            ran = run_one(app, worker_id)
+        except sqlite3.OperationalError:
+            # Database busy beyond busy_timeout: back off and try again.
+            ran = False
+        if not ran:
+            if burst:
+                return
+            time.sleep(poll)
+
+
+def run_workers(app, processes: int = 2, burst: bool = False) -> int:
+    """Supervise `processes` worker processes until SIGINT/SIGTERM.
+
+    Dead workers are replaced. With burst=True each worker exits once the queue
+    has no due jobs, and so does this function. Finished jobs older than
+    JOB_RETENTION_SECONDS are pruned at start and then hourly; periodic tasks
+    without a queued job are queued at the same times.
+    """
+    import multiprocessing
+    ctx = multiprocessing.get_context("fork")
+    processes = max(1, int(processes))
+    keep = float(app.config.get("JOB_RETENTION_SECONDS", 7 * 86400))
+
+    def spawn(index):
+        p = ctx.Process(target=_worker_loop, args=(app, index, burst), name=f"job-worker-{index}", daemon=False)
+        p.start()
+        return p
+
+    def prune_now():
+        with app.app_context():
+            schedule_periodic(get_db())
+            return prune(get_db(), exports_dir(app), keep)
+
+    prune_now()
+    stopping = []
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stopping.append(True))
+    workers = [spawn(i) for i in range(processes)]
+    last_prune = time.monotonic()
+    try:
+        while not stopping:
+            alive = 0
+            for i, p in enumerate(workers):
+                if p.is_alive():
+                    alive += 1
+                elif burst:
+                    p.join()
+                elif not stopping:
+                    p.join()
+                    workers[i] = spawn(i)
+                    alive += 1
+            if burst and not alive:
+                break
+            if time.monotonic() - last_prune > 3600:
+                prune_now()
+                last_prune = time.monotonic()
+            time.sleep(0.5)
+    finally:
+        # Let running jobs finish; anything cut short is reclaimed after its timeout.
+        for p in workers:
+            if p.is_alive():
+                p.terminate()
+        grace = float(app.config.get("JOB_SHUTDOWN_GRACE", 30))
+        deadline = time.monotonic() + grace
+        for p in workers:
+            p.join(max(0.0, deadline - time.monotonic()))
+            if p.is_alive():
+                p.kill()
+                p.join()
+    return 0
@@ -0,0 +1,87 @@
+"""Serving report media after the route has authorized the request.
+
+MEDIA_SERVE_MODE selects who copies the bytes:
+
+* "x-accel"    - nginx: reply with X-Accel-Redirect to MEDIA_ACCEL_PREFIX + the
+                 path relative to the uploads dir (an `internal` location).
+* "x-sendfile" - Apache mod_xsendfile / lighttpd: reply with X-Sendfile and the
+                 absolute path.
+* "direct"     - the worker sends the file itself. Full and open-ended range
+                 responses go through wsgi.file_wrapper, which gunicorn turns
+                 into os.sendfile(); bounded ranges are read in chunks.
+
+In every mode the front-end server or this module handles Range, If-Range and
+If-None-Match, so large videos can be seeked.
+"""
+import os
+from urllib.parse import quote
+
+from flask import current_app, request
+from werkzeug.http import parse_range_header
+from werkzeug.wsgi import wrap_file
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _content_disposition(download_name: str, inline: bool) -> str:
+    kind = "inline" if inline else "attachment"
+    return f"{kind}; filename*=UTF-8''{quote(download_name or 'file')}"
+
+
+def _read_range(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_file(path: str, root: str, mime: str, download_name: str, etag: str, inline: bool = True):
+    """Return a response for `path` (inside `root`) using the configured mode."""
+    resp = current_app.response_class(mimetype=mime)
+    resp.headers["Content-Disposition"] = _content_disposition(download_name, inline)
+    resp.headers["X-Content-Type-Options"] = "nosniff"
+    mode = (current_app.config.get("MEDIA_SERVE_MODE") or "direct").lower()
+
+    if mode == "x-accel":
+        prefix = current_app.config.get("MEDIA_ACCEL_PREFIX") or "/protected-uploads/"
+        rel = os.path.relpath(path, root).replace(os.sep, "/")
+        resp.headers["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + quote(rel)
+        return resp
+    if mode == "x-sendfile":
+        resp.headers["X-Sendfile"] = os.path.abspath(path)
+        return resp
+
+    size = os.path.getsize(path)
+    resp.set_etag(etag)
+    resp.headers["Accept-Ranges"] = "bytes"
+    if request.if_none_match.contains_weak(etag):
+        resp.status_code = 304
+        return resp
+
+    rng = parse_range_header(request.headers.get("Range"))
+    if_range = request.headers.get("If-Range")
+    if rng is not None and if_range and if_range.strip('"') != etag:
+        rng = None  # the client's copy is stale: send the whole file
+    span = rng.range_for_length(size) if rng is not None else None
+    if rng is not None and span is None:
+        resp.status_code = 416
+        resp.headers["Content-Range"] = f"bytes */{size}"
+        return resp
+
+    start, stop = span if span else (0, size)
+    if span:
+        resp.status_code = 206
+        resp.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+    resp.content_length = stop - start
+    if stop == size:
+        f = open(path, "rb")
+        f.seek(start)
+        resp.response = wrap_file(request.environ, f, CHUNK_SIZE)
+    else:
+        resp.response = _read_range(path, start, stop - start)
+    resp.direct_passthrough = True
+    return resp
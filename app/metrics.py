@@ -0,0 +1,163 @@
+"""Prometheus metrics at /metrics (text exposition format).
+
+Collected per request: latency histogram by endpoint and status code,
+requests in flight, time spent in SQL (from perf.py, so PERF_ENABLED must be
+on) and template render time; plus the size of uploaded report files.
+
+Under gunicorn every worker is a separate process. When
+PROMETHEUS_MULTIPROC_DIR is set (gunicorn.conf.py sets it to data/metrics
+and empties it when the master starts), each worker writes its values to
+mmap'ed files in that directory and /metrics, whichever worker answers it,
+sums the files of all workers. Without it (development server) the
+process's own registry is exported.
+
+/metrics answers only scrapers that send "Authorization: Bearer
+<METRICS_TOKEN>", or, when no token is set, direct requests from loopback
+(no X-Forwarded-For / X-Real-IP, so not via a local reverse proxy); anyone
+else gets 404. prometheus_client is optional: without it /metrics answers
+404 too.
+"""
+import hmac
+import os
+import threading
+import time
+
+from flask import abort, g, request
+from flask.signals import before_render_template, template_rendered
+
+try:
+    import prometheus_client
+except ImportError:  # pragma: no cover - depends on the deployment
+    prometheus_client = None
+
+from . import perf
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TEMPLATE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+UPLOAD_BUCKETS = tuple(2 ** n for n in range(10, 31, 2))  # 1 KiB .. 1 GiB
+
+_metrics = None
+_metrics_lock = threading.Lock()
+_local = threading.local()
+
+
+def _build():
+    """Create the metric objects once per process (create_app may run several times)."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            from prometheus_client import Counter, Gauge, Histogram
+            _metrics = {
+                "latency": Histogram(
+                    "greenlink_http_request_duration_seconds", "Request latency.",
+                    ["endpoint", "method", "status"], buckets=LATENCY_BUCKETS,
+                ),
+                "in_flight": Gauge(
+                    "greenlink_http_requests_in_flight", "Requests being handled.", multiprocess_mode="livesum",
+                ),
+                "db_time": Histogram(
+                    "greenlink_db_time_seconds", "Time spent in SQL per request.",
+                    ["endpoint"], buckets=LATENCY_BUCKETS,
+                ),
+                "db_queries": Counter("greenlink_db_queries", "SQL statements executed.", ["endpoint"]),
+                "render": Histogram(
+                    "greenlink_template_render_seconds", "Template render time.",
+                    ["template"], buckets=TEMPLATE_BUCKETS,
+                ),
+                "upload": Histogram(
+                    "greenlink_upload_size_bytes", "Size of uploaded report files.",
+                    ["kind"], buckets=UPLOAD_BUCKETS,
+                ),
+            }
+    return _metrics
+
+
+def observe_upload(kind: str, size: int) -> None:
+    if _metrics is not None:
+        _metrics["upload"].labels(kind).observe(size)
+
+
+def _before_render(sender, template, context, **extra):
+    stack = getattr(_local, "renders", None)
+    if stack is None:
+        stack = _local.renders = []
+    stack.append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    stack = getattr(_local, "renders", None)
+    if stack:
+        elapsed = time.perf_counter() - stack.pop()
+        _metrics["render"].labels(template.name or "<string>").observe(elapsed)
+
+
+def _exposition():
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def _direct_loopback() -> bool:
+    if request.headers.get("X-Forwarded-For") or request.headers.get("X-Real-IP"):
+        return False
+    return request.remote_addr in ("127.0.0.1", "::1")
+
+
+def init_metrics(app):
+    if prometheus_client is None or not app.config.get("METRICS_ENABLED", True):
+        app.extensions["metrics"] = None
+        return None
+    metrics = _build()
+    token = app.config.get("METRICS_TOKEN") or ""
+
+    @app.before_request
+    def _metrics_start():
+        if request.endpoint == "metrics":
+            return
+        g._metrics_started = time.perf_counter()
+        metrics["in_flight"].inc()
+
+    @app.after_request
+    def _metrics_status(resp):
+        g._metrics_status = resp.status_code
+        return resp
+
+    @app.teardown_request
+    def _metrics_finish(error=None):
+        started = g.pop("_metrics_started", None)
+        if started is None:
+            return
+        metrics["in_flight"].dec()
+        endpoint = request.endpoint or "<unmatched>"
+        status = "500" if error is not None else str(g.pop("_metrics_status", 500))
+        metrics["latency"].labels(endpoint, request.method, status).observe(time.perf_counter() - started)
+
+    def _observe_db(endpoint, stats):
+        # Called from perf's own teardown, so it does not depend on hook order.
+        if endpoint != "metrics":
+            metrics["db_time"].labels(endpoint).observe(stats.db_time)
+            metrics["db_queries"].labels(endpoint).inc(len(stats.queries))
+
+    perf.on_request_stats(app, _observe_db)
+
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+
+    def metrics_view():
+        if token:
+            given = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+            if not hmac.compare_digest(given.encode(), token.encode()):
+                abort(401)
+        elif not _direct_loopback():
+            abort(404)
+        body, content_type = _exposition()
+        return app.response_class(body, content_type=content_type)
+
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+    app.extensions["metrics"] = metrics
+    return metrics
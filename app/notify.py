@@ -0,0 +1,258 @@
+"""Notification outbox for volunteers.
+
+Requests never talk to a mail server. They add rows to the `notifications`
+outbox (one per recipient) and a job worker delivers them:
+
+* new event/task  - the request only enqueues a "notify_new_item" job, which
+                    fans out to every subscribed volunteer with a single
+                    INSERT ... SELECT, so creating an item stays O(1) however
+                    many subscribers there are;
+* application approved/rejected - one INSERT ... SELECT for the applicant,
+                    in the same transaction as the status change;
+* "dispatch_notifications" - claims pending rows in batches of
+                    NOTIFY_BATCH_SIZE, hands them to the sink and paces itself
+                    to NOTIFY_RATE messages per second.
+
+Only volunteers with subscribers.is_subscribed = 1 are notified. Delivery is
+at-least-once: a batch whose worker dies is claimed again after its lease.
+
+NOTIFY_SINK picks the sink: "file" (JSON lines in NOTIFY_FILE_PATH, the
+default), "smtp" (one message per notification, e.g. to a local SMTP stub),
+"off", or "package.module:factory" - a callable taking the app and returning
+an object with send(messages) -> {notification_id: error} for failures.
+"""
+import importlib
+import json
+import os
+import smtplib
+import time
+from email.message import EmailMessage
+
+from flask import current_app
+
+from . import jobs
+from .db import get_db, immediate_transaction, now_iso
+
+APPLICATION_STATUS_TEXT = {
+    "подтверждена": ("application_approved", "Заявка подтверждена", "Ваша заявка на «{name}» подтверждена."),
+    "отклонена": ("application_rejected", "Заявка отклонена", "Ваша заявка на «{name}» отклонена."),
+}
+
+ITEM_TEXT = {
+    "event": ("events", "Новое мероприятие", "Новое мероприятие: «{name}».", "/events/{id}"),
+    "task": ("tasks", "Новое задание", "Новое задание: «{name}».", "/tasks/{id}"),
+}
+
+_SUBSCRIBED_VOLUNTEERS = """
+    FROM subscribers s JOIN users u ON u.id=s.user_id
+    WHERE s.is_subscribed=1 AND u.role='volunteer' AND u.is_blocked=0
+"""
+
+
+def _link(path: str) -> str:
+    return (current_app.config.get("BASE_URL") or "").rstrip("/") + path
+
+
+# --- producers (called inside the caller's transaction; nothing commits) ---
+
+def new_item(db, kind: str, item_id: int) -> None:
+    """Schedule the "new event/task" fan-out."""
+    jobs.enqueue(db, "notify_new_item", {"kind": kind, "id": item_id})
+
+
+def application_status(db, kind: str, app_id: int, status: str) -> None:
+    """Tell the applicant (if subscribed) that their application was approved/rejected."""
+    if status not in APPLICATION_STATUS_TEXT or kind not in ITEM_TEXT:
+        return
+    note_kind, subject, text = APPLICATION_STATUS_TEXT[status]
+    items, _, _, path = ITEM_TEXT[kind]
+    row = db.execute(
+        f"SELECT a.user_id, i.id as item_id, i.name FROM {kind}_applications a JOIN {items} i ON i.id=a.{kind}_id WHERE a.id=?",
+        (app_id,),
+    ).fetchone()
+    if row is None:
+        return
+    body = text.format(name=row["name"]) + "\n" + _link(path.format(id=row["item_id"]))
+    cur = db.execute(
+        "INSERT OR IGNORE INTO notifications(user_id, kind, ref, subject, body, created_at) "
+        f"SELECT u.id, ?, ?, ?, ?, ? {_SUBSCRIBED_VOLUNTEERS} AND s.user_id=?",
+        (note_kind, f"{kind}_application:{app_id}", subject, body, now_iso(), row["user_id"]),
+    )
+    if cur.rowcount:
+        jobs.enqueue_once(db, "dispatch_notifications")
+
+
+@jobs.task("notify_new_item", timeout=600)
+def _fan_out_job(payload):
+    kind = payload.get("kind")
+    if kind not in ITEM_TEXT:
+        raise jobs.PermanentJobError(f"unknown item kind: {kind}")
+    items, subject, text, path = ITEM_TEXT[kind]
+    db = get_db()
+    with immediate_transaction(db):
+        item = db.execute(f"SELECT id, name FROM {items} WHERE id=?", (payload.get("id"),)).fetchone()
+        if item is None:
+            return {"queued": 0}  # deleted before the fan-out ran
+        body = text.format(name=item["name"]) + "\n" + _link(path.format(id=item["id"]))
+        # OR IGNORE + UNIQUE(user_id, kind, ref): a retried job adds no duplicates.
+        cur = db.execute(
+            "INSERT OR IGNORE INTO notifications(user_id, kind, ref, subject, body, created_at) "
+            f"SELECT u.id, ?, ?, ?, ?, ? {_SUBSCRIBED_VOLUNTEERS}",
+            (f"new_{kind}", f"{kind}:{item['id']}", subject, body, now_iso()),
+        )
+        if cur.rowcount:
+            jobs.enqueue_once(db, "dispatch_notifications")
+    return {"queued": cur.rowcount}
+
+
+# --- sinks ---
+
+class FileSink:
+    """Appends one JSON line per message; for development and tests."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def send(self, messages) -> dict:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        lines = "".join(json.dumps(m, ensure_ascii=False) + "\n" for m in messages)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        return {}
+
+
+class SmtpSink:
+    """One e-mail per message over a single SMTP connection per batch.
+
+    Users have no e-mail column, so the address comes from
+    NOTIFY_SMTP_RECIPIENT, e.g. "{username}@students.example.org".
+    """
+
+    def __init__(self, host: str, port: int, sender: str, recipient: str, timeout: float = 10):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipient = recipient
+        self.timeout = timeout
+
+    def send(self, messages) -> dict:
+        failures = {}
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            for m in messages:
+                msg = EmailMessage()
+                msg["From"] = self.sender
+                msg["To"] = self.recipient.format(username=m["username"], user_id=m["user_id"])
+                msg["Subject"] = m["subject"]
+                msg.set_content(m["body"])
+                try:
+                    smtp.send_message(msg)
+                except smtplib.SMTPRecipientsRefused as e:
+                    failures[m["id"]] = str(e)
+        return failures
+
+
+class NullSink:
+    def send(self, messages) -> dict:
+        return {}
+
+
+def get_sink(app):
+    cfg = app.config
+    name = (cfg.get("NOTIFY_SINK") or "file").strip()
+    if name == "file":
+        path = cfg.get("NOTIFY_FILE_PATH") or os.path.join(os.path.dirname(os.path.abspath(cfg["DB_PATH"])), "notifications.log")
+        return FileSink(path)
+    if name == "smtp":
+        return SmtpSink(
+            cfg.get("NOTIFY_SMTP_HOST", "localhost"),
+            int(cfg.get("NOTIFY_SMTP_PORT", 25)),
+            cfg.get("NOTIFY_SMTP_FROM", "greenlink@localhost"),
+            cfg.get("NOTIFY_SMTP_RECIPIENT", "{username}@localhost"),
+        )
+    if name == "off":
+        return NullSink()
+    module, _, factory = name.partition(":")
+    return getattr(importlib.import_module(module), factory)(app)
+
+
+# --- dispatcher ---
+
+def _claim_batch(db, size: int, lease: float):
+    now = time.time()
+    with immediate_transaction(db):
+        rows = db.execute(
+            "SELECT n.id, n.user_id, u.username, n.kind, n.subject, n.body, n.attempts "
+            "FROM notifications n JOIN users u ON u.id=n.user_id "
+            "WHERE n.status IN ('pending','sending') AND COALESCE(n.locked_until, 0) <= ? ORDER BY n.id LIMIT ?",
+            (now, size),
+        ).fetchall()
+        db.executemany(
+            "UPDATE notifications SET status='sending', attempts=attempts+1, locked_until=? WHERE id=?",
+            [(now + lease, r["id"]) for r in rows],
+        )
+    return rows
+
+
+def _record(db, rows, failures: dict, max_attempts: int, base: float, cap: float):
+    now = time.time()
+    sent, retry, dead = [], [], []
+    for r in rows:
+        error = failures.get(r["id"])
+        if error is None:
+            sent.append((now_iso(), r["id"]))
+        elif r["attempts"] + 1 >= max_attempts:
+            dead.append((error, now_iso(), r["id"]))
+        else:
+            retry.append((error, now + jobs.backoff(r["attempts"] + 1, base, cap), r["id"]))
+    with immediate_transaction(db):
+        db.executemany(
+            "UPDATE notifications SET status='sent', locked_until=NULL, last_error=NULL, sent_at=? WHERE id=?", sent
+        )
+        db.executemany("UPDATE notifications SET status='pending', last_error=?, locked_until=? WHERE id=?", retry)
+        db.executemany(
+            "UPDATE notifications SET status='failed', locked_until=NULL, last_error=?, sent_at=? WHERE id=?", dead
+        )
+    return len(sent), len(retry), len(dead)
+
+
+@jobs.task("dispatch_notifications", timeout=300)
+def _dispatch_job(payload):
+    """Deliver batches for up to NOTIFY_DISPATCH_SECONDS, then hand over to a new job."""
+    app = current_app._get_current_object()
+    cfg = app.config
+    db = get_db()
+    sink = get_sink(app)
+    size = max(1, int(cfg.get("NOTIFY_BATCH_SIZE", 100)))
+    rate = float(cfg.get("NOTIFY_RATE", 20))
+    max_attempts = int(cfg.get("NOTIFY_MAX_ATTEMPTS", 5))
+    base, cap = float(cfg.get("JOB_BACKOFF_BASE", 5)), float(cfg.get("JOB_BACKOFF_MAX", 600))
+    deadline = time.monotonic() + float(cfg.get("NOTIFY_DISPATCH_SECONDS", 30))
+    sent = retried = failed = 0
+    while True:
+        started = time.monotonic()
+        rows = _claim_batch(db, size, lease=120)
+        if not rows:
+            break
+        messages = [{k: r[k] for k in ("id", "user_id", "username", "kind", "subject", "body")} for r in rows]
+        try:
+            failures = sink.send(messages)
+        except Exception as e:
+            # Sink down (e.g. SMTP refused the connection): the whole batch goes back.
+            failures = {r["id"]: f"{type(e).__name__}: {e}" for r in rows}
+        ok, again, dead = _record(db, rows, failures or {}, max_attempts, base, cap)
+        sent, retried, failed = sent + ok, retried + again, failed + dead
+        pause = len(rows) / rate - (time.monotonic() - started) if rate > 0 else 0
+        if time.monotonic() + max(0.0, pause) > deadline:
+            with immediate_transaction(db):
+                jobs.enqueue_once(db, "dispatch_notifications", delay=max(0.0, pause))
+            return {"sent": sent, "retried": retried, "failed": failed, "continued": True}
+        if pause > 0:
+            time.sleep(pause)
+    # Messages waiting out a retry delay need a later run.
+    with immediate_transaction(db):
+        row = db.execute(
+            "SELECT MIN(locked_until) as t FROM notifications WHERE status IN ('pending','sending')"
+        ).fetchone()
+        if row["t"] is not None:
+            jobs.enqueue_once(db, "dispatch_notifications", delay=max(0.0, row["t"] - time.time()))
+    return {"sent": sent, "retried": retried, "failed": failed}
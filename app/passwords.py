@@ -0,0 +1,112 @@
+"""Password hashing off the request thread, with a bounded queue.
+
+Hashing cost comes from PASSWORD_HASH_METHOD (any werkzeug method string,
+e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000"). Hashes made with other
+parameters still verify, and are replaced on the next successful login, so
+the cost can be raised or lowered without a migration.
+
+Hashes are computed by a small thread pool per worker process (hashlib's
+scrypt and pbkdf2 release the GIL). At most PASSWORD_HASH_QUEUE hashes may be
+queued or running in a process; past that, and when a result takes longer than
+PASSWORD_HASH_TIMEOUT, HashPoolBusy is raised and the view answers 503 at
+once instead of letting a login burst pile up behind the CPU.
+
+The limit is per process and counts requests of that process, so it only
+bites when a process serves several requests at once: gunicorn.conf.py runs
+threaded workers (GUNICORN_THREADS, default 8) and the default queue of 4 is
+below that. Across the whole server at most workers x PASSWORD_HASH_QUEUE
+hashes are in flight.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = "scrypt:32768:8:1"
+
+
+class HashPoolBusy(RuntimeError):
+    """Raised when this process has too many password hashes in flight."""
+
+
+class HashPool:
+    def __init__(self, method: str = DEFAULT_METHOD, workers: int = 2, max_pending: int = 4, timeout: float = 10.0):
+        self.method = method or DEFAULT_METHOD
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.timeout = timeout
+        self._prefix = None
+        self._reset()
+
+    def _reset(self):
+        # Executors do not survive fork; each worker process builds its own lazily.
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._executor = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _run(self, fn, *args):
+        if self._pid != os.getpid():
+            self._reset()
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HashPoolBusy(f"{self.pending} password hashes in flight")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="pwhash")
+            self.pending += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # The hash keeps its slot until it finishes; the caller gives up now.
+            with self._lock:
+                self.rejected += 1
+            raise HashPoolBusy(f"password hash took longer than {self.timeout}s")
+
+    def _done(self, future):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+
+    def hash(self, password: str) -> str:
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, hash_: str, password: str) -> bool:
+        return self._run(check_password_hash, hash_, password)
+
+    def needs_rehash(self, hash_: str) -> bool:
+        """True if the hash was made with other parameters than PASSWORD_HASH_METHOD."""
+        if self._prefix is None:
+            # Short forms ("scrypt", "pbkdf2") expand to werkzeug's defaults; see what it writes.
+            if self.method.count(":") >= 2:
+                self._prefix = self.method
+            else:
+                self._prefix = generate_password_hash("", self.method).split("$", 1)[0]
+        return hash_.split("$", 1)[0] != self._prefix
+
+    def stats(self) -> dict:
+        return {
+            "method": self.method,
+            "workers": self.workers,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "pid": os.getpid(),
+        }
+
+
+def init_passwords(app):
+    pool = HashPool(
+        method=app.config.get("PASSWORD_HASH_METHOD") or DEFAULT_METHOD,
+        workers=int(app.config.get("PASSWORD_HASH_WORKERS", 2)),
+        max_pending=int(app.config.get("PASSWORD_HASH_QUEUE", 4)),
+        timeout=float(app.config.get("PASSWORD_HASH_TIMEOUT", 10)),
+    )
+    app.extensions["passwords"] = pool
+    return pool
@@ -0,0 +1,405 @@
+"""Per-request SQL instrumentation.
+
+With PERF_ENABLED the pool hands out InstrumentedConnection objects. Every
+statement a request runs through them is recorded with its parameter shape
+(types only, never values), the rows it returned or changed and the time
+spent in execute() plus the fetches. At the end of the request:
+
+* the response gets a Server-Timing header: `db` (time in SQL, statement
+  count) and `app` (whole request), visible in the browser's devtools;
+* statements slower than PERF_SLOW_QUERY_MS are written, with their
+  EXPLAIN QUERY PLAN, to a size-rotated slow-query log (PERF_SLOW_LOG_PATH);
+* per-endpoint and per-statement totals are added to an in-process buffer
+  that is merged every PERF_FLUSH_INTERVAL seconds into a side SQLite file
+  shared by all workers (PERF_STATS_PATH). /admin/perf reads that file.
+
+Statements run outside a request (job workers, init_db) are not recorded.
+"""
+import logging
+import logging.handlers
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g, request
+
+_local = threading.local()
+_WS_RE = re.compile(r"\s+")
+
+
+def _short_type(value) -> str:
+    return "null" if value is None else type(value).__name__
+
+
+def param_shape(params) -> str:
+    """"(int, str)" / "{id: int}" - the types of the bound parameters, no values."""
+    if not params:
+        return "()"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {_short_type(v)}" for k, v in params.items()) + "}"
+    names = [_short_type(v) for v in params]
+    if len(names) > 8:
+        names = names[:8] + [f"... {len(names)} total"]
+    return "(" + ", ".join(names) + ")"
+
+
+class QueryRecord:
+    __slots__ = ("sql", "params", "many", "rows", "elapsed")
+
+    def __init__(self, sql, params, many):
+        self.sql = sql
+        self.params = params
+        self.many = many
+        self.rows = 0
+        self.elapsed = 0.0
+
+    @property
+    def text(self) -> str:
+        return _WS_RE.sub(" ", self.sql).strip()
+
+    @property
+    def shape(self) -> str:
+        if self.many:
+            first = self.params[0] if self.params else ()
+            return f"{len(self.params)} x {param_shape(first)}"
+        return param_shape(self.params)
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.status = None
+
+    @property
+    def db_time(self) -> float:
+        return sum(q.elapsed for q in self.queries)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    _record = None
+
+    def _begin(self, sql, params, many):
+        stats = getattr(_local, "stats", None)
+        if stats is None:
+            self._record = None
+            return None
+        record = QueryRecord(sql, params, many)
+        stats.queries.append(record)
+        self._record = record
+        return record
+
+    def _timed(self, record, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            record.elapsed += time.perf_counter() - start
+
+    def execute(self, sql, params=()):
+        record = self._begin(sql, params, False)
+        if record is None:
+            return super().execute(sql, params)
+        self._timed(record, super().execute, sql, params)
+        if self.description is None:
+            record.rows = max(0, self.rowcount)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        record = self._begin(sql, seq_of_params, True)
+        if record is None:
+            return super().executemany(sql, seq_of_params)
+        self._timed(record, super().executemany, sql, seq_of_params)
+        record.rows = max(0, self.rowcount)
+        return self
+
+    def fetchone(self):
+        record = self._record
+        if record is None:
+            return super().fetchone()
+        row = self._timed(record, super().fetchone)
+        if row is not None:
+            record.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        record = self._record
+        args = () if size is None else (size,)
+        if record is None:
+            return super().fetchmany(*args)
+        rows = self._timed(record, super().fetchmany, *args)
+        record.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        record = self._record
+        if record is None:
+            return super().fetchall()
+        rows = self._timed(record, super().fetchall)
+        record.rows += len(rows)
+        return rows
+
+    def __next__(self):
+        record = self._record
+        if record is None:
+            return super().__next__()
+        row = self._timed(record, super().__next__)
+        record.rows += 1
+        return row
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements (and COMMITs) are timed per request."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def commit(self):
+        stats = getattr(_local, "stats", None)
+        if stats is None or not self.in_transaction:
+            return super().commit()
+        record = QueryRecord("COMMIT", (), False)
+        stats.queries.append(record)
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            record.elapsed = time.perf_counter() - start
+
+
+class PerfStats:
+    """Per-endpoint and per-statement totals, buffered in process and merged into a shared file."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS endpoint_stats (
+      endpoint TEXT PRIMARY KEY,
+      requests INTEGER NOT NULL DEFAULT 0,
+      errors INTEGER NOT NULL DEFAULT 0,
+      total_ms REAL NOT NULL DEFAULT 0,
+      max_ms REAL NOT NULL DEFAULT 0,
+      db_ms REAL NOT NULL DEFAULT 0,
+      queries INTEGER NOT NULL DEFAULT 0,
+      slow INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS statement_stats (
+      endpoint TEXT NOT NULL,
+      sql TEXT NOT NULL,
+      calls INTEGER NOT NULL DEFAULT 0,
+      rows INTEGER NOT NULL DEFAULT 0,
+      total_ms REAL NOT NULL DEFAULT 0,
+      max_ms REAL NOT NULL DEFAULT 0,
+      PRIMARY KEY (endpoint, sql)
+    );
+    """
+
+    def __init__(self, path: str, flush_interval: float = 5.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._reset()
+
+    def _reset(self):
+        # Also called in a forked child: the buffer and connection belong to the parent.
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._statements = {}
+        self._last_flush = time.monotonic()
+        self._db = None
+
+    def _conn(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode = WAL;")
+            conn.execute("PRAGMA synchronous = OFF;")
+            conn.executescript(self.SCHEMA)
+            self._db = conn
+        return self._db
+
+    def record(self, endpoint: str, stats: RequestStats, total: float, error: bool, slow: int):
+        if self._pid != os.getpid():
+            self._reset()
+        with self._lock:
+            e = self._endpoints.setdefault(endpoint, [0, 0, 0.0, 0.0, 0.0, 0, 0])
+            e[0] += 1
+            e[1] += int(error)
+            e[2] += total * 1000
+            e[3] = max(e[3], total * 1000)
+            e[4] += stats.db_time * 1000
+            e[5] += len(stats.queries)
+            e[6] += slow
+            for q in stats.queries:
+                s = self._statements.setdefault((endpoint, q.text), [0, 0, 0.0, 0.0])
+                s[0] += 1
+                s[1] += q.rows
+                s[2] += q.elapsed * 1000
+                s[3] = max(s[3], q.elapsed * 1000)
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        if self._pid != os.getpid():
+            self._reset()
+        with self._lock:
+            endpoints, self._endpoints = self._endpoints, {}
+            statements, self._statements = self._statements, {}
+            self._last_flush = time.monotonic()
+            if not endpoints and not statements:
+                return
+            try:
+                conn = self._conn()
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(
+                    "INSERT INTO endpoint_stats(endpoint, requests, errors, total_ms, max_ms, db_ms, queries, slow) "
+                    "VALUES(?,?,?,?,?,?,?,?) ON CONFLICT(endpoint) DO UPDATE SET "
+                    "requests=requests+excluded.requests, errors=errors+excluded.errors, "
+                    "total_ms=total_ms+excluded.total_ms, max_ms=MAX(max_ms, excluded.max_ms), "
+                    "db_ms=db_ms+excluded.db_ms, queries=queries+excluded.queries, slow=slow+excluded.slow",
+                    [(k, *v) for k, v in endpoints.items()],
+                )
+                conn.executemany(
+                    "INSERT INTO statement_stats(endpoint, sql, calls, rows, total_ms, max_ms) VALUES(?,?,?,?,?,?) "
+                    "ON CONFLICT(endpoint, sql) DO UPDATE SET calls=calls+excluded.calls, rows=rows+excluded.rows, "
+                    "total_ms=total_ms+excluded.total_ms, max_ms=MAX(max_ms, excluded.max_ms)",
+                    [(*k, *v) for k, v in statements.items()],
+                )
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                # Stats are best effort: a busy or broken side file must never fail a request.
+                if self._db is not None and self._db.in_transaction:
+                    self._db.rollback()
+
+    def endpoints(self):
+        self.flush()
+        return self._conn().execute(
+            "SELECT *, total_ms / requests as avg_ms, db_ms / requests as avg_db_ms, "
+            "CAST(queries AS REAL) / requests as avg_queries FROM endpoint_stats ORDER BY db_ms DESC"
+        ).fetchall()
+
+    def statements(self, endpoint=None, limit: int = 50):
+        self.flush()
+        where, params = ("WHERE endpoint=?", (endpoint,)) if endpoint else ("", ())
+        return self._conn().execute(
+            "SELECT *, total_ms / calls as avg_ms, CAST(rows AS REAL) / calls as avg_rows "
+            f"FROM statement_stats {where} ORDER BY total_ms DESC LIMIT ?",
+            params + (limit,),
+        ).fetchall()
+
+    def reset(self):
+        with self._lock:
+            self._endpoints, self._statements = {}, {}
+            conn = self._conn()
+            conn.execute("DELETE FROM endpoint_stats")
+            conn.execute("DELETE FROM statement_stats")
+
+
+def _slow_logger(path: str, max_bytes: int, backup_count: int):
+    logger = logging.getLogger(f"{__name__}.slow:{path}")
+    if not logger.handlers:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+def _explain(db, record) -> list:
+    if record.sql == "COMMIT":
+        return []
+    params = record.params[0] if record.many and record.params else record.params
+    try:
+        return [r[3] for r in db.execute("EXPLAIN QUERY PLAN " + record.sql, params or ()).fetchall()]
+    except sqlite3.Error as e:
+        return [f"(no plan: {e})"]
+
+
+def _log_slow(app, endpoint: str, slow) -> None:
+    cfg = app.config
+    path = cfg.get("PERF_SLOW_LOG_PATH") or os.path.join(
+        os.path.dirname(os.path.abspath(cfg["DB_PATH"])), "slow_queries.log"
+    )
+    logger = _slow_logger(
+        path, int(cfg.get("PERF_SLOW_LOG_MAX_BYTES", 5 * 1024 * 1024)), int(cfg.get("PERF_SLOW_LOG_BACKUP_COUNT", 5))
+    )
+    db = g.get("db")
+    stamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    for record in slow:
+        lines = [
+            f"{stamp}\t{endpoint}\t{record.elapsed * 1000:.1f} ms\trows={record.rows}\tparams={record.shape}",
+            f"    {record.text}",
+        ]
+        if db is not None:
+            lines += [f"    plan: {d}" for d in _explain(db, record)]
+        logger.info("\n".join(lines))
+
+
+def init_perf(app):
+    cfg = app.config
+    if not cfg.get("PERF_ENABLED", True):
+        app.extensions["perf"] = None
+        return None
+    path = cfg.get("PERF_STATS_PATH") or os.path.join(os.path.dirname(os.path.abspath(cfg["DB_PATH"])), "perf.db")
+    perf = PerfStats(path, flush_interval=float(cfg.get("PERF_FLUSH_INTERVAL", 5.0)))
+    app.extensions["perf"] = perf
+    slow_after = float(cfg.get("PERF_SLOW_QUERY_MS", 100)) / 1000
+
+    @app.before_request
+    def _perf_start():
+        _local.stats = RequestStats()
+
+    @app.after_request
+    def _perf_server_timing(resp):
+        stats = getattr(_local, "stats", None)
+        if stats is not None:
+            stats.status = resp.status_code
+            total = time.perf_counter() - stats.started
+            resp.headers.add(
+                "Server-Timing",
+                f'db;dur={stats.db_time * 1000:.1f};desc="{len(stats.queries)} queries", app;dur={total * 1000:.1f}',
+            )
+        return resp
+
+    @app.teardown_request
+    def _perf_finish(error=None):
+        stats = getattr(_local, "stats", None)
+        _local.stats = None  # EXPLAINs below and later work on this thread are not counted
+        if stats is None:
+            return
+        total = time.perf_counter() - stats.started
+        endpoint = request.endpoint or "<unmatched>"
+        for listener in app.extensions.get("perf_listeners", ()):
+            listener(endpoint, stats)
+        slow = [q for q in stats.queries if q.elapsed >= slow_after]
+        if slow:
+            try:
+                _log_slow(app, endpoint, slow)
+            except (OSError, sqlite3.Error):
+                pass
+        failed = error is not None or (stats.status or 500) >= 500
+        perf.record(endpoint, stats, total, failed, len(slow))
+
+    return perf
+
+
+def on_request_stats(app, listener):
+    """Have perf's teardown call listener(endpoint, stats) for every finished request."""
+    app.extensions.setdefault("perf_listeners", []).append(listener)
+
+
+def get_perf():
+    return current_app.extensions.get("perf")
@@ -1,9 +1,22 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, send_from_directory
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, make_response
+import base64
+import datetime
+import hashlib
+import json
 import os
+import sqlite3
+from markupsafe import Markup
 from werkzeug.utils import secure_filename
 
-from .db import get_db, now_iso
-from .auth import hash_password, verify_password, current_user, login_required, roles_required
+from .db import get_db, immediate_transaction, media_name_sql, now_iso
+from .auth import hash_password, verify_password, password_needs_rehash, current_user, invalidate_user, login_required, roles_required
+from .search import KIND_LABELS, allowed_kinds, fts_query, search_items
+from . import jobs, metrics, notify, storage, thumbnails
+from .audit import get_audit_writer
+from .cache import get_page_cache
+from .perf import get_perf
+from .media import serve_file
+from .passwords import HashPoolBusy
 
 bp = Blueprint("main", __name__)
 
@@ -15,17 +28,14 @@ APP_REJECTED = "отклонена"
 
 # --- Audit logging (admin/organizer actions) ---
 def audit_log(action: str, target: str = "", extra: str = "") -> None:
-    """Append an audit line to data/audit.log. Best-effort, never raises."""
+    """Queue an audit event (see audit.py). Best-effort, never raises."""
     try:
         u = current_user()
-        actor = f"{u['id']}:{u['username']}:{u['role']}" if u else "anon"
-        db_path = current_app.config.get("DB_PATH", "")
-        data_dir = os.path.dirname(db_path) if db_path else os.path.join(os.path.dirname(__file__), "..", "data")
-        os.makedirs(data_dir, exist_ok=True)
-        log_path = os.path.join(data_dir, "audit.log")
-        line = f"{now_iso()}\t{actor}\t{action}\t{target}\t{extra}\n"
-        with open(log_path, "a", encoding="utf-8") as f:
-            f.write(line)
+        writer = get_audit_writer()
+        if u:
+            writer.emit(now_iso(), u["id"], u["username"], u["role"], action, target, extra)
+        else:
+            writer.emit(now_iso(), None, "anon", None, action, target, extra)
     except Exception:
         return
 
@@ -47,49 +57,315 @@ def _is_manager_for_item(item_row):
         return False
     return int(item_row["created_by"] or 0) == int(u["id"])
 
-def _active_app_count(db, kind: str, item_id: int) -> int:
-    """Counts applications excluding rejected ones."""
+# Results of _reserve_seat()
+SEAT_OK = "ok"
+SEAT_FULL = "full"
+SEAT_EXISTS = "exists"
+
+def _reserve_seat(db, kind: str, item_id: int, user_id: int, extra=None) -> str:
+    """Insert a pending application only if the item still has a free seat.
+
+    The capacity check and the INSERT are a single INSERT ... SELECT run under
+    BEGIN IMMEDIATE, so concurrent workers cannot overbook max_participants.
+    Returns SEAT_OK, SEAT_FULL (no seat left or item gone) or SEAT_EXISTS.
+    """
     if kind == "event":
-        row = db.execute(
-            "SELECT COUNT(1) c FROM event_applications WHERE event_id=? AND status IN (?, ?)",
-            (item_id, APP_PENDING, APP_APPROVED),
-        ).fetchone()
+        items, apps, fk = "events", "event_applications", "event_id"
     else:
-        row = db.execute(
-            "SELECT COUNT(1) c FROM task_applications WHERE task_id=? AND status IN (?, ?)",
-            (item_id, APP_PENDING, APP_APPROVED),
-        ).fetchone()
-    return int(row["c"] or 0)
+        items, apps, fk = "tasks", "task_applications", "task_id"
+    cols = {fk: item_id, "user_id": user_id, "status": APP_PENDING, "created_at": now_iso()}
+    cols.update(extra or {})
+    placeholders = ",".join("?" for _ in cols)
+    try:
+        with immediate_transaction(db):
+            cur = db.execute(
+                f"INSERT INTO {apps}({','.join(cols)}) SELECT {placeholders} FROM {items} "
+                "WHERE id=? AND (COALESCE(max_participants,0)=0 OR active_count < max_participants)",
+                tuple(cols.values()) + (item_id,),
+            )
+    except sqlite3.IntegrityError:
+        return SEAT_EXISTS
+    return SEAT_OK if cur.rowcount == 1 else SEAT_FULL
+
+# --- Keyset pagination ---
+def _encode_cursor(values) -> str:
+    raw = json.dumps(list(values), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _decode_cursor(token, size: int):
+    """Decode a cursor from the URL; anything malformed means "first page"."""
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    if not all(isinstance(v, (str, int)) and not isinstance(v, bool) for v in values):
+        return None
+    return tuple(values)
+
+def _page_url(prefix: str, direction: str, token: str) -> str:
+    args = request.args.to_dict()
+    args.pop(prefix + "after", None)
+    args.pop(prefix + "before", None)
+    args[prefix + direction] = token
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+def _keyset_page(db, sql: str, params: tuple, keys, prefix: str = "") -> dict:
+    """Fetch one page of `sql` ordered by `keys`, newest first.
+
+    `sql` is a SELECT ending in its WHERE clause (no ORDER BY/LIMIT). `keys` is a
+    list of (sql_expr, result_column) pairs; the last one must be unique (an id).
+    Cursors travel in the URL as ?<prefix>after=... / ?<prefix>before=...
+    Returns {"rows", "next_url", "prev_url"}.
+    """
+    exprs = [k for k, _ in keys]
+    cols = [c for _, c in keys]
+    size = int(current_app.config.get("PAGE_SIZE", 50))
+    after = _decode_cursor(request.args.get(prefix + "after"), len(keys))
+    before = None if after else _decode_cursor(request.args.get(prefix + "before"), len(keys))
+    cursor = after or before
+    op = ">" if before else "<"
+
+    cond = ""
+    bound = ()
+    if cursor:
+        placeholders = ", ".join("?" for _ in exprs)
+        cond = f" AND ({', '.join(exprs)}) {op} ({placeholders})"
+        bound = tuple(cursor)
+        if len(exprs) > 1:
+            # Redundant bound on the leading key lets SQLite range-seek the index.
+            cond = f" AND {exprs[0]} {op}= ?" + cond
+            bound = (cursor[0],) + bound
+    direction = "ASC" if before else "DESC"
+    order = ", ".join(f"{e} {direction}" for e in exprs)
+    rows = db.execute(f"{sql}{cond} ORDER BY {order} LIMIT ?", tuple(params) + bound + (size + 1,)).fetchall()
+
+    more = len(rows) > size
+    rows = rows[:size]
+    if before:
+        rows.reverse()
+    has_newer = more if before else bool(cursor)
+    has_older = bool(cursor) if before else more
+    first = _encode_cursor(rows[0][c] for c in cols) if rows else None
+    last = _encode_cursor(rows[-1][c] for c in cols) if rows else None
+    return {
+        "rows": rows,
+        "prev_url": _page_url(prefix, "before", first) if has_newer and first else None,
+        "next_url": _page_url(prefix, "after", last) if has_older and last else None,
+    }
 
 def _upload_dir():
     p = os.path.join(os.path.dirname(current_app.config["DB_PATH"]), "uploads")
     os.makedirs(p, exist_ok=True)
     return p
 
+def _insert_report(table: str, fields: dict, file) -> None:
+    """Insert a report row; its media (if any) goes to the deduplicated store.
+
+    Raises sqlite3.IntegrityError if the user already has a report for the item.
+    """
+    db = get_db()
+    root = _upload_dir()
+    tmp_path = None
+    if file and file.filename:
+        tmp_path, sha256, size = storage.spool(file.stream, root)
+        metrics.observe_upload(table, size)
+    try:
+        with immediate_transaction(db):
+            if tmp_path:
+                name = secure_filename(file.filename) or "file"
+                mime = storage.guess_mime(name, file.mimetype)
+                fields["attachment_id"] = storage.attach(db, root, tmp_path, sha256, size, mime, name, now_iso())
+                if thumbnails.supported(mime):
+                    jobs.enqueue(db, "thumbnail", {"sha256": sha256, "mime": mime})
+            cols = ", ".join(fields)
+            marks = ", ".join("?" for _ in fields)
+            db.execute(f"INSERT INTO {table}({cols}) VALUES({marks})", tuple(fields.values()))
+    except Exception:
+        if tmp_path:
+            # attach() may have published the blob for a row that just rolled back.
+            with immediate_transaction(db):
+                storage.discard_unrecorded(db, root, sha256)
+        raise
+    finally:
+        if tmp_path:
+            storage.discard(tmp_path)
+
+@bp.app_template_global()
+def report_media_url(r):
+    """Download link for a report's media: attachment id, or a legacy media_path."""
+    if r["attachment_id"]:
+        return url_for("main.attachment", attachment_id=r["attachment_id"])
+    if r["media_path"]:
+        return url_for("main.uploads", filename=r["media_path"])
+    return None
+
+@bp.app_template_global()
+def report_thumb_url(r):
+    """Thumbnail link for a moderation row (needs media_mime), or None."""
+    if r["attachment_id"] and thumbnails.supported(r["media_mime"]):
+        return url_for("main.attachment_thumb", attachment_id=r["attachment_id"])
+    return None
+
+# --- Page fragment cache (public listings) ---
+# Roles whose view of the cached pages is identical for every user of that role.
+CACHEABLE_ROLES = ("anon", "volunteer")
+
+def _render_block(template_name: str, block: str, context: dict) -> str:
+    current_app.update_template_context(context)
+    tmpl = current_app.jinja_env.get_template(template_name)
+    return "".join(tmpl.blocks[block](tmpl.new_context(context)))
+
+def _cached_page(template_name: str, build_context):
+    """Render `template_name`, serving its content block from the page cache.
+
+    `build_context` runs the queries and is only called on a miss. The page
+    chrome (nav, flashes, CSRF) is always rendered fresh around the fragment.
+    """
+    cache = get_page_cache()
+    u = current_user()
+    role = u["role"] if u else "anon"
+    if cache is None or role not in CACHEABLE_ROLES:
+        return render_template(template_name, **build_context())
+    db = get_db()
+    key = f"{request.endpoint}:{role}:v{cache.version(db)}:{request.query_string.decode('latin-1')}"
+    fragment = cache.get(request.endpoint, key)
+    if fragment is None:
+        fragment = _render_block(template_name, "content", build_context())
+        cache.set(key, fragment)
+    return render_template("_cached_page.html", fragment=Markup(fragment))
+
+def _invalidate_pages():
+    """Call after a committed write that changes what the listing pages show."""
+    cache = get_page_cache()
+    if cache is not None:
+        cache.invalidate(get_db())
+
+# --- Conditional GET (ETag) ---
+_template_stamp = None
+
+def _templates_stamp() -> str:
+    # Changes on deploy so that clients never keep pages rendered by old templates.
+    global _template_stamp
+    if _template_stamp is None:
+        root = os.path.join(current_app.root_path, current_app.template_folder)
+        mtimes = [os.path.getmtime(os.path.join(root, f)) for f in os.listdir(root)]
+        _template_stamp = str(max(mtimes, default=0))
+    return _template_stamp
+
+def _page_etag(*versions) -> str:
+    """Strong ETag for the current page: data versions + everything per-viewer.
+
+    The nav shows the viewer's name, role and points, and forms embed the
+    session's CSRF token, so all of those are part of the tag.
+    """
+    u = current_user()
+    viewer = [u["id"], u["role"], u["username"], u["points"]] if u else None
+    raw = json.dumps(
+        [request.endpoint, request.query_string.decode("latin-1"), _templates_stamp(),
+         session.get("csrf_token"), viewer, *versions],
+        default=str,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+def _not_modified(*versions):
+    """Return a 304 response if the client's copy is current, else None."""
+    if session.get("_flashes"):
+        # Pending flash messages are part of the next rendered page.
+        return None
+    etag = _page_etag(*versions)
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    resp = current_app.response_class(status=304)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+def _with_etag(body, *versions):
+    # Computed after rendering: the first render may have just created the CSRF token.
+    resp = make_response(body)
+    resp.set_etag(_page_etag(*versions))
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+def _table_version(db, table: str) -> int:
+    row = db.execute("SELECT version FROM cache_versions WHERE scope=?", (table,)).fetchone()
+    return row["version"] if row else 0
+
 @bp.context_processor
 def inject_user():
     return {"current_user": current_user()}
 
 @bp.route("/")
 def index():
+    def build():
+        db = get_db()
+        events = db.execute(
+            "SELECT e.*, e.active_count as appl_count FROM events e ORDER BY COALESCE(e.start_time,'') DESC, e.id DESC LIMIT 20"
+        ).fetchall()
+        tasks = db.execute(
+            "SELECT t.*, t.active_count as appl_count FROM tasks t ORDER BY COALESCE(t.start_time,'') DESC, t.id DESC LIMIT 20"
+        ).fetchall()
+        return {"events": events, "tasks": tasks}
+    return _cached_page("index.html", build)
+
+
+
+@bp.route("/search")
+def search():
     db = get_db()
-    events = db.execute(
-        "SELECT e.*, (SELECT COUNT(1) FROM event_applications a WHERE a.event_id=e.id AND a.status IN (?, ?)) as appl_count FROM events e ORDER BY e.start_time IS NULL, e.start_time DESC, e.id DESC LIMIT 20",
-        (APP_PENDING, APP_APPROVED),
-    ).fetchall()
-    tasks = db.execute(
-        "SELECT t.*, (SELECT COUNT(1) FROM task_applications a WHERE a.task_id=t.id AND a.status IN (?, ?)) as appl_count FROM tasks t ORDER BY t.start_time IS NULL, t.start_time DESC, t.id DESC LIMIT 20",
-        (APP_PENDING, APP_APPROVED),
-    ).fetchall()
-    return render_template("index.html", events=events, tasks=tasks)
+    u = current_user()
+    q = (request.args.get("q") or "").strip()
+    kinds = allowed_kinds(u)
+    kind = request.args.get("kind")
+    if kind not in kinds:
+        kind = None
+    page_no = min(max(request.args.get("page", 1, type=int) or 1, 1), 50)
+    size = int(current_app.config.get("PAGE_SIZE", 50))
+    preview = 5
+
+    match = fts_query(q)
+    results = {}
+    has_next = False
+    if match:
+        if kind:
+            rows = search_items(db, kind, match, u, size + 1, (page_no - 1) * size)
+            has_next = len(rows) > size
+            results[kind] = rows[:size]
+        else:
+            # Overview: best few hits per kind, each linking to its own paginated list.
+            for k in kinds:
+                results[k] = search_items(db, k, match, u, preview + 1)
+    return render_template(
+        "search.html",
+        q=q,
+        kind=kind,
+        kinds=kinds,
+        labels=KIND_LABELS,
+        results=results,
+        preview=preview,
+        page_no=page_no,
+        has_next=has_next,
+    )
 
 
 
 @bp.route("/about")
 def about():
-    return render_template("about.html")
+    return _cached_page("about.html", dict)
+
 
 
+def _hash_busy(template: str):
+    """Answer 503 when this worker already has too many password hashes in flight."""
+    flash("Сервер перегружен входами и регистрациями. Попробуйте ещё раз через несколько секунд.", "error")
+    resp = make_response(render_template(template), 503)
+    resp.headers["Retry-After"] = "5"
+    return resp
+
 
 @bp.route("/register", methods=["GET","POST"])
 def register():
@@ -102,12 +378,18 @@ def register():
         if len(username) < 3 or len(password) < 4:
             flash("Введите логин (>=3 символа) и пароль (>=4 символа).", "error")
             return render_template("register.html")
+        try:
+            password_hash = hash_password(password)
+        except HashPoolBusy:
+            return _hash_busy("register.html")
         db = get_db()
         try:
-            db.execute(
+            user_id = db.execute(
                 "INSERT INTO users(username,password_hash,role,created_at,points) VALUES(?,?,?,?,0)",
-                (username, hash_password(password), role, now_iso()),
-            )
+                (username, password_hash, role, now_iso()),
+            ).lastrowid
+            if role == "volunteer":
+                db.execute("INSERT OR IGNORE INTO subscribers(user_id,is_subscribed) VALUES(?,1)", (user_id,))
             db.commit()
             flash("Регистрация успешна. Теперь войдите.", "success")
             return redirect(url_for("main.login"))
@@ -122,12 +404,26 @@ def login():
         password = request.form.get("password") or ""
         db = get_db()
         user = db.execute("SELECT * FROM users WHERE username=?", (username,)).fetchone()
-        if not user or not verify_password(user["password_hash"], password):
+        try:
+            valid = user is not None and verify_password(user["password_hash"], password)
+        except HashPoolBusy:
+            return _hash_busy("login.html")
+        if not valid:
             flash("Неверный логин или пароль.", "error")
             return render_template("login.html")
         if user["is_blocked"]:
             flash("Ваш аккаунт заблокирован. Обратитесь к администратору.", "error")
             return render_template("login.html")
+        if password_needs_rehash(user["password_hash"]):
+            # Hash cost was changed in the config: store a hash with the current parameters.
+            try:
+                db.execute(
+                    "UPDATE users SET password_hash=? WHERE id=? AND password_hash=?",
+                    (hash_password(password), user["id"], user["password_hash"]),
+                )
+                db.commit()
+            except HashPoolBusy:
+                pass  # keep the old hash; the next login retries
         session.clear()
         session["user_id"] = user["id"]
         flash("Вы вошли в систему.", "success")
@@ -161,6 +457,11 @@ def profile():
                 "UPDATE users SET full_name=?, group_name=?, faculty=?, age=?, university_id=? WHERE id=?",
                 (full_name, group_name, faculty, age_int, uni_int, u["id"]),
             )
+            db.execute(
+                "INSERT INTO subscribers(user_id,is_subscribed) VALUES(?,?) "
+                "ON CONFLICT(user_id) DO UPDATE SET is_subscribed=excluded.is_subscribed",
+                (u["id"], 1 if request.form.get("is_subscribed") else 0),
+            )
         else:
             education_text = (request.form.get("education_text") or "").strip()
             bio_text = (request.form.get("bio_text") or "").strip()
@@ -170,10 +471,12 @@ def profile():
             )
 
         db.commit()
+        invalidate_user(u["id"])
         flash("Профиль обновлён.", "success")
         return redirect(url_for("main.profile"))
 
     universities = db.execute("SELECT * FROM universities ORDER BY name").fetchall()
+    sub = db.execute("SELECT is_subscribed FROM subscribers WHERE user_id=?", (u["id"],)).fetchone()
     my_event_apps = db.execute(
         "SELECT a.*, e.name as event_name, e.points as event_points, e.id as event_id FROM event_applications a JOIN events e ON e.id=a.event_id WHERE a.user_id=? ORDER BY a.id DESC",
         (u["id"],),
@@ -194,6 +497,7 @@ def profile():
     return render_template(
         "profile.html",
         universities=universities,
+        is_subscribed=bool(sub and sub["is_subscribed"]),
         my_event_apps=my_event_apps,
         my_task_apps=my_task_apps,
         my_event_reports=my_event_reports,
@@ -202,29 +506,37 @@ def profile():
 
 @bp.route("/events")
 def events():
-    db = get_db()
-    events = db.execute(
-        "SELECT e.*, (SELECT COUNT(1) FROM event_applications a WHERE a.event_id=e.id AND a.status IN (?, ?)) as appl_count FROM events e ORDER BY e.start_time IS NULL, e.start_time DESC, e.id DESC",
-        (APP_PENDING, APP_APPROVED),
-    ).fetchall()
-    return render_template("events.html", events=events)
+    def build():
+        page = _keyset_page(
+            get_db(),
+            "SELECT e.*, e.active_count as appl_count, COALESCE(e.start_time,'') as sort_key FROM events e WHERE 1=1",
+            (),
+            [("COALESCE(e.start_time,'')", "sort_key"), ("e.id", "id")],
+        )
+        return {"events": page["rows"], "page": page}
+    version = _table_version(get_db(), "events")
+    return _not_modified(version) or _with_etag(_cached_page("events.html", build), version)
 
 @bp.route("/events/<int:event_id>")
 def event_detail(event_id: int):
     db = get_db()
-    e = db.execute("SELECT * FROM events WHERE id=?", (event_id,)).fetchone()
-    if not e:
-        flash("Мероприятие не найдено.", "error")
-        return redirect(url_for("main.events"))
-    appl_count = db.execute(
-        "SELECT COUNT(1) c FROM event_applications WHERE event_id=? AND status IN (?, ?)",
-        (event_id, APP_PENDING, APP_APPROVED),
-    ).fetchone()["c"]
     user = current_user()
     my_app = None
     if user:
         my_app = db.execute("SELECT * FROM event_applications WHERE event_id=? AND user_id=?", (event_id, user["id"])).fetchone()
-    return render_template("event_detail.html", e=e, appl_count=appl_count, my_app=my_app)
+    my_app_state = dict(my_app) if my_app else None
+    ver = db.execute("SELECT row_version FROM events WHERE id=?", (event_id,)).fetchone()
+    if ver:
+        cached = _not_modified(ver["row_version"], my_app_state)
+        if cached:
+            return cached
+    e = db.execute("SELECT * FROM events WHERE id=?", (event_id,)).fetchone()
+    if not e:
+        flash("Мероприятие не найдено.", "error")
+        return redirect(url_for("main.events"))
+    appl_count = e["active_count"]
+    body = render_template("event_detail.html", e=e, appl_count=appl_count, my_app=my_app)
+    return _with_etag(body, e["row_version"], my_app_state)
 
 @bp.route("/events/<int:event_id>/apply", methods=["POST"])
 @login_required
@@ -236,50 +548,54 @@ def event_apply(event_id: int):
     if not e:
         flash("Мероприятие не найдено.", "error")
         return redirect(url_for("main.events"))
-    # capacity
-    appl_count = _active_app_count(db, "event", event_id)
-    if e["max_participants"] and appl_count >= e["max_participants"]:
-        flash("Достигнут лимит участников.", "error")
-        return redirect(url_for("main.event_detail", event_id=event_id))
-
     needs_release = 1 if request.form.get("needs_release") == "1" else 0
     needs_hours = 1 if request.form.get("needs_volunteer_hours") == "1" else 0
-    try:
-        db.execute(
-            "INSERT INTO event_applications(event_id,user_id,needs_release,needs_volunteer_hours,status,created_at) VALUES(?,?,?,?,?,?)",
-            (event_id, u["id"], needs_release, needs_hours, APP_PENDING, now_iso()),
-        )
-        db.commit()
+    result = _reserve_seat(
+        db, "event", event_id, u["id"],
+        {"needs_release": needs_release, "needs_volunteer_hours": needs_hours},
+    )
+    if result == SEAT_OK:
+        _invalidate_pages()
         flash("Заявка отправлена и ожидает подтверждения.", "success")
-    except Exception:
+    elif result == SEAT_FULL:
+        flash("Достигнут лимит участников.", "error")
+    else:
         flash("Заявка уже существует.", "error")
     return redirect(url_for("main.event_detail", event_id=event_id))
 
 @bp.route("/tasks")
 def tasks():
-    db = get_db()
-    tasks = db.execute(
-        "SELECT t.*, (SELECT COUNT(1) FROM task_applications a WHERE a.task_id=t.id AND a.status IN (?, ?)) as appl_count FROM tasks t ORDER BY t.start_time IS NULL, t.start_time DESC, t.id DESC",
-        (APP_PENDING, APP_APPROVED),
-    ).fetchall()
-    return render_template("tasks.html", tasks=tasks)
+    def build():
+        page = _keyset_page(
+            get_db(),
+            "SELECT t.*, t.active_count as appl_count, COALESCE(t.start_time,'') as sort_key FROM tasks t WHERE 1=1",
+            (),
+            [("COALESCE(t.start_time,'')", "sort_key"), ("t.id", "id")],
+        )
+        return {"tasks": page["rows"], "page": page}
+    version = _table_version(get_db(), "tasks")
+    return _not_modified(version) or _with_etag(_cached_page("tasks.html", build), version)
 
 @bp.route("/tasks/<int:task_id>")
 def task_detail(task_id: int):
     db = get_db()
-    t = db.execute("SELECT * FROM tasks WHERE id=?", (task_id,)).fetchone()
-    if not t:
-        flash("Задание не найдено.", "error")
-        return redirect(url_for("main.tasks"))
-    appl_count = db.execute(
-        "SELECT COUNT(1) c FROM task_applications WHERE task_id=? AND status IN (?, ?)",
-        (task_id, APP_PENDING, APP_APPROVED),
-    ).fetchone()["c"]
     user = current_user()
     my_app = None
     if user:
         my_app = db.execute("SELECT * FROM task_applications WHERE task_id=? AND user_id=?", (task_id, user["id"])).fetchone()
-    return render_template("task_detail.html", t=t, appl_count=appl_count, my_app=my_app)
+    my_app_state = dict(my_app) if my_app else None
+    ver = db.execute("SELECT row_version FROM tasks WHERE id=?", (task_id,)).fetchone()
+    if ver:
+        cached = _not_modified(ver["row_version"], my_app_state)
+        if cached:
+            return cached
+    t = db.execute("SELECT * FROM tasks WHERE id=?", (task_id,)).fetchone()
+    if not t:
+        flash("Задание не найдено.", "error")
+        return redirect(url_for("main.tasks"))
+    appl_count = t["active_count"]
+    body = render_template("task_detail.html", t=t, appl_count=appl_count, my_app=my_app)
+    return _with_etag(body, t["row_version"], my_app_state)
 
 @bp.route("/tasks/<int:task_id>/apply", methods=["POST"])
 @login_required
@@ -291,18 +607,13 @@ def task_apply(task_id: int):
     if not t:
         flash("Задание не найдено.", "error")
         return redirect(url_for("main.tasks"))
-    appl_count = _active_app_count(db, "task", task_id)
-    if t["max_participants"] and appl_count >= t["max_participants"]:
-        flash("Достигнут лимит участников.", "error")
-        return redirect(url_for("main.task_detail", task_id=task_id))
-    try:
-        db.execute(
-            "INSERT INTO task_applications(task_id,user_id,status,created_at) VALUES(?,?,?,?)",
-            (task_id, u["id"], APP_PENDING, now_iso()),
-        )
-        db.commit()
+    result = _reserve_seat(db, "task", task_id, u["id"])
+    if result == SEAT_OK:
+        _invalidate_pages()
         flash("Заявка отправлена и ожидает подтверждения.", "success")
-    except Exception:
+    elif result == SEAT_FULL:
+        flash("Достигнут лимит участников.", "error")
+    else:
         flash("Заявка уже существует.", "error")
     return redirect(url_for("main.task_detail", task_id=task_id))
 
@@ -323,18 +634,12 @@ def report_event(event_id: int):
     e = db.execute("SELECT * FROM events WHERE id=?", (event_id,)).fetchone()
     if request.method == "POST":
         report_text = (request.form.get("report_text") or "").strip()
-        file = request.files.get("media")
-        media_path = None
-        if file and file.filename:
-            fn = secure_filename(file.filename)
-            media_path = os.path.join(_upload_dir(), f"event_{event_id}_user_{u['id']}_{fn}")
-            file.save(media_path)
         try:
-            db.execute(
-                "INSERT INTO event_reports(event_id,user_id,report_text,media_path,created_at) VALUES(?,?,?,?,?)",
-                (event_id, u["id"], report_text, media_path, now_iso()),
+            _insert_report(
+                "event_reports",
+                {"event_id": event_id, "user_id": u["id"], "report_text": report_text, "created_at": now_iso()},
+                request.files.get("media"),
             )
-            db.commit()
             flash("Отчёт отправлен.", "success")
         except Exception:
             flash("Отчёт уже существует. Обновление пока не реализовано в MVP.", "error")
@@ -357,24 +662,21 @@ def report_task(task_id: int):
     t = db.execute("SELECT * FROM tasks WHERE id=?", (task_id,)).fetchone()
     if request.method == "POST":
         report_text = (request.form.get("report_text") or "").strip()
-        file = request.files.get("media")
-        media_path = None
-        if file and file.filename:
-            fn = secure_filename(file.filename)
-            media_path = os.path.join(_upload_dir(), f"task_{task_id}_user_{u['id']}_{fn}")
-            file.save(media_path)
         try:
-            db.execute(
-                "INSERT INTO task_reports(task_id,user_id,report_text,media_path,created_at) VALUES(?,?,?,?,?)",
-                (task_id, u["id"], report_text, media_path, now_iso()),
+            _insert_report(
+                "task_reports",
+                {"task_id": task_id, "user_id": u["id"], "report_text": report_text, "created_at": now_iso()},
+                request.files.get("media"),
             )
-            db.commit()
             flash("Отчёт отправлен.", "success")
         except Exception:
             flash("Отчёт уже существует. Обновление пока не реализовано в MVP.", "error")
         return redirect(url_for("main.profile"))
     return render_template("report_form.html", kind="task", item=t)
 
+# Types that are safe to show inline; everything else is served as a download.
+INLINE_MIME_PREFIXES = ("image/", "video/", "audio/", "application/pdf")
+
 @bp.route("/uploads/<path:filename>")
 @login_required
 def uploads(filename):
@@ -392,42 +694,25 @@ def uploads(filename):
     db = get_db()
     me = current_user()
 
-    # Reports may store media_path as a full path or as a filename; cover both.
-    like = f"%/{safe_name}"
+    # Reports may store media_path as a full path or as a filename; both are
+    # matched on their basename through the expression index (db.media_name_sql).
+    name_expr = media_name_sql("r.media_path")
     row = db.execute(
-        """
+        f"""
         SELECT r.user_id as owner_id, e.created_by as created_by
         FROM event_reports r
         JOIN events e ON e.id=r.event_id
-        WHERE r.media_path = ? OR r.media_path LIKE ?
+        WHERE {name_expr} = ?
         UNION ALL
         SELECT r.user_id as owner_id, t.created_by as created_by
         FROM task_reports r
         JOIN tasks t ON t.id=r.task_id
-        WHERE r.media_path = ? OR r.media_path LIKE ?
+        WHERE {name_expr} = ?
         LIMIT 1
         """,
-        (filename, like, filename, like),
+        (safe_name, safe_name),
     ).fetchone()
 
-    if not row:
-        # As a fallback, try by basename only (older data / templates)
-        row = db.execute(
-            """
-            SELECT r.user_id as owner_id, e.created_by as created_by
-            FROM event_reports r
-            JOIN events e ON e.id=r.event_id
-            WHERE r.media_path LIKE ?
-            UNION ALL
-            SELECT r.user_id as owner_id, t.created_by as created_by
-            FROM task_reports r
-            JOIN tasks t ON t.id=r.task_id
-            WHERE r.media_path LIKE ?
-            LIMIT 1
-            """,
-            (like, like),
-        ).fetchone()
-
     if not row:
         flash("Файл не найден.", "error")
         return redirect(url_for("main.index"))
@@ -445,7 +730,129 @@ def uploads(filename):
         return redirect(url_for("main.index"))
 
     # Only serve from uploads directory using a normalized basename (prevents traversal).
-    return send_from_directory(_upload_dir(), safe_name)
+    root = _upload_dir()
+    path = os.path.join(root, safe_name)
+    if not os.path.isfile(path):
+        flash("Файл не найден.", "error")
+        return redirect(url_for("main.index"))
+    st = os.stat(path)
+    mime = storage.guess_mime(safe_name)
+    return serve_file(
+        path, root, mime, safe_name, f"{int(st.st_mtime)}-{st.st_size}",
+        inline=mime.startswith(INLINE_MIME_PREFIXES),
+    )
+
+def _viewable_attachment(attachment_id: int):
+    """Return the attachments row if the current user may see it, else None.
+
+    Allowed: admin, or the owner / item organizer of any report using the file.
+    """
+    db = get_db()
+    me = current_user()
+    att = db.execute("SELECT * FROM attachments WHERE id=?", (attachment_id,)).fetchone()
+    if att is None or me["role"] == "admin":
+        return att
+    allowed = db.execute(
+        """
+        SELECT 1 FROM event_reports r JOIN events e ON e.id=r.event_id
+        WHERE r.attachment_id=? AND (r.user_id=? OR (e.created_by=? AND ?='organizer'))
+        UNION ALL
+        SELECT 1 FROM task_reports r JOIN tasks t ON t.id=r.task_id
+        WHERE r.attachment_id=? AND (r.user_id=? OR (t.created_by=? AND ?='organizer'))
+        LIMIT 1
+        """,
+        (attachment_id, me["id"], me["id"], me["role"]) * 2,
+    ).fetchone()
+    return att if allowed else None
+
+@bp.route("/attachments/<int:attachment_id>")
+@login_required
+def attachment(attachment_id: int):
+    att = _viewable_attachment(attachment_id)
+    if att is None:
+        flash("Файл не найден или недостаточно прав.", "error")
+        return redirect(url_for("main.index"))
+    root = _upload_dir()
+    return serve_file(
+        storage.blob_path(root, att["sha256"]), root, att["mime"], att["original_name"] or att["sha256"],
+        att["sha256"], inline=att["mime"].startswith(INLINE_MIME_PREFIXES),
+    )
+
+# Shown while a thumbnail is still being generated (or cannot be).
+THUMB_PLACEHOLDER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="96" height="72" viewBox="0 0 96 72">'
+    '<rect width="96" height="72" rx="8" fill="#e9efe9"/>'
+    '<text x="48" y="42" font-size="12" text-anchor="middle" fill="#7a8a7a">превью…</text></svg>'
+)
+
+@bp.route("/attachments/<int:attachment_id>/thumb")
+@login_required
+def attachment_thumb(attachment_id: int):
+    att = _viewable_attachment(attachment_id)
+    if att is None:
+        return "", 404
+    pool = current_app.extensions["thumbnails"]
+    path = pool.path(att["sha256"])
+    if not os.path.exists(path):
+        # Not generated yet (e.g. uploaded before the pipeline existed): queue it.
+        pool.schedule(att["sha256"], att["mime"])
+        resp = make_response(THUMB_PLACEHOLDER_SVG)
+        resp.mimetype = "image/svg+xml"
+        resp.headers["Cache-Control"] = "no-store"
+        return resp
+    root = _upload_dir()
+    return serve_file(path, root, "image/jpeg", f"thumb-{attachment_id}.jpg", f"{att['sha256']}-{pool.size}")
+
+# --- Moderation tab counters ---
+# Report statuses in DB: 'принят' or 'отклонен'/'отклонён' or any other value meaning "на проверке".
+REPORT_APPROVED = ("принят",)
+REPORT_REJECTED = ("отклонен", "отклонён")
+
+
+def _status_counts(db, kind: str, what: str, owner_id=None) -> dict:
+    """{status: count} for event/task applications or reports in one grouped query.
+
+    With owner_id only rows for items created by that user are counted.
+    """
+    table, items = f"{kind}_{what}", f"{kind}s"
+    if owner_id is None:
+        rows = db.execute(f"SELECT status, COUNT(1) as c FROM {table} GROUP BY status")
+    else:
+        rows = db.execute(
+            f"SELECT x.status as status, COUNT(1) as c FROM {items} i JOIN {table} x ON x.{kind}_id=i.id "
+            "WHERE i.created_by=? GROUP BY x.status",
+            (owner_id,),
+        )
+    return {r["status"]: r["c"] for r in rows}
+
+
+def _bucket(what: str, status: str) -> str:
+    if what == "applications":
+        return {APP_PENDING: "pending", APP_APPROVED: "approved", APP_REJECTED: "rejected"}.get(status, "other")
+    if status in REPORT_APPROVED:
+        return "approved"
+    if status in REPORT_REJECTED:
+        return "rejected"
+    return "pending"
+
+
+def _tab_counts(db, what: str) -> dict:
+    """Tab counters for the current moderator: {tab: {"events": n, "tasks": n}}.
+
+    Two queries in total (one per table), whatever the number of tabs.
+    """
+    u = current_user()
+    owner_id = None if u["role"] == "admin" else u["id"]
+    counts = {tab: {"events": 0, "tasks": 0} for tab in ("pending", "approved", "rejected", "all")}
+    for kind in ("event", "task"):
+        col = f"{kind}s"
+        for status, n in _status_counts(db, kind, what, owner_id).items():
+            bucket = _bucket(what, status)
+            if bucket in counts:
+                counts[bucket][col] += n
+            counts["all"][col] += n
+    return counts
+
 
 # Organizer/Admin: create content
 @bp.route("/manage")
@@ -458,43 +865,11 @@ def manage():
     pending_reports = 0
 
     if u and u["role"] in ("admin","organizer"):
-        if u["role"] == "admin":
-            # all items
-            pending_apps = db.execute(
-                "SELECT (SELECT COUNT(1) FROM event_applications WHERE status=?) + (SELECT COUNT(1) FROM task_applications WHERE status=?) as c",
-                (APP_PENDING, APP_PENDING),
-            ).fetchone()["c"]
-            pending_reports = db.execute(
-                "SELECT (SELECT COUNT(1) FROM event_reports WHERE status NOT IN ('принят')) + (SELECT COUNT(1) FROM task_reports WHERE status NOT IN ('принят')) as c"
-            ).fetchone()["c"]
-        else:
-            # only own items
-            pending_apps = db.execute(
-                """
-                SELECT
-                  (SELECT COUNT(1) FROM event_applications a
-                     JOIN events e ON e.id=a.event_id
-                    WHERE a.status=? AND e.created_by=?)
-                + (SELECT COUNT(1) FROM task_applications a
-                     JOIN tasks t ON t.id=a.task_id
-                    WHERE a.status=? AND t.created_by=?)
-                AS c
-                """,
-                (APP_PENDING, u["id"], APP_PENDING, u["id"]),
-            ).fetchone()["c"]
-            pending_reports = db.execute(
-                """
-                SELECT
-                  (SELECT COUNT(1) FROM event_reports r
-                     JOIN events e ON e.id=r.event_id
-                    WHERE r.status NOT IN ('принят') AND e.created_by=?)
-                + (SELECT COUNT(1) FROM task_reports r
-                     JOIN tasks t ON t.id=r.task_id
-                    WHERE r.status NOT IN ('принят') AND t.created_by=?)
-                AS c
-                """,
-                (u["id"], u["id"]),
-            ).fetchone()["c"]
+        # Admin: all items; organizer: only own items (see _tab_counts).
+        apps = _tab_counts(db, "applications")["pending"]
+        reports = _tab_counts(db, "reports")["pending"]
+        pending_apps = apps["events"] + apps["tasks"]
+        pending_reports = reports["events"] + reports["tasks"]
 
     return render_template("manage.html", pending_apps=pending_apps, pending_reports=pending_reports)
 
@@ -524,72 +899,42 @@ def manage_applications():
     params_e_status = () if status_value is None else (status_value,)
     params_t_status = () if status_value is None else (status_value,)
 
-    event_apps = db.execute(
+    event_page = _keyset_page(
+        db,
         f"""
         SELECT a.*, e.name as item_name, e.start_time, e.end_time, u.username as username
         FROM event_applications a
         JOIN events e ON e.id=a.event_id
         JOIN users u ON u.id=a.user_id
         WHERE 1=1 {where_status_e} {event_filter}
-        ORDER BY a.id DESC
         """,
         params_e_status + params_e_owner,
-    ).fetchall()
+        [("a.id", "id")],
+        prefix="e_",
+    )
 
-    task_apps = db.execute(
+    task_page = _keyset_page(
+        db,
         f"""
         SELECT a.*, t.name as item_name, u.username as username
         FROM task_applications a
         JOIN tasks t ON t.id=a.task_id
         JOIN users u ON u.id=a.user_id
         WHERE 1=1 {where_status_t} {task_filter}
-        ORDER BY a.id DESC
         """,
         params_t_status + params_t_owner,
-    ).fetchall()
-
-    # Counters for tabs
-    def _count_event(st):
-        if u["role"] == "admin":
-            if st is None:
-                return db.execute("SELECT COUNT(1) as c FROM event_applications").fetchone()["c"]
-            return db.execute("SELECT COUNT(1) as c FROM event_applications WHERE status=?", (st,)).fetchone()["c"]
-        if st is None:
-            return db.execute(
-                "SELECT COUNT(1) as c FROM event_applications a JOIN events e ON e.id=a.event_id WHERE e.created_by=?",
-                (u["id"],),
-            ).fetchone()["c"]
-        return db.execute(
-            "SELECT COUNT(1) as c FROM event_applications a JOIN events e ON e.id=a.event_id WHERE a.status=? AND e.created_by=?",
-            (st, u["id"]),
-        ).fetchone()["c"]
-
-    def _count_task(st):
-        if u["role"] == "admin":
-            if st is None:
-                return db.execute("SELECT COUNT(1) as c FROM task_applications").fetchone()["c"]
-            return db.execute("SELECT COUNT(1) as c FROM task_applications WHERE status=?", (st,)).fetchone()["c"]
-        if st is None:
-            return db.execute(
-                "SELECT COUNT(1) as c FROM task_applications a JOIN tasks t ON t.id=a.task_id WHERE t.created_by=?",
-                (u["id"],),
-            ).fetchone()["c"]
-        return db.execute(
-            "SELECT COUNT(1) as c FROM task_applications a JOIN tasks t ON t.id=a.task_id WHERE a.status=? AND t.created_by=?",
-            (st, u["id"]),
-        ).fetchone()["c"]
+        [("a.id", "id")],
+        prefix="t_",
+    )
 
-    counts = {
-        "pending": {"events": _count_event(APP_PENDING), "tasks": _count_task(APP_PENDING)},
-        "approved": {"events": _count_event(APP_APPROVED), "tasks": _count_task(APP_APPROVED)},
-        "rejected": {"events": _count_event(APP_REJECTED), "tasks": _count_task(APP_REJECTED)},
-        "all": {"events": _count_event(None), "tasks": _count_task(None)},
-    }
+    counts = _tab_counts(db, "applications")
 
     return render_template(
         "manage_applications.html",
-        event_apps=event_apps,
-        task_apps=task_apps,
+        event_apps=event_page["rows"],
+        task_apps=task_page["rows"],
+        event_page=event_page,
+        task_page=task_page,
         status=status,
         counts=counts,
     )
@@ -603,9 +948,6 @@ def manage_reports():
     u = current_user()
 
     status = (request.args.get("status") or "pending").strip().lower()
-    # Report statuses in DB: 'принят' or 'отклонен'/'отклонён' or any other value meaning "на проверке".
-    approved = "принят"
-    rejected_vals = ("отклонен", "отклонён")
 
     def build_where(alias: str):
         if status == "approved":
@@ -624,66 +966,47 @@ def manage_reports():
     w_event = build_where("r")
     w_task = build_where("r")
 
-    event_reports = db.execute(
+    event_page = _keyset_page(
+        db,
         f"""
-        SELECT r.*, e.name as item_name, u.username as username, e.created_by as created_by
+        SELECT r.*, e.name as item_name, u.username as username, e.created_by as created_by, a.mime as media_mime
         FROM event_reports r
         JOIN events e ON e.id=r.event_id
         JOIN users u ON u.id=r.user_id
+        LEFT JOIN attachments a ON a.id=r.attachment_id
         WHERE 1=1 {w_event} {owner_event}
-        ORDER BY r.id DESC
         """,
         owner_params,
-    ).fetchall()
+        [("r.id", "id")],
+        prefix="e_",
+    )
 
-    task_reports = db.execute(
+    task_page = _keyset_page(
+        db,
         f"""
-        SELECT r.*, t.name as item_name, u.username as username, t.created_by as created_by
+        SELECT r.*, t.name as item_name, u.username as username, t.created_by as created_by, a.mime as media_mime
         FROM task_reports r
         JOIN tasks t ON t.id=r.task_id
         JOIN users u ON u.id=r.user_id
+        LEFT JOIN attachments a ON a.id=r.attachment_id
         WHERE 1=1 {w_task} {owner_task}
-        ORDER BY r.id DESC
         """,
         owner_params,
-    ).fetchall()
-
-    # For UI: keep accepted reports compact (latest 10 per section) on 'all' or 'approved' views.
-    if status in ("all", "approved"):
-        event_reports = event_reports[:10] if status == "approved" else (
-            [r for r in event_reports if r["status"] != "принят"] + [r for r in event_reports if r["status"] == "принят"][:10]
-        )
-        task_reports = task_reports[:10] if status == "approved" else (
-            [r for r in task_reports if r["status"] != "принят"] + [r for r in task_reports if r["status"] == "принят"][:10]
-        )
+        [("r.id", "id")],
+        prefix="t_",
+    )
 
-    # Counts for tabs
-    def count_reports(kind: str, st: str):
-        if kind == "event":
-            base = "FROM event_reports r JOIN events e ON e.id=r.event_id WHERE 1=1"
-            owner = "" if u["role"] == "admin" else "AND e.created_by=?"
-        else:
-            base = "FROM task_reports r JOIN tasks t ON t.id=r.task_id WHERE 1=1"
-            owner = "" if u["role"] == "admin" else "AND t.created_by=?"
-        params = () if u["role"] == "admin" else (u["id"],)
-        if st == "approved":
-            where = "AND r.status='принят'"
-        elif st == "rejected":
-            where = "AND r.status IN ('отклонен','отклонён')"
-        elif st == "all":
-            where = ""
-        else:
-            where = "AND r.status NOT IN ('принят','отклонен','отклонён')"
-        return db.execute(f"SELECT COUNT(1) as c {base} {where} {owner}", params).fetchone()["c"]
-
-    counts = {
-        "pending": {"events": count_reports("event", "pending"), "tasks": count_reports("task", "pending")},
-        "approved": {"events": count_reports("event", "approved"), "tasks": count_reports("task", "approved")},
-        "rejected": {"events": count_reports("event", "rejected"), "tasks": count_reports("task", "rejected")},
-        "all": {"events": count_reports("event", "all"), "tasks": count_reports("task", "all")},
-    }
+    counts = _tab_counts(db, "reports")
 
-    return render_template("manage_reports.html", event_reports=event_reports, task_reports=task_reports, status=status, counts=counts)
+    return render_template(
+        "manage_reports.html",
+        event_reports=event_page["rows"],
+        task_reports=task_page["rows"],
+        event_page=event_page,
+        task_page=task_page,
+        status=status,
+        counts=counts,
+    )
 
 def _can_moderate_report(created_by: int) -> bool:
     me = current_user()
@@ -812,7 +1135,7 @@ def _delete_report_file(table: str, report_id: int) -> bool:
 
     if table == "event_reports":
         row = db.execute(
-            """SELECT r.id, r.media_path, e.created_by
+            """SELECT r.id, r.media_path, r.attachment_id, e.created_by
                FROM event_reports r
                JOIN events e ON e.id=r.event_id
                WHERE r.id=?""",
@@ -820,7 +1143,7 @@ def _delete_report_file(table: str, report_id: int) -> bool:
         ).fetchone()
     else:
         row = db.execute(
-            """SELECT r.id, r.media_path, t.created_by
+            """SELECT r.id, r.media_path, r.attachment_id, t.created_by
                FROM task_reports r
                JOIN tasks t ON t.id=r.task_id
                WHERE r.id=?""",
@@ -831,30 +1154,38 @@ def _delete_report_file(table: str, report_id: int) -> bool:
         return False
     if not _can_moderate_report(row["created_by"]):
         return False
+    if row["attachment_id"]:
+        # Shared blob: drop this reference, delete the file only if it was the last one.
+        with immediate_transaction(db):
+            db.execute(f"UPDATE {table} SET attachment_id=NULL, media_path=NULL WHERE id=?", (report_id,))
+            storage.release_if_orphan(db, _upload_dir(), row["attachment_id"])
+        return True
     media_path = row["media_path"]
     if not media_path:
         # nothing to delete, but keep it idempotent
         return True
 
-    # Compute safe path inside uploads dir.
-    uploads_dir = os.path.realpath(_upload_dir())
-    candidate = media_path
-    # If stored as filename, join uploads dir; if full path, keep but validate.
-    if os.path.basename(candidate) == candidate:
-        candidate = os.path.join(uploads_dir, candidate)
-    candidate_real = os.path.realpath(candidate)
-    if candidate_real.startswith(uploads_dir + os.sep) or candidate_real == uploads_dir:
-        try:
-            if os.path.exists(candidate_real) and os.path.isfile(candidate_real):
-                os.remove(candidate_real)
-        except OSError:
-            pass
-
-    db.execute(f"UPDATE {table} SET media_path=NULL WHERE id=?", (report_id,))
-    db.commit()
+    # The file itself is removed by a job worker once the reference is gone.
+    with immediate_transaction(db):
+        db.execute(f"UPDATE {table} SET media_path=NULL WHERE id=?", (report_id,))
+        jobs.enqueue(db, "remove_upload", {"name": os.path.basename(media_path)})
     return True
 
 
+@jobs.task("remove_upload", timeout=60)
+def _remove_upload_job(payload):
+    # Legacy media only; the name is confined to the uploads dir.
+    path = storage.legacy_media_file(_upload_dir(), payload.get("name") or "")
+    if path:
+        storage.discard(path)
+
+
+@jobs.task("gc_uploads", timeout=600, every=3600)
+def _gc_uploads_job(payload):
+    # Attachments orphaned by cascading deletes of events/tasks, stray blobs and spool files.
+    return {"removed": storage.collect_garbage(get_db(), _upload_dir())}
+
+
 @bp.route("/manage/reports/event/<int:report_id>/delete_file", methods=["POST"])
 @login_required
 @roles_required("admin", "organizer")
@@ -873,10 +1204,32 @@ def manage_delete_task_report_file(report_id: int):
     return redirect(url_for("main.manage_reports"))
 
 
+def _approve_failure(db, table: str, app_id: int):
+    """Explain why the conditional approve UPDATE touched no rows."""
+    row = db.execute(f"SELECT status FROM {table} WHERE id=?", (app_id,)).fetchone()
+    if not row:
+        return False, "Заявка не найдена."
+    if row["status"] != APP_PENDING:
+        return False, "Заявка уже обработана."
+    return False, "Лимит участников уже заполнен."
+
+
+# Approve a pending application only while the item still has a free seat.
+# approved_count is kept by triggers, so the check also holds for several
+# approvals inside one transaction (bulk moderation).
+_APPROVE_APPLICATION_SQL = {
+    kind: (
+        f"UPDATE {kind}_applications SET status=? WHERE id=? AND status=? AND "
+        f"(SELECT COALESCE(i.max_participants,0)=0 OR i.approved_count < i.max_participants FROM {items} i WHERE i.id={kind}_applications.{kind}_id)"
+    )
+    for kind, items in (("event", "events"), ("task", "tasks"))
+}
+
+
 def _approve_event_application(app_id: int):
     db = get_db()
     row = db.execute(
-        "SELECT a.*, e.max_participants, e.created_by FROM event_applications a JOIN events e ON e.id=a.event_id WHERE a.id=?",
+        "SELECT a.*, e.max_participants, e.created_by, e.approved_count FROM event_applications a JOIN events e ON e.id=a.event_id WHERE a.id=?",
         (app_id,),
     ).fetchone()
     if not row:
@@ -886,21 +1239,24 @@ def _approve_event_application(app_id: int):
     if row["status"] != APP_PENDING:
         return False, "Заявка уже обработана."
     # capacity check counts only approved
-    approved_count = db.execute(
-        "SELECT COUNT(1) c FROM event_applications WHERE event_id=? AND status=?",
-        (row["event_id"], APP_APPROVED),
-    ).fetchone()["c"]
+    approved_count = row["approved_count"]
     if row["max_participants"] and int(approved_count or 0) >= int(row["max_participants"] or 0):
         return False, "Лимит участников уже заполнен."
-    db.execute("UPDATE event_applications SET status=? WHERE id=?", (APP_APPROVED, app_id))
-    db.commit()
+    # Re-check status and capacity atomically with the write (another worker may have raced us).
+    with immediate_transaction(db):
+        cur = db.execute(_APPROVE_APPLICATION_SQL["event"], (APP_APPROVED, app_id, APP_PENDING))
+        if cur.rowcount == 1:
+            notify.application_status(db, "event", app_id, APP_APPROVED)
+    if cur.rowcount != 1:
+        return _approve_failure(db, "event_applications", app_id)
+    _invalidate_pages()
     return True, "Заявка подтверждена."
 
 
 def _approve_task_application(app_id: int):
     db = get_db()
     row = db.execute(
-        "SELECT a.*, t.max_participants, t.created_by FROM task_applications a JOIN tasks t ON t.id=a.task_id WHERE a.id=?",
+        "SELECT a.*, t.max_participants, t.created_by, t.approved_count FROM task_applications a JOIN tasks t ON t.id=a.task_id WHERE a.id=?",
         (app_id,),
     ).fetchone()
     if not row:
@@ -909,14 +1265,16 @@ def _approve_task_application(app_id: int):
         return False, "Недостаточно прав."
     if row["status"] != APP_PENDING:
         return False, "Заявка уже обработана."
-    approved_count = db.execute(
-        "SELECT COUNT(1) c FROM task_applications WHERE task_id=? AND status=?",
-        (row["task_id"], APP_APPROVED),
-    ).fetchone()["c"]
+    approved_count = row["approved_count"]
     if row["max_participants"] and int(approved_count or 0) >= int(row["max_participants"] or 0):
         return False, "Лимит участников уже заполнен."
-    db.execute("UPDATE task_applications SET status=? WHERE id=?", (APP_APPROVED, app_id))
-    db.commit()
+    with immediate_transaction(db):
+        cur = db.execute(_APPROVE_APPLICATION_SQL["task"], (APP_APPROVED, app_id, APP_PENDING))
+        if cur.rowcount == 1:
+            notify.application_status(db, "task", app_id, APP_APPROVED)
+    if cur.rowcount != 1:
+        return _approve_failure(db, "task_applications", app_id)
+    _invalidate_pages()
     return True, "Заявка подтверждена."
 
 
@@ -944,8 +1302,10 @@ def manage_reject_event_application(app_id: int):
     if not _is_manager_for_item({"created_by": row["created_by"]}):
         flash("Недостаточно прав.", "error")
         return redirect(url_for("main.manage_applications"))
-    db.execute("UPDATE event_applications SET status=? WHERE id=?", (APP_REJECTED, app_id))
-    db.commit()
+    with immediate_transaction(db):
+        db.execute("UPDATE event_applications SET status=? WHERE id=?", (APP_REJECTED, app_id))
+        notify.application_status(db, "event", app_id, APP_REJECTED)
+    _invalidate_pages()
     flash("Заявка отклонена.", "success")
     return redirect(url_for("main.manage_applications"))
 
@@ -974,8 +1334,10 @@ def manage_reject_task_application(app_id: int):
     if not _is_manager_for_item({"created_by": row["created_by"]}):
         flash("Недостаточно прав.", "error")
         return redirect(url_for("main.manage_applications"))
-    db.execute("UPDATE task_applications SET status=? WHERE id=?", (APP_REJECTED, app_id))
-    db.commit()
+    with immediate_transaction(db):
+        db.execute("UPDATE task_applications SET status=? WHERE id=?", (APP_REJECTED, app_id))
+        notify.application_status(db, "task", app_id, APP_REJECTED)
+    _invalidate_pages()
     flash("Заявка отклонена.", "success")
     return redirect(url_for("main.manage_applications"))
 
@@ -995,11 +1357,13 @@ def event_new():
         if not name:
             flash("Название обязательно.", "error")
             return render_template("event_edit.html", e=None)
-        db.execute(
+        event_id = db.execute(
             "INSERT INTO events(name,description,link,points,start_time,end_time,max_participants,created_by,created_at) VALUES(?,?,?,?,?,?,?,?,?)",
             (name, description, link, points, start_time, end_time, max_participants, current_user()["id"], now_iso()),
-        )
+        ).lastrowid
+        notify.new_item(db, "event", event_id)
         db.commit()
+        _invalidate_pages()
         flash("Мероприятие создано.", "success")
         return redirect(url_for("main.events"))
     return render_template("event_edit.html", e=None)
@@ -1033,6 +1397,7 @@ def event_edit(event_id: int):
             (name, description, link, points, start_time, end_time, max_participants, event_id),
         )
         db.commit()
+        _invalidate_pages()
         flash("Мероприятие обновлено.", "success")
         return redirect(url_for("main.event_detail", event_id=event_id))
     return render_template("event_edit.html", e=e)
@@ -1052,6 +1417,7 @@ def event_delete(event_id: int):
         return redirect(url_for("main.event_detail", event_id=event_id))
     db.execute("DELETE FROM events WHERE id=?", (event_id,))
     db.commit()
+    _invalidate_pages()
     flash("Мероприятие удалено.", "success")
     return redirect(url_for("main.events"))
 
@@ -1070,11 +1436,13 @@ def task_new():
         if not name:
             flash("Название обязательно.", "error")
             return render_template("task_edit.html", t=None)
-        db.execute(
+        task_id = db.execute(
             "INSERT INTO tasks(name,description,points,start_time,end_time,max_participants,created_by,created_at) VALUES(?,?,?,?,?,?,?,?)",
             (name, description, points, start_time, end_time, max_participants, current_user()["id"], now_iso()),
-        )
+        ).lastrowid
+        notify.new_item(db, "task", task_id)
         db.commit()
+        _invalidate_pages()
         flash("Задание создано.", "success")
         return redirect(url_for("main.tasks"))
     return render_template("task_edit.html", t=None)
@@ -1107,6 +1475,7 @@ def task_edit(task_id: int):
             (name, description, points, start_time, end_time, max_participants, task_id),
         )
         db.commit()
+        _invalidate_pages()
         flash("Задание обновлено.", "success")
         return redirect(url_for("main.task_detail", task_id=task_id))
     return render_template("task_edit.html", t=t)
@@ -1126,6 +1495,7 @@ def task_delete(task_id: int):
         return redirect(url_for("main.task_detail", task_id=task_id))
     db.execute("DELETE FROM tasks WHERE id=?", (task_id,))
     db.commit()
+    _invalidate_pages()
     flash("Задание удалено.", "success")
     return redirect(url_for("main.tasks"))
 
@@ -1136,31 +1506,54 @@ def task_delete(task_id: int):
 def admin_panel():
     db = get_db()
     q = (request.args.get("q") or "").strip()
-    if q:
-        like = f"%{q.lower()}%"
-        users = db.execute(
+    match = fts_query(q)
+    if match:
+        users_page = _keyset_page(
+            db,
             """
             SELECT u.*, COALESCE(un.name,'') as university_name
             FROM users u
             LEFT JOIN universities un ON un.id=u.university_id
-            WHERE LOWER(u.username) LIKE ? OR LOWER(COALESCE(u.full_name,'')) LIKE ?
-            ORDER BY u.id DESC
-            LIMIT 200
+            WHERE u.id IN (SELECT rowid FROM users_fts WHERE users_fts MATCH ?)
             """,
-            (like, like),
-        ).fetchall()
+            (match,),
+            [("u.id", "id")],
+            prefix="u_",
+        )
     else:
-        users = db.execute(
-            "SELECT u.*, COALESCE(un.name,'') as university_name FROM users u LEFT JOIN universities un ON un.id=u.university_id ORDER BY u.id DESC LIMIT 200"
-        ).fetchall()
+        users_page = _keyset_page(
+            db,
+            "SELECT u.*, COALESCE(un.name,'') as university_name FROM users u LEFT JOIN universities un ON un.id=u.university_id WHERE 1=1",
+            (),
+            [("u.id", "id")],
+            prefix="u_",
+        )
     unis = db.execute("SELECT * FROM universities ORDER BY name").fetchall()
-    event_reports = db.execute(
-        "SELECT r.*, e.name as item_name, u.username as username, e.points as item_points FROM event_reports r JOIN events e ON e.id=r.event_id JOIN users u ON u.id=r.user_id ORDER BY r.status, r.id DESC"
-    ).fetchall()
-    task_reports = db.execute(
-        "SELECT r.*, t.name as item_name, u.username as username, t.points as item_points FROM task_reports r JOIN tasks t ON t.id=r.task_id JOIN users u ON u.id=r.user_id ORDER BY r.status, r.id DESC"
-    ).fetchall()
-    return render_template("admin.html", users=users, unis=unis, event_reports=event_reports, task_reports=task_reports, q=q)
+    event_page = _keyset_page(
+        db,
+        "SELECT r.*, e.name as item_name, u.username as username, e.points as item_points, a.mime as media_mime FROM event_reports r JOIN events e ON e.id=r.event_id JOIN users u ON u.id=r.user_id LEFT JOIN attachments a ON a.id=r.attachment_id WHERE 1=1",
+        (),
+        [("r.id", "id")],
+        prefix="er_",
+    )
+    task_page = _keyset_page(
+        db,
+        "SELECT r.*, t.name as item_name, u.username as username, t.points as item_points, a.mime as media_mime FROM task_reports r JOIN tasks t ON t.id=r.task_id JOIN users u ON u.id=r.user_id LEFT JOIN attachments a ON a.id=r.attachment_id WHERE 1=1",
+        (),
+        [("r.id", "id")],
+        prefix="tr_",
+    )
+    return render_template(
+        "admin.html",
+        users=users_page["rows"],
+        unis=unis,
+        event_reports=event_page["rows"],
+        task_reports=task_page["rows"],
+        users_page=users_page,
+        event_page=event_page,
+        task_page=task_page,
+        q=q,
+    )
 
 @bp.route("/admin/universities/add", methods=["POST"])
 @login_required
@@ -1258,6 +1651,7 @@ def admin_user_warn(user_id: int):
         (new_count, now_iso(), is_blocked, user_id),
     )
     db.commit()
+    invalidate_user(user_id)
     flash("Предупреждение вынесено. После 3 предупреждений пользователь блокируется.", "success")
     return redirect(url_for("main.admin_panel"))
 
@@ -1278,6 +1672,7 @@ def admin_user_toggle_block(user_id: int):
     new_val = 0 if u["is_blocked"] else 1
     db.execute("UPDATE users SET is_blocked=? WHERE id=?", (new_val, user_id))
     db.commit()
+    invalidate_user(user_id)
     flash("Статус блокировки изменён.", "success")
     return redirect(url_for("main.admin_panel"))
 
@@ -1307,17 +1702,15 @@ def admin_user_role(user_id: int):
 
     db.execute("UPDATE users SET role=? WHERE id=?", (role, user_id))
     db.commit()
+    invalidate_user(user_id)
     flash("Роль обновлена.", "success")
     return redirect(url_for("main.admin_panel"))
 
-def _award_points_once(table: str, report_id: int, user_id: int, points: int) -> bool:
-    """Award points once per report. Returns True if points were awarded."""
-    db = get_db()
-    # points_awarded column is added via lightweight migration.
-    row = db.execute(f"SELECT points_awarded FROM {table} WHERE id=?", (report_id,)).fetchone()
-    if not row:
-        return False
+def _accept_report(db, table: str, report_id: int, user_id: int, points: int) -> bool:
+    """Mark a report accepted, awarding points only the first time.
 
+    Does not commit; the caller calls invalidate_user() after its commit when
+    points were awarded."""
     # Atomically flip points_awarded from 0->1; only then add points.
     cur = db.execute(
         f"UPDATE {table} SET status='принят', points_awarded=1 WHERE id=? AND COALESCE(points_awarded,0)=0",
@@ -1325,15 +1718,27 @@ def _award_points_once(table: str, report_id: int, user_id: int, points: int) ->
     )
     if cur.rowcount == 1:
         db.execute("UPDATE users SET points = points + ? WHERE id=?", (points, user_id))
-        db.commit()
         return True
 
     # Ensure status is 'принят' even if already awarded earlier.
     db.execute(f"UPDATE {table} SET status='принят' WHERE id=?", (report_id,))
-    db.commit()
     return False
 
 
+def _award_points_once(table: str, report_id: int, user_id: int, points: int) -> bool:
+    """Award points once per report. Returns True if points were awarded."""
+    db = get_db()
+    # points_awarded column is added via lightweight migration.
+    row = db.execute(f"SELECT points_awarded FROM {table} WHERE id=?", (report_id,)).fetchone()
+    if not row:
+        return False
+    awarded = _accept_report(db, table, report_id, user_id, points)
+    db.commit()
+    if awarded:
+        invalidate_user(user_id)
+    return awarded
+
+
 @bp.route("/admin/reports/event/<int:report_id>/approve", methods=["POST"])
 @login_required
 @roles_required("admin")
@@ -1383,57 +1788,548 @@ def admin_reject_task_report(report_id: int):
     return redirect(url_for("main.admin_panel"))
 
 
+# --- Bulk moderation ---
+# One POST moderates many applications or reports inside a single write
+# transaction. Items are named "event:<id>" / "task:<id>" (form field `ids`,
+# repeated, or a JSON body {"action": ..., "ids": [...]}). The reply is a
+# per-id summary: JSON if the client asked for it, otherwise a flash message
+# and a redirect back to the list.
+BULK_MAX_IDS = 500
+BULK_RESULT_TEXT = {
+    "approved": "подтверждено",
+    "accepted": "принято",
+    "rejected": "отклонено",
+    "full": "лимит участников заполнен",
+    "processed": "уже обработано",
+    "forbidden": "нет прав",
+    "not_found": "не найдено",
+}
+BULK_OK = ("approved", "accepted", "rejected")
+
+
+def _bulk_request():
+    """Return (action, {"event": [ids], "task": [ids]}, results for malformed items)."""
+    data = request.get_json(silent=True) if request.is_json else None
+    if isinstance(data, dict):
+        action, raw = data.get("action"), data.get("ids") or []
+    else:
+        action, raw = request.form.get("action"), request.form.getlist("ids")
+    if not isinstance(raw, list) or len(raw) > BULK_MAX_IDS:
+        raise ValueError(f"Можно обработать не больше {BULK_MAX_IDS} элементов за раз.")
+    ids, bad = {"event": [], "task": []}, []
+    for item in raw:
+        kind, _, num = str(item).partition(":")
+        if kind in ids and num.isdigit():
+            if int(num) not in ids[kind]:
+                ids[kind].append(int(num))
+        else:
+            bad.append({"kind": kind, "id": num or str(item), "result": "not_found"})
+    # Oldest first, so free seats go to the earliest applicants.
+    return action, {kind: sorted(v) for kind, v in ids.items()}, bad
+
+
+def _wants_json() -> bool:
+    return request.is_json or request.accept_mimetypes.best == "application/json"
+
+
+def _bulk_response(results, endpoint: str):
+    from flask import jsonify
+    summary = {}
+    for r in results:
+        summary[r["result"]] = summary.get(r["result"], 0) + 1
+    if _wants_json():
+        return jsonify(results=results, summary=summary)
+    if summary:
+        ok = any(k in BULK_OK for k in summary)
+        flash("; ".join(f"{BULK_RESULT_TEXT[k].capitalize()}: {n}" for k, n in summary.items()), "success" if ok else "error")
+    else:
+        flash("Ничего не выбрано.", "error")
+    return redirect(url_for(endpoint, status=request.form.get("status") or None))
+
+
+def _bulk_error(message, endpoint: str):
+    if _wants_json():
+        from flask import jsonify
+        return jsonify(error=str(message)), 400
+    flash(str(message), "error")
+    return redirect(url_for(endpoint, status=request.form.get("status") or None))
+
+
+def _bulk_rows(db, sql: str, ids) -> dict:
+    return {r["id"]: r for r in db.execute(sql + " WHERE x.id IN (SELECT value FROM json_each(?))", (json.dumps(ids),))}
+
+
+@bp.route("/manage/applications/bulk", methods=["POST"])
+@login_required
+@roles_required("admin","organizer")
+def manage_applications_bulk():
+    try:
+        action, ids, results = _bulk_request()
+    except ValueError as e:
+        return _bulk_error(e, "main.manage_applications")
+    if action not in ("approve", "reject"):
+        return _bulk_error("Неизвестное действие.", "main.manage_applications")
+    db = get_db()
+    with immediate_transaction(db):
+        for kind, items in (("event", "events"), ("task", "tasks")):
+            if not ids[kind]:
+                continue
+            rows = _bulk_rows(
+                db,
+                f"SELECT x.id, x.status, i.created_by FROM {kind}_applications x JOIN {items} i ON i.id=x.{kind}_id",
+                ids[kind],
+            )
+            for app_id in ids[kind]:
+                row = rows.get(app_id)
+                if row is None:
+                    result = "not_found"
+                elif not _is_manager_for_item(row):
+                    result = "forbidden"
+                elif action == "reject":
+                    db.execute(f"UPDATE {kind}_applications SET status=? WHERE id=?", (APP_REJECTED, app_id))
+                    notify.application_status(db, kind, app_id, APP_REJECTED)
+                    result = "rejected"
+                elif row["status"] != APP_PENDING:
+                    result = "processed"
+                elif db.execute(_APPROVE_APPLICATION_SQL[kind], (APP_APPROVED, app_id, APP_PENDING)).rowcount == 1:
+                    notify.application_status(db, kind, app_id, APP_APPROVED)
+                    result = "approved"
+                else:
+                    result = "full"
+                results.append({"kind": kind, "id": app_id, "result": result})
+    if any(r["result"] in BULK_OK for r in results):
+        _invalidate_pages()
+    done = [f"{r['kind']}:{r['id']}" for r in results if r["result"] in BULK_OK]
+    audit_log(f"manage_bulk_{action}_applications", ",".join(done), f"requested={len(results)}")
+    return _bulk_response(results, "main.manage_applications")
+
+
+@bp.route("/manage/reports/bulk", methods=["POST"])
+@login_required
+@roles_required("admin", "organizer")
+def manage_reports_bulk():
+    try:
+        action, ids, results = _bulk_request()
+    except ValueError as e:
+        return _bulk_error(e, "main.manage_reports")
+    if action not in ("approve", "reject"):
+        return _bulk_error("Неизвестное действие.", "main.manage_reports")
+    db = get_db()
+    awarded_users = set()
+    with immediate_transaction(db):
+        for kind, items in (("event", "events"), ("task", "tasks")):
+            if not ids[kind]:
+                continue
+            table = f"{kind}_reports"
+            rows = _bulk_rows(
+                db,
+                f"SELECT x.id, x.user_id, i.points, i.created_by FROM {table} x JOIN {items} i ON i.id=x.{kind}_id",
+                ids[kind],
+            )
+            for report_id in ids[kind]:
+                row = rows.get(report_id)
+                entry = {"kind": kind, "id": report_id}
+                if row is None:
+                    entry["result"] = "not_found"
+                elif not _can_moderate_report(row["created_by"]):
+                    entry["result"] = "forbidden"
+                elif action == "approve":
+                    entry["points_awarded"] = _accept_report(db, table, report_id, row["user_id"], int(row["points"] or 0))
+                    entry["result"] = "accepted"
+                    if entry["points_awarded"]:
+                        awarded_users.add(row["user_id"])
+                else:
+                    db.execute(f"UPDATE {table} SET status='отклонён' WHERE id=?", (report_id,))
+                    entry["result"] = "rejected"
+                results.append(entry)
+    for user_id in awarded_users:
+        invalidate_user(user_id)
+    for r in results:
+        if r["result"] in BULK_OK:
+            audit_log(f"manage_{'approve' if action == 'approve' else 'reject'}_{r['kind']}_report", str(r["id"]), "bulk")
+    return _bulk_response(results, "main.manage_reports")
+
+
+@bp.route("/admin/cache")
+@login_required
+@roles_required("admin")
+def admin_cache_stats():
+    """Page- and user-cache hit/miss counters of the worker that serves this request."""
+    cache = get_page_cache()
+    stats = cache.stats() if cache is not None else {"backend": "off"}
+    users = current_app.extensions.get("user_cache")
+    stats["user_cache"] = users.stats() if users is not None else None
+    return stats
+
+
+@bp.route("/admin/audit")
+@login_required
+@roles_required("admin")
+def admin_audit():
+    db = get_db()
+    # Make this worker's own recent actions visible right away.
+    get_audit_writer().flush()
+    actor = (request.args.get("actor") or "").strip()
+    action = (request.args.get("action") or "").strip()
+    where, params = [], []
+    if actor:
+        where.append("a.actor = ?")
+        params.append(actor)
+    if action:
+        where.append("a.action = ?")
+        params.append(action)
+    for arg, cond in (("from", "a.created_at >= ?"), ("to", "a.created_at < date(?, '+1 day')")):
+        value = (request.args.get(arg) or "").strip()
+        if not value:
+            continue
+        try:
+            params.append(datetime.date.fromisoformat(value).isoformat())
+        except ValueError:
+            flash(f"Неверная дата: {value}", "error")
+            return redirect(url_for("main.admin_audit"))
+        where.append(cond)
+    page = _keyset_page(
+        db,
+        "SELECT a.* FROM audit_events a WHERE " + (" AND ".join(where) or "1=1"),
+        tuple(params),
+        [("a.id", "id")],
+        prefix="a_",
+    )
+    return render_template(
+        "admin_audit.html",
+        events=page["rows"],
+        page=page,
+        actor=actor,
+        action=action,
+        date_from=request.args.get("from") or "",
+        date_to=request.args.get("to") or "",
+    )
+
+
 # --- Admin exports (CSV) ---
-def _csv_response(rows, headers, filename: str):
-    import io, csv
-    si = io.StringIO()
-    w = csv.writer(si)
+# Exports are streamed: rows are read with fetchmany and encoded chunk by chunk,
+# so memory use does not grow with the table. Query parameters:
+#   from / to   - created_at date range (YYYY-MM-DD, both inclusive)
+#   since_id    - only rows with id > since_id, oldest first (incremental sync)
+#   kind        - reports only: event | task
+#   gzip=1      - force gzip (otherwise negotiated via Accept-Encoding)
+#   async=1     - write the file in a job worker instead; it appears on /admin/jobs
+EXPORT_BATCH_SIZE = 500
+
+
+def _export_filters(args, id_col: str, created_col: str):
+    """Return (where_sql, params, incremental) built from the export args."""
+    where, params = [], []
+    for arg, cond in (("from", f"{created_col} >= ?"), ("to", f"{created_col} < date(?, '+1 day')")):
+        value = (args.get(arg) or "").strip()
+        if not value:
+            continue
+        try:
+            day = datetime.date.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"Неверная дата в параметре {arg}: {value}")
+        where.append(cond)
+        params.append(day.isoformat())
+    since_id = (args.get("since_id") or "").strip()
+    if since_id:
+        if not since_id.isdigit():
+            raise ValueError(f"Неверный since_id: {since_id}")
+        where.append(f"{id_col} > ?")
+        params.append(int(since_id))
+    return (" AND ".join(where) or "1=1"), params, bool(since_id)
+
+
+def _export_users_query(args):
+    where, params, incremental = _export_filters(args, "id", "created_at")
+    headers = ["id", "username", "full_name", "role", "points", "is_blocked", "warnings_count", "created_at"]
+    sql = (
+        "SELECT id, username, full_name, role, points, is_blocked, warnings_count, created_at FROM users "
+        f"WHERE {where} ORDER BY id {'ASC' if incremental else 'DESC'}"
+    )
+    return sql, params, headers
+
+
+def _export_events_query(args):
+    where, params, incremental = _export_filters(args, "id", "created_at")
+    headers = ["id","name","points","start_time","end_time","max_participants","created_by","created_at"]
+    sql = (
+        "SELECT id, name, points, start_time, end_time, max_participants, created_by, created_at FROM events "
+        f"WHERE {where} ORDER BY id {'ASC' if incremental else 'DESC'}"
+    )
+    return sql, params, headers
+
+
+def _export_reports_query(args):
+    where, params, incremental = _export_filters(args, "r.id", "r.created_at")
+    kind = args.get("kind") or ""
+    if kind not in ("", "event", "task"):
+        raise ValueError(f"Неверный kind: {kind}")
+    parts, all_params = [], []
+    if kind in ("", "event"):
+        parts.append(
+            f"""
+            SELECT 'event' as kind, r.id as id, r.user_id as user_id, u.username as username, r.status as status, e.name as item_name, r.report_text as report_text, r.media_path as media_path, r.attachment_id as attachment_id, r.created_at as created_at
+            FROM event_reports r JOIN events e ON e.id=r.event_id JOIN users u ON u.id=r.user_id
+            WHERE {where}
+            """
+        )
+        all_params += params
+    if kind in ("", "task"):
+        parts.append(
+            f"""
+            SELECT 'task' as kind, r.id as id, r.user_id as user_id, u.username as username, r.status as status, t.name as item_name, r.report_text as report_text, r.media_path as media_path, r.attachment_id as attachment_id, r.created_at as created_at
+            FROM task_reports r JOIN tasks t ON t.id=r.task_id JOIN users u ON u.id=r.user_id
+            WHERE {where}
+            """
+        )
+        all_params += params
+    # Both orders are served by each table's own b-tree (rowid, idx_*_reports_created),
+    # so SQLite merges the two streams instead of sorting every row in a temp b-tree.
+    # since_id is per report table, so incremental exports are oldest-id first
+    # (use kind= to sync event and task reports separately).
+    order = "ORDER BY id ASC" if incremental else "ORDER BY created_at DESC"
+    headers = ["kind","id","user_id","username","status","item_name","report_text","media_path","attachment_id","created_at"]
+    return " UNION ALL ".join(parts) + order, all_params, headers
+
+
+# name -> (query builder, file name)
+EXPORTS = {
+    "users": (_export_users_query, "users.csv"),
+    "events": (_export_events_query, "events.csv"),
+    "reports": (_export_reports_query, "reports.csv"),
+}
+
+
+def _wants_gzip() -> bool:
+    if request.args.get("gzip") == "1":
+        return True
+    return request.accept_encodings["gzip"] > 0
+
+
+def _csv_chunks(cursor, headers):
+    import csv
+    import io
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    buf.write("\ufeff")  # UTF-8 BOM once, for Excel
     w.writerow(headers)
-    for r in rows:
-        w.writerow([r.get(h, "") if isinstance(r, dict) else r[h] for h in headers])
-    output = si.getvalue().encode("utf-8-sig")
-    from flask import Response
-    return Response(output, mimetype="text/csv", headers={"Content-Disposition": f"attachment; filename={filename}"})
+    while True:
+        rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+        if not rows:
+            break
+        for r in rows:
+            w.writerow([r[h] for h in headers])
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    tail = buf.getvalue()
+    if tail:
+        yield tail.encode("utf-8")
+
+
+def _gzip_chunks(chunks):
+    import zlib
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
+
+def _csv_response(cursor, headers, filename: str):
+    from flask import Response, stream_with_context
+    body = _csv_chunks(cursor, headers)
+    resp_headers = {"Content-Disposition": f"attachment; filename={filename}", "Vary": "Accept-Encoding"}
+    if _wants_gzip():
+        body = _gzip_chunks(body)
+        resp_headers["Content-Encoding"] = "gzip"
+    # Keep the request (and its pooled DB connection) alive while streaming.
+    return Response(stream_with_context(body), mimetype="text/csv", headers=resp_headers)
+
+
+def _export_error(message):
+    flash(str(message), "error")
+    return redirect(url_for("main.admin_panel"))
+
+
+def _export(name: str):
+    build, filename = EXPORTS[name]
+    try:
+        sql, params, headers = build(request.args)
+    except ValueError as e:
+        return _export_error(e)
+    audit_log(f"export_{name}", filename, request.query_string.decode("latin-1"))
+    db = get_db()
+    if request.args.get("async") == "1":
+        args = {k: v for k, v in request.args.items() if k not in ("async", "gzip")}
+        job_id = jobs.enqueue(
+            db, "export_csv",
+            {"export": name, "args": args, "gzip": request.args.get("gzip") == "1"},
+            created_by=current_user()["id"],
+        )
+        db.commit()
+        flash(f"Выгрузка {filename} поставлена в очередь (задача #{job_id}).", "success")
+        return redirect(url_for("main.admin_jobs"))
+    return _csv_response(db.execute(sql, params), headers, filename)
+
+
+@jobs.task("export_csv", timeout=1800, max_attempts=3)
+def _export_job(payload):
+    if payload.get("export") not in EXPORTS:
+        raise jobs.PermanentJobError(f"unknown export: {payload.get('export')}")
+    build, filename = EXPORTS[payload["export"]]
+    try:
+        sql, params, headers = build(payload.get("args") or {})
+    except ValueError as e:
+        raise jobs.PermanentJobError(str(e))
+    body = _csv_chunks(get_db().execute(sql, params), headers)
+    if payload.get("gzip"):
+        body = _gzip_chunks(body)
+        filename += ".gz"
+    root = jobs.exports_dir(current_app)
+    os.makedirs(root, exist_ok=True)
+    name = f"{datetime.datetime.utcnow():%Y%m%d-%H%M%S}-{os.urandom(4).hex()}-{filename}"
+    tmp = os.path.join(root, f".{name}.tmp")
+    size = 0
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in body:
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(tmp, os.path.join(root, name))
+    except BaseException:
+        storage.discard(tmp)
+        raise
+    return {"file": name, "size": size}
 
 @bp.route("/admin/export/users.csv")
 @login_required
 @roles_required("admin")
 def admin_export_users():
-    db = get_db()
-    rows = db.execute(
-        "SELECT id, username, full_name, role, points, is_blocked, warnings_count, created_at FROM users ORDER BY id DESC"
-    ).fetchall()
-    audit_log("export_users", "users.csv")
-    return _csv_response(
-        rows, 
-        ["id", "username", "full_name", "role", "points", "is_blocked", "warnings_count", "created_at"], 
-        "users.csv"
-    )
+    return _export("users")
 
 @bp.route("/admin/export/events.csv")
 @login_required
 @roles_required("admin")
 def admin_export_events():
-    db = get_db()
-    rows = db.execute("SELECT id, name, points, start_time, end_time, max_participants, created_by, created_at FROM events ORDER BY id DESC").fetchall()
-    audit_log("export_events", "events.csv")
-    return _csv_response(rows, ["id","name","points","start_time","end_time","max_participants","created_by","created_at"], "events.csv")
+    return _export("events")
 
 @bp.route("/admin/export/reports.csv")
 @login_required
 @roles_required("admin")
 def admin_export_reports():
+    return _export("reports")
+
+
+# --- Background jobs ---
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+
+def _job_result(job) -> dict:
+    try:
+        return json.loads(job["result"] or "null") or {}
+    except ValueError:
+        return {}
+
+
+@bp.app_template_global()
+def job_file(job):
+    """Name of the file a finished job produced (exports), or None."""
+    if job["status"] != "done":
+        return None
+    name = _job_result(job).get("file")
+    return name if isinstance(name, str) else None
+
+
+@bp.route("/admin/jobs")
+@login_required
+@roles_required("admin")
+def admin_jobs():
     db = get_db()
-    rows = db.execute(
-        """
-        SELECT 'event' as kind, r.id as id, r.user_id as user_id, u.username as username, r.status as status, e.name as item_name, r.report_text as report_text, r.media_path as media_path, r.created_at as created_at
-        FROM event_reports r JOIN events e ON e.id=r.event_id JOIN users u ON u.id=r.user_id
-        UNION ALL
-        SELECT 'task' as kind, r.id as id, r.user_id as user_id, u.username as username, r.status as status, t.name as item_name, r.report_text as report_text, r.media_path as media_path, r.created_at as created_at
-        FROM task_reports r JOIN tasks t ON t.id=r.task_id JOIN users u ON u.id=r.user_id
-        ORDER BY created_at DESC
-        """
-    ).fetchall()
-    audit_log("export_reports", "reports.csv")
-    return _csv_response(rows, ["kind","id","user_id","username","status","item_name","report_text","media_path","created_at"], "reports.csv")
+    status = request.args.get("status") or ""
+    name = (request.args.get("name") or "").strip()
+    where, params = [], []
+    if status in JOB_STATUSES:
+        where.append("j.status = ?")
+        params.append(status)
+    if name:
+        where.append("j.name = ?")
+        params.append(name)
+    page = _keyset_page(
+        db,
+        "SELECT j.*, u.username as created_by_name FROM jobs j LEFT JOIN users u ON u.id=j.created_by WHERE "
+        + (" AND ".join(where) or "1=1"),
+        tuple(params),
+        [("j.id", "id")],
+        prefix="j_",
+    )
+    counts = {r["status"]: r["n"] for r in db.execute("SELECT status, COUNT(1) as n FROM jobs GROUP BY status")}
+    return render_template(
+        "admin_jobs.html",
+        jobs=page["rows"],
+        page=page,
+        counts=counts,
+        statuses=JOB_STATUSES,
+        status=status,
+        name=name,
+    )
+
+
+@bp.route("/admin/jobs/<int:job_id>/retry", methods=["POST"])
+@login_required
+@roles_required("admin")
+def admin_job_retry(job_id: int):
+    db = get_db()
+    ok = jobs.retry(db, job_id)
+    db.commit()
+    if ok:
+        audit_log("job_retry", f"job:{job_id}")
+    flash("Задача снова в очереди." if ok else "Повторить можно только задачу с ошибкой.", "success" if ok else "error")
+    return redirect(url_for("main.admin_jobs"))
 
+
+@bp.route("/admin/jobs/<int:job_id>/download")
+@login_required
+@roles_required("admin")
+def admin_job_download(job_id: int):
+    from flask import send_file
+    job = get_db().execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+    name = job_file(job) if job else None
+    path = os.path.join(jobs.exports_dir(current_app), os.path.basename(name)) if name else None
+    if not path or not os.path.isfile(path):
+        flash("Файл не найден: задача не завершена или результат уже удалён.", "error")
+        return redirect(url_for("main.admin_jobs"))
+    download_name = name.split("-", 3)[-1]
+    mimetype = "application/gzip" if name.endswith(".gz") else "text/csv"
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name)
+
+
+@bp.route("/admin/perf")
+@login_required
+@roles_required("admin")
+def admin_perf():
+    perf = get_perf()
+    endpoint = (request.args.get("route") or "").strip()
+    endpoints = perf.endpoints() if perf else []
+    statements = perf.statements(endpoint or None) if perf else []
+    return render_template(
+        "admin_perf.html",
+        enabled=perf is not None,
+        endpoints=endpoints,
+        statements=statements,
+        endpoint=endpoint,
+        slow_ms=current_app.config.get("PERF_SLOW_QUERY_MS", 100),
+    )
+
+
+@bp.route("/admin/perf/reset", methods=["POST"])
+@login_required
+@roles_required("admin")
+def admin_perf_reset():
+    perf = get_perf()
+    if perf is not None:
+        perf.reset()
+        audit_log("perf_reset")
+    flash("Статистика запросов сброшена.", "success")
+    return redirect(url_for("main.admin_perf"))
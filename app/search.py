@@ -0,0 +1,105 @@
+"""Full-text search over the FTS5 indexes declared in db.FTS_SOURCES."""
+import re
+
+# Which result kinds each role may search.
+KINDS_BY_ROLE = {
+    None: ("events", "tasks"),
+    "volunteer": ("events", "tasks"),
+    "organizer": ("events", "tasks", "reports"),
+    "admin": ("events", "tasks", "reports", "users"),
+}
+
+KIND_LABELS = {
+    "events": "Мероприятия",
+    "tasks": "Задания",
+    "reports": "Отчёты",
+    "users": "Пользователи",
+}
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_MAX_TOKENS = 8
+
+
+def fts_query(q: str):
+    """Turn free user input into a safe FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term ("парк"*) and all of them must match.
+    Returns None when the input has no searchable words.
+    """
+    q = (q or "").replace("ё", "е").replace("Ё", "Е")
+    tokens = _TOKEN_RE.findall(q)[:_MAX_TOKENS]
+    if not tokens:
+        return None
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+def allowed_kinds(user):
+    return KINDS_BY_ROLE.get(user["role"] if user else None, KINDS_BY_ROLE[None])
+
+
+def search_items(db, kind: str, match: str, user, limit: int, offset: int = 0):
+    """Return up to `limit` rows of `kind` matching `match`, best rank first."""
+    if kind == "events":
+        return db.execute(
+            """
+            SELECT e.*, e.active_count as appl_count
+            FROM events_fts f JOIN events e ON e.id=f.rowid
+            WHERE events_fts MATCH ?
+            ORDER BY f.rank, e.id DESC
+            LIMIT ? OFFSET ?
+            """,
+            (match, limit, offset),
+        ).fetchall()
+    if kind == "tasks":
+        return db.execute(
+            """
+            SELECT t.*, t.active_count as appl_count
+            FROM tasks_fts f JOIN tasks t ON t.id=f.rowid
+            WHERE tasks_fts MATCH ?
+            ORDER BY f.rank, t.id DESC
+            LIMIT ? OFFSET ?
+            """,
+            (match, limit, offset),
+        ).fetchall()
+    if kind == "users":
+        return db.execute(
+            """
+            SELECT u.*, COALESCE(un.name,'') as university_name
+            FROM users_fts f
+            JOIN users u ON u.id=f.rowid
+            LEFT JOIN universities un ON un.id=u.university_id
+            WHERE users_fts MATCH ?
+            ORDER BY f.rank, u.id DESC
+            LIMIT ? OFFSET ?
+            """,
+            (match, limit, offset),
+        ).fetchall()
+    if kind == "reports":
+        owner_e = "" if user["role"] == "admin" else "AND e.created_by = ?"
+        owner_t = "" if user["role"] == "admin" else "AND t.created_by = ?"
+        owner = () if user["role"] == "admin" else (user["id"],)
+        return db.execute(
+            f"""
+            SELECT * FROM (
+              SELECT 'event' as kind, r.id, r.event_id as item_id, e.name as item_name, r.report_text, r.status,
+                     r.created_at, u.username, f.rank as rank
+              FROM event_reports_fts f
+              JOIN event_reports r ON r.id=f.rowid
+              JOIN events e ON e.id=r.event_id
+              JOIN users u ON u.id=r.user_id
+              WHERE event_reports_fts MATCH ? {owner_e}
+              UNION ALL
+              SELECT 'task' as kind, r.id, r.task_id as item_id, t.name as item_name, r.report_text, r.status,
+                     r.created_at, u.username, f.rank as rank
+              FROM task_reports_fts f
+              JOIN task_reports r ON r.id=f.rowid
+              JOIN tasks t ON t.id=r.task_id
+              JOIN users u ON u.id=r.user_id
+              WHERE task_reports_fts MATCH ? {owner_t}
+            )
+            ORDER BY rank, id DESC
+            LIMIT ? OFFSET ?
+            """,
+            (match,) + owner + (match,) + owner + (limit, offset),
+        ).fetchall()
+    raise ValueError(f"unknown search kind: {kind}")
@@ -1,5 +1,9 @@
 import random
-from .db import get_db, now_iso
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from .db import FTS_SOURCES, _fts_norm, get_db, immediate_transaction, now_iso, recount_application_counters
 from .auth import hash_password
 
 def seed_data():
@@ -70,3 +74,174 @@ def seed_data():
         )
 
     db.commit()
+
+
+# --- Bulk synthetic data (python -m app seed) ---
+
+UNIVERSITIES = [
+    "Варшавский университет",
+    "Политехника",
+    "Гуманитарный институт",
+    "Медицинский университет",
+    "Экономический университет",
+    "Академия искусств",
+    "Педагогический университет",
+    "Технологический институт",
+]
+FACULTIES = ["Факультет Добрых Дел", "Экономический", "Юридический", "Медицинский", "Инженерный", "Филологический"]
+APP_STATUSES = ["на рассмотрении"] * 5 + ["подтверждена"] * 4 + ["отклонена"]
+REPORT_STATUSES = ["принят"] * 6 + ["на рассмотрении"] * 3 + ["отклонен"]
+BULK_PASSWORD = "seed"
+# Per-row insert triggers that seed_bulk() drops for the load and replaces with one set-based pass.
+BULK_SUSPENDED_TRIGGERS = tuple(f"trg_{fts}_ins" for fts, _, _ in FTS_SOURCES) + (
+    "trg_event_applications_counters_ins",
+    "trg_task_applications_counters_ins",
+    "trg_users_changed_upd",  # the points UPDATE would log every new user as changed
+)
+
+
+@contextmanager
+def bulk_load(db, cfg):
+    """No fsync and an in-memory rollback journal for the duration of a bulk load.
+
+    A crash in the middle can corrupt the database: use it on disposable data.
+    """
+    db.commit()
+    db.execute("PRAGMA synchronous = OFF")
+    db.execute("PRAGMA journal_mode = MEMORY")
+    try:
+        yield db
+    finally:
+        db.execute(f"PRAGMA journal_mode = {cfg.get('DB_JOURNAL_MODE', 'WAL')}")
+        db.execute(f"PRAGMA synchronous = {cfg.get('DB_SYNCHRONOUS', 'NORMAL')}")
+
+
+def _isoformat(ts: float) -> str:
+    return datetime.utcfromtimestamp(ts).isoformat(timespec="seconds")
+
+
+def seed_bulk(db, users: int, events: int, apps_per_event: int, tasks=None, seed: int = 0, prefix: str = "seed") -> dict:
+    """Add synthetic volunteers, organizers, events, tasks, applications and reports.
+
+    Everything goes in with executemany in one transaction (commits at the end);
+    the per-row FTS and counter triggers are dropped for the load and their work
+    is redone with one INSERT ... SELECT per table before they are recreated.
+    All users share one password hash (password "seed"). Users' points are the
+    sum of their accepted reports. Usernames carry the user id, so the function
+    can be run again on the same database. Returns the first ids and row counts.
+    """
+    rng = random.Random(seed)
+    now = now_iso()
+    tasks = events // 2 if tasks is None else tasks
+    pw = hash_password(BULK_PASSWORD)
+    n_orgs = max(1, users // 1000)
+    apps_per_event = min(apps_per_event, users)
+
+    with immediate_transaction(db):
+        marks = ",".join("?" for _ in BULK_SUSPENDED_TRIGGERS)
+        triggers = db.execute(
+            f"SELECT name, sql FROM sqlite_master WHERE type='trigger' AND name IN ({marks})", BULK_SUSPENDED_TRIGGERS
+        ).fetchall()
+        for t in triggers:
+            db.execute(f"DROP TRIGGER {t['name']}")
+        last_ids = {
+            table: db.execute(f"SELECT COALESCE(MAX(id), 0) as n FROM {table}").fetchone()["n"]
+            for _, table, _ in FTS_SOURCES
+        }
+
+        db.executemany("INSERT OR IGNORE INTO universities(name) VALUES(?)", [(n,) for n in UNIVERSITIES])
+        uni_ids = [r["id"] for r in db.execute("SELECT id FROM universities ORDER BY id")]
+        # A few big universities and a long tail.
+        uni_weights = [1 / (i + 1) for i in range(len(uni_ids))]
+
+        first_user = db.execute("SELECT COALESCE(MAX(id), 0) + 1 as n FROM users").fetchone()["n"]
+        db.executemany(
+            "INSERT INTO users(id,username,password_hash,role,created_at,full_name) VALUES(?,?,?,'organizer',?,?)",
+            ((first_user + i, f"{prefix}_org{first_user + i}", pw, now, f"Организатор {i}") for i in range(n_orgs)),
+        )
+        first_vol = first_user + n_orgs
+        universities = rng.choices(uni_ids, uni_weights, k=users)
+        db.executemany(
+            "INSERT INTO users(id,username,password_hash,role,created_at,full_name,group_name,faculty,age,university_id) "
+            "VALUES(?,?,?,'volunteer',?,?,?,?,?,?)",
+            (
+                (first_vol + i, f"{prefix}_user{first_vol + i}", pw, now, f"Волонтёр {i}", f"Группа {rng.randint(1, 40)}",
+                 rng.choice(FACULTIES), rng.randint(17, 26), universities[i])
+                for i in range(users)
+            ),
+        )
+        db.executemany(
+            "INSERT OR IGNORE INTO subscribers(user_id,is_subscribed) VALUES(?,?)",
+            ((first_vol + i, int(rng.random() < 0.85)) for i in range(users)),
+        )
+
+        start = time.time() - 180 * 86400
+        first = {}
+        for kind, count in (("event", events), ("task", tasks)):
+            items = f"{kind}s"
+            first[kind] = first_item = db.execute(f"SELECT COALESCE(MAX(id), 0) + 1 as n FROM {items}").fetchone()["n"]
+            rows = []
+            for i in range(count):
+                begins = start + rng.random() * 270 * 86400  # half a year back, three months ahead
+                # Unlimited or with room for every applicant, so approvals never exceed capacity.
+                cap = 0 if rng.random() < 0.3 else rng.randint(apps_per_event, apps_per_event * 2 + 10)
+                rows.append((
+                    first_item + i, f"{'Мероприятие' if kind == 'event' else 'Задание'} {i}", f"Описание {i}",
+                    rng.choice((2, 3, 5, 5, 8, 10, 15, 20)), _isoformat(begins), _isoformat(begins + 4 * 3600),
+                    cap, first_user + rng.randrange(n_orgs), now,
+                ))
+            db.executemany(
+                f"INSERT INTO {items}(id,name,description,points,start_time,end_time,max_participants,created_by,created_at) "
+                "VALUES(?,?,?,?,?,?,?,?,?)",
+                rows,
+            )
+            db.executemany(
+                f"INSERT INTO {kind}_applications({kind}_id,user_id,status,created_at) VALUES(?,?,?,?)",
+                (
+                    (first_item + i, first_vol + u, rng.choice(APP_STATUSES), now)
+                    for i in range(count) for u in rng.sample(range(users), apps_per_event)
+                ),
+            )
+            # Most approved volunteers of past items filed a report.
+            past = db.execute(
+                f"SELECT a.{kind}_id as item_id, a.user_id FROM {kind}_applications a JOIN {items} i ON i.id=a.{kind}_id "
+                f"WHERE a.{kind}_id >= ? AND a.status='подтверждена' AND i.start_time < ?",
+                (first_item, now),
+            ).fetchall()
+            # Accepted reports are already counted in users.points below, so they are marked paid.
+            db.executemany(
+                f"INSERT INTO {kind}_reports({kind}_id,user_id,report_text,status,points_awarded,created_at) "
+                "VALUES(?,?,?,?,?,?)",
+                ((r["item_id"], r["user_id"], "Отчёт о выполнении", status, int(status == "принят"), now)
+                 for r in past if rng.random() < 0.7 for status in (rng.choice(REPORT_STATUSES),)),
+            )
+
+        db.execute(
+            """
+            UPDATE users SET points =
+                COALESCE((SELECT SUM(e.points) FROM event_reports r JOIN events e ON e.id=r.event_id
+                          WHERE r.user_id=users.id AND r.status='принят'), 0)
+              + COALESCE((SELECT SUM(t.points) FROM task_reports r JOIN tasks t ON t.id=r.task_id
+                          WHERE r.user_id=users.id AND r.status='принят'), 0)
+            WHERE id >= ?
+            """,
+            (first_vol,),
+        )
+
+        # What the dropped triggers would have done, in one statement per table.
+        for fts, table, cols in FTS_SOURCES:
+            db.execute(
+                f"INSERT INTO {fts}(rowid, {', '.join(cols)}) "
+                f"SELECT id, {', '.join(_fts_norm(c) for c in cols)} FROM {table} WHERE id > ?",
+                (last_ids[table],),
+            )
+        recount_application_counters(db)
+        for t in triggers:
+            db.execute(t["sql"])
+
+    counts = {
+        t: db.execute(f"SELECT COUNT(1) as c FROM {t}").fetchone()["c"]
+        for t in ("users", "events", "tasks", "event_applications", "task_applications", "event_reports", "task_reports")
+    }
+    return {"first_user": first_user, "first_volunteer": first_vol, "first_event": first["event"],
+            "first_task": first["task"], "organizers": n_orgs, "counts": counts}
@@ -0,0 +1,183 @@
+"""Content-addressed upload store.
+
+Each distinct file body is stored once, under <uploads>/blobs/ab/cd/<sha256>
+(previews of it under <uploads>/thumbs/, see thumbnails.py).
+The attachments table maps an id to (sha256, size, mime, original_name,
+refcount); refcount is kept by triggers on the report tables (db.ATTACHMENT_SQL).
+
+Uploads are spooled to <uploads>/tmp in chunks while being hashed, outside any
+transaction. attach(), discard_unrecorded() and release_if_orphan() must run
+inside db.immediate_transaction(): the write lock serializes "blob is
+referenced" against "blob is deleted", so the two cannot interleave across
+workers. attach() publishes the blob before its row commits; if that
+transaction rolls back, the caller removes the blob with discard_unrecorded().
+Attachments left at refcount 0 (e.g. by cascading deletes of events and tasks)
+are collected by the periodic "gc_uploads" job.
+"""
+import glob
+import hashlib
+import mimetypes
+import os
+import tempfile
+import time
+
+CHUNK_SIZE = 64 * 1024
+
+
+def blob_path(root: str, sha256: str) -> str:
+    return os.path.join(root, "blobs", sha256[:2], sha256[2:4], sha256)
+
+
+def thumb_path(root: str, sha256: str, size: int) -> str:
+    return os.path.join(root, "thumbs", sha256[:2], sha256[2:4], f"{sha256}-{size}.jpg")
+
+
+def _discard_thumbs(root: str, sha256: str) -> None:
+    for path in glob.glob(os.path.join(root, "thumbs", sha256[:2], sha256[2:4], f"{sha256}-*.jpg")):
+        discard(path)
+
+
+def spool(stream, root: str):
+    """Copy `stream` to a temp file under `root`, hashing as it goes.
+
+    Returns (tmp_path, sha256_hex, size). The caller removes tmp_path with
+    discard() once attach() has run (attach() may have moved it already).
+    """
+    tmp_dir = os.path.join(root, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, prefix="upload-")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        discard(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+
+def discard(tmp_path: str) -> None:
+    try:
+        os.remove(tmp_path)
+    except FileNotFoundError:
+        pass
+
+
+def guess_mime(filename: str, fallback: str = "") -> str:
+    return mimetypes.guess_type(filename or "")[0] or fallback or "application/octet-stream"
+
+
+def attach(db, root: str, tmp_path: str, sha256: str, size: int, mime: str, original_name: str, created_at: str) -> int:
+    """Make sure the blob exists and has an attachments row; return its id."""
+    path = blob_path(root, sha256)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+    db.execute(
+        "INSERT INTO attachments(sha256, size, mime, original_name, refcount, created_at) VALUES(?,?,?,?,0,?) "
+        "ON CONFLICT(sha256) DO NOTHING",
+        (sha256, size, mime, original_name, created_at),
+    )
+    return db.execute("SELECT id FROM attachments WHERE sha256=?", (sha256,)).fetchone()["id"]
+
+
+def discard_unrecorded(db, root: str, sha256: str) -> bool:
+    """Delete the blob if no attachments row names it, i.e. its attach() was rolled back."""
+    if db.execute("SELECT 1 FROM attachments WHERE sha256=?", (sha256,)).fetchone():
+        return False
+    discard(blob_path(root, sha256))
+    return True
+
+
+def release_if_orphan(db, root: str, attachment_id: int) -> bool:
+    """Delete the attachment and its blob if no report references it any more."""
+    row = db.execute("SELECT sha256 FROM attachments WHERE id=? AND refcount<=0", (attachment_id,)).fetchone()
+    if not row:
+        return False
+    db.execute("DELETE FROM attachments WHERE id=?", (attachment_id,))
+    discard(blob_path(root, row["sha256"]))
+    _discard_thumbs(root, row["sha256"])
+    return True
+
+
+def legacy_media_file(root: str, media_path: str):
+    """Resolve a pre-attachments media_path value to a file inside `root`, or None."""
+    if not media_path:
+        return None
+    root = os.path.realpath(root)
+    candidate = os.path.realpath(os.path.join(root, os.path.basename(media_path)))
+    if os.path.dirname(candidate) != root or not os.path.isfile(candidate):
+        return None
+    return candidate
+
+
+def migrate_media_paths(db, root: str, now: str) -> dict:
+    """Move legacy media_path files into the store and point reports at them.
+
+    Reports whose file is gone keep their media_path untouched.
+    """
+    from .db import immediate_transaction
+    stats = {"migrated": 0, "missing": 0, "deduplicated": 0}
+    for table in ("event_reports", "task_reports"):
+        rows = db.execute(
+            f"SELECT id, media_path FROM {table} WHERE media_path IS NOT NULL AND attachment_id IS NULL"
+        ).fetchall()
+        for row in rows:
+            src = legacy_media_file(root, row["media_path"])
+            if src is None:
+                stats["missing"] += 1
+                continue
+            with open(src, "rb") as f:
+                tmp_path, sha256, size = spool(f, root)
+            try:
+                with immediate_transaction(db):
+                    existed = os.path.exists(blob_path(root, sha256))
+                    name = os.path.basename(src)
+                    att_id = attach(db, root, tmp_path, sha256, size, guess_mime(name), name, now)
+                    db.execute(f"UPDATE {table} SET attachment_id=?, media_path=NULL WHERE id=?", (att_id, row["id"]))
+            except Exception:
+                with immediate_transaction(db):
+                    discard_unrecorded(db, root, sha256)
+                raise
+            finally:
+                discard(tmp_path)
+            discard(src)
+            stats["migrated"] += 1
+            stats["deduplicated"] += int(existed)
+    return stats
+
+
+def collect_garbage(db, root: str) -> int:
+    """Remove unreferenced attachments, blobs and thumbnails without a row. Returns files removed."""
+    from .db import immediate_transaction
+    removed = 0
+    with immediate_transaction(db):
+        for row in db.execute("SELECT id FROM attachments WHERE refcount<=0").fetchall():
+            removed += int(release_if_orphan(db, root, row["id"]))
+        known = {r["sha256"] for r in db.execute("SELECT sha256 FROM attachments")}
+        for dirpath, _, files in os.walk(os.path.join(root, "blobs")):
+            for name in files:
+                if name not in known:
+                    discard(os.path.join(dirpath, name))
+                    removed += 1
+        for dirpath, _, files in os.walk(os.path.join(root, "thumbs")):
+            for name in files:
+                if name.split("-", 1)[0] not in known:
+                    discard(os.path.join(dirpath, name))
+                    removed += 1
+    # Spool files left behind by workers that died mid-upload.
+    tmp_dir = os.path.join(root, "tmp")
+    if os.path.isdir(tmp_dir):
+        for name in os.listdir(tmp_dir):
+            path = os.path.join(tmp_dir, name)
+            if os.path.getmtime(path) < time.time() - 3600:
+                discard(path)
+                removed += 1
+    return removed
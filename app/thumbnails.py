@@ -0,0 +1,116 @@
+"""Downscaled previews of image attachments.
+
+Thumbnails are generated off the request path: new uploads enqueue a
+"thumbnail" job for `python -m app worker`, and a thumbnail requested before
+it exists is made by a small thread pool in the web process (Pillow releases
+the GIL while decoding and resizing). Either way the result is cached on disk
+at <uploads>/thumbs/ab/cd/<sha256>-<size>.jpg, so deduplicated blobs share
+one thumbnail. Pillow is optional: without it no thumbnails are produced and
+the moderation pages fall back to plain links.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from . import jobs
+from .storage import blob_path, thumb_path
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+except ImportError:  # pragma: no cover - depends on the deployment
+    Image = None
+    UnidentifiedImageError = OSError
+
+THUMBNAIL_MIMES = ("image/jpeg", "image/png", "image/gif", "image/webp", "image/bmp")
+
+
+def supported(mime: str) -> bool:
+    return Image is not None and (mime or "") in THUMBNAIL_MIMES
+
+
+def render(root: str, sha256: str, size: int) -> str:
+    """Create the thumbnail if missing and return its path. Runs in the pool or a job worker."""
+    out = thumb_path(root, sha256, size)
+    if os.path.exists(out):
+        return out
+    with Image.open(blob_path(root, sha256)) as img:
+        img.draft("RGB", (size, size))  # JPEG: let the decoder downscale cheaply
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((size, size))
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        tmp = f"{out}.{os.getpid()}.{threading.get_ident()}.tmp"
+        img.save(tmp, "JPEG", quality=80, optimize=True)
+    os.replace(tmp, out)
+    return out
+
+
+@jobs.task("thumbnail", timeout=120, max_attempts=3)
+def thumbnail_job(payload):
+    pool = current_app.extensions["thumbnails"]
+    if not supported(payload.get("mime")):
+        raise jobs.PermanentJobError(f"no thumbnail for {payload.get('mime')!r}")
+    try:
+        render(pool.root, payload["sha256"], pool.size)
+    except FileNotFoundError:
+        raise jobs.PermanentJobError("blob is gone")
+    except UnidentifiedImageError as e:
+        raise jobs.PermanentJobError(str(e))
+
+
+class ThumbnailPool:
+    def __init__(self, root: str, size: int = 320, workers: int = 2):
+        self.root = root
+        self.size = size
+        self.workers = max(1, int(workers))
+        self._reset()
+
+    def _reset(self):
+        # Executors do not survive fork; each worker process builds its own lazily.
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = set()
+        self._failed = set()
+
+    def path(self, sha256: str) -> str:
+        return thumb_path(self.root, sha256, self.size)
+
+    def schedule(self, sha256: str, mime: str) -> bool:
+        """Queue thumbnail generation; False if it cannot be produced for this file."""
+        if not supported(mime):
+            return False
+        if self._pid != os.getpid():
+            self._reset()
+        with self._lock:
+            if sha256 in self._failed:
+                return False
+            if sha256 in self._pending or os.path.exists(self.path(sha256)):
+                return True
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="thumbs")
+            self._pending.add(sha256)
+        future = self._executor.submit(render, self.root, sha256, self.size)
+        future.add_done_callback(lambda f: self._done(sha256, f))
+        return True
+
+    def _done(self, sha256: str, future):
+        with self._lock:
+            self._pending.discard(sha256)
+            if future.exception() is not None:
+                # Corrupt or unsupported file: do not retry it in this process.
+                self._failed.add(sha256)
+
+
+def init_thumbnails(app):
+    root = os.path.join(os.path.dirname(app.config["DB_PATH"]), "uploads")
+    pool = ThumbnailPool(
+        root,
+        size=int(app.config.get("THUMBNAIL_SIZE", 320)),
+        workers=int(app.config.get("THUMBNAIL_WORKERS", 2)),
+    )
+    app.extensions["thumbnails"] = pool
+    return pool
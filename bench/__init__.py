@@ -0,0 +1 @@
+"""Benchmarks for the app package. Run from the repository root, e.g. python -m bench.bench."""
@@ -0,0 +1,462 @@
+"""Request benchmark for the hot endpoints.
+
+For each scale (number of applications, e.g. 1k 100k 1m) a temporary database
+is filled with synthetic users, events, tasks, applications and reports in
+one transaction, on top of the regular schema and seed data. The scenarios
+below are then run:
+
+* through the WSGI test client of a real create_app() (mode "wsgi"), and
+* with --gunicorn, over HTTP against a local `gunicorn -w N wsgi:app` driven
+  by --concurrency client threads (mode "gunicorn").
+
+For every scenario it prints p50/p95/p99 latency and SQL statements per
+request (from the Server-Timing header, see perf.py). With --baseline the
+results are compared to a stored run: the command fails if statements per
+request went up, or if p95 grew by more than --tolerance (and --min-ms).
+--save-baseline records the current run in that file.
+
+Run:  python -m bench.bench --scales 1k 100k --requests 200 --baseline bench/baseline.json
+      python -m bench.bench --scales 1m --gunicorn --workers 4 --concurrency 8
+"""
+import argparse
+import json
+import math
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "bench"
+APPLICANTS = 128  # volunteers without applications, used by the "apply" scenario
+
+# name -> (method, path, user, slow). {event}, {attachment}, {upload} are filled per request;
+# "slow" scenarios (full exports) run --export-requests times instead of --requests.
+SCENARIOS = {
+    "index": ("GET", "/", None, False),
+    "events": ("GET", "/events", None, False),
+    "event_detail": ("GET", "/events/{event}", None, False),
+    "apply": ("POST", "/events/{event}/apply", "applicant", False),
+    "manage_applications": ("GET", "/manage/applications", "org1", False),
+    "manage_reports": ("GET", "/manage/reports", "org1", False),
+    "manage_applications_admin": ("GET", "/manage/applications?status=all", "admin", False),
+    "admin": ("GET", "/admin", "admin", False),
+    "attachment": ("GET", "/attachments/{attachment}", "org1", False),
+    "uploads": ("GET", "/uploads/{upload}", "org1", False),
+    "export_users": ("GET", "/admin/export/users.csv", "admin", True),
+    "export_reports": ("GET", "/admin/export/reports.csv", "admin", True),
+}
+
+_QUERIES_RE = re.compile(r'db;[^,]*desc="(\d+) queries"')
+_CSRF_RE = re.compile(r'name="_csrf" value="([^"]+)"')
+
+
+def parse_scale(text: str) -> int:
+    text = text.strip().lower()
+    mult = {"k": 1000, "m": 1000 * 1000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * mult)
+
+
+def scale_label(n: int) -> str:
+    if n % 1000000 == 0:
+        return f"{n // 1000000}m"
+    if n % 1000 == 0:
+        return f"{n // 1000}k"
+    return str(n)
+
+
+# --- synthetic data ---
+
+def generate(app, applications: int) -> dict:
+    """Fill the app's database for `applications` applications; return ids the scenarios use."""
+    from app.auth import hash_password
+    from app.db import get_db, now_iso
+    from app.storage import blob_path
+    now = now_iso()
+    pw = hash_password(PASSWORD)  # one hash for every synthetic user
+    n_items = max(20, applications // 200)
+    per_item = max(1, applications // 2 // n_items)
+    n_users = max(200, per_item * 2, applications // 10)
+    uploads = os.path.join(os.path.dirname(app.config["DB_PATH"]), "uploads")
+    with app.app_context():
+        db = get_db()
+        db.execute("PRAGMA synchronous = OFF")
+        db.execute("BEGIN")
+        org_ids = [db.execute("SELECT id FROM users WHERE username='org1'").fetchone()["id"]]
+        db.executemany(
+            "INSERT INTO users(username,password_hash,role,created_at,full_name) VALUES(?,?,'organizer',?,?)",
+            ((f"bench_org{i}", pw, now, f"Организатор {i}") for i in range(1, 10)),
+        )
+        org_ids += [r["id"] for r in db.execute("SELECT id FROM users WHERE username LIKE 'bench_org%' ORDER BY id")]
+        first_user = db.execute("SELECT COALESCE(MAX(id), 0) + 1 as n FROM users").fetchone()["n"]
+        db.executemany(
+            "INSERT INTO users(id,username,password_hash,role,created_at,full_name,university_id) VALUES(?,?,?,'volunteer',?,?,1)",
+            ((first_user + i, f"bench_u{i}", pw, now, f"Волонтёр {i}") for i in range(n_users)),
+        )
+        db.executemany(
+            "INSERT INTO users(username,password_hash,role,created_at) VALUES(?,?,'volunteer',?)",
+            ((f"bench_applicant{i}", pw, now) for i in range(APPLICANTS)),
+        )
+        db.execute(
+            "INSERT OR IGNORE INTO subscribers(user_id,is_subscribed) SELECT id, 1 FROM users WHERE role='volunteer'"
+        )
+        for kind in ("event", "task"):
+            items = f"{kind}s"
+            first_item = db.execute(f"SELECT COALESCE(MAX(id), 0) + 1 as n FROM {items}").fetchone()["n"]
+            db.executemany(
+                f"INSERT INTO {items}(id,name,description,points,start_time,max_participants,created_by,created_at) "
+                "VALUES(?,?,?,5,?,0,?,?)",
+                (
+                    (first_item + i, f"{kind} {i}", f"Описание {kind} {i}", f"2026-{1 + i % 12:02d}-{1 + i % 28:02d}T10:00:00",
+                     org_ids[i % len(org_ids)], now)
+                    for i in range(n_items)
+                ),
+            )
+            # 70% pending, 20% approved, 10% rejected; users are a sliding window so pairs stay unique.
+            statuses = ["на рассмотрении"] * 7 + ["подтверждена"] * 2 + ["отклонена"]
+            db.executemany(
+                f"INSERT INTO {kind}_applications({kind}_id,user_id,status,created_at) VALUES(?,?,?,?)",
+                (
+                    (first_item + i, first_user + (i * 7 + j) % n_users, statuses[j % 10], now)
+                    for i in range(n_items) for j in range(per_item)
+                ),
+            )
+            report_statuses = ["на рассмотрении", "принят", "отклонен"]
+            db.execute(
+                f"INSERT INTO {kind}_reports({kind}_id,user_id,report_text,status,points_awarded,created_at) "
+                f"SELECT {kind}_id, user_id, 'Отчёт', CASE id % 3 WHEN 0 THEN ? WHEN 1 THEN ? ELSE ? END, "
+                f"id % 3 = 1, created_at "  # accepted ones count as paid, so approving them again awards nothing
+                f"FROM {kind}_applications WHERE status='подтверждена' AND {kind}_id >= ? AND id % 2 = 0",
+                (*report_statuses, first_item),
+            )
+        event_id = db.execute("SELECT MIN(id) as id FROM events WHERE name LIKE 'event %'").fetchone()["id"]
+        # A few reports get real files: an attachment blob and a legacy media_path file.
+        samples = db.execute(
+            "SELECT r.id FROM event_reports r JOIN events e ON e.id=r.event_id WHERE e.created_by=? ORDER BY r.id LIMIT 3",
+            (org_ids[0],),
+        ).fetchall()
+        attachments, upload_names = [], []
+        for n, row in enumerate(samples):
+            sha = f"{n + 1:064x}"
+            path = blob_path(uploads, sha)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(os.urandom(64 * 1024))
+            att = db.execute(
+                "INSERT INTO attachments(sha256,size,mime,original_name,refcount,created_at) VALUES(?,?,'image/png',?,0,?)",
+                (sha, 64 * 1024, f"bench{n}.png", now),
+            ).lastrowid
+            name = f"bench_legacy_{n}.png"
+            with open(os.path.join(uploads, name), "wb") as f:
+                f.write(os.urandom(64 * 1024))
+            db.execute("UPDATE event_reports SET attachment_id=?, media_path=? WHERE id=?", (att, name, row["id"]))
+            attachments.append(att)
+            upload_names.append(name)
+        db.commit()
+        db.execute(f"PRAGMA synchronous = {app.config.get('DB_SYNCHRONOUS', 'NORMAL')}")
+        counts = {
+            t: db.execute(f"SELECT COUNT(1) as c FROM {t}").fetchone()["c"]
+            for t in ("users", "events", "event_applications", "task_applications", "event_reports", "task_reports")
+        }
+        db.execute("ANALYZE")
+    return {
+        "events": list(range(event_id, event_id + n_items)),
+        "attachments": attachments,
+        "uploads": upload_names,
+        "applicants": [f"bench_applicant{i}" for i in range(APPLICANTS)],
+        "counts": counts,
+    }
+
+
+# --- drivers: one logged-in client each ---
+
+class WsgiDriver:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def _token(self):
+        with self.client.session_transaction() as s:
+            return s.setdefault("csrf_token", "bench")
+
+    def login(self, username):
+        self.client.get("/logout")
+        self.request("POST", "/login", {"username": username, "password": _password(username)})
+
+    def request(self, method, path, data=None):
+        if method == "GET":
+            resp = self.client.get(path)
+        else:
+            resp = self.client.post(path, data={**(data or {}), "_csrf": self._token()})
+        resp.get_data()  # include streamed bodies (exports) in the timing
+        resp.close()
+        return resp.status_code, _queries(resp.headers.get_all("Server-Timing"))
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpDriver:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect())
+        self.csrf = ""
+
+    def _refresh_csrf(self, path):
+        with self.opener.open(self.base_url + path) as resp:
+            m = _CSRF_RE.search(resp.read().decode("utf-8", "replace"))
+        self.csrf = m.group(1) if m else ""
+
+    def login(self, username):
+        self.request("GET", "/logout")
+        self._refresh_csrf("/login")
+        self.request("POST", "/login", {"username": username, "password": _password(username)})
+        self._refresh_csrf("/profile")  # login starts a new session with a new token
+
+    def request(self, method, path, data=None):
+        body = None
+        if method == "POST":
+            body = urllib.parse.urlencode({**(data or {}), "_csrf": self.csrf}).encode()
+        try:
+            with self.opener.open(urllib.request.Request(self.base_url + path, data=body, method=method)) as resp:
+                resp.read()
+                return resp.status, _queries(resp.headers.get_all("Server-Timing"))
+        except urllib.error.HTTPError as e:  # redirects land here too
+            e.read()
+            return e.code, _queries(e.headers.get_all("Server-Timing"))
+
+
+def _password(username):
+    return PASSWORD if username.startswith("bench_") else username
+
+
+def _queries(headers):
+    for h in headers or ():
+        m = _QUERIES_RE.search(h)
+        if m:
+            return int(m.group(1))
+    return None
+
+
+# --- running scenarios ---
+
+def percentile(sorted_samples, p: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(len(sorted_samples) - 1, max(0, math.ceil(p * len(sorted_samples)) - 1))]
+
+
+def _run_share(driver, name, count, data, applicants, offset):
+    """Run `count` requests of one scenario on one driver; return (latencies ms, query counts)."""
+    method, template, user, _ = SCENARIOS[name]
+    events = data["events"]
+    latencies, queries = [], []
+    if user and user != "applicant":
+        driver.login(user)
+    for i in range(count):
+        if user == "applicant":
+            # Each applicant applies to every event once, then the next one takes over.
+            if i % len(events) == 0:
+                driver.login(applicants[(i // len(events)) % len(applicants)])
+            event = events[i % len(events)]
+        else:
+            event = events[(offset + i * 7919) % len(events)]
+        path = template.format(
+            event=event,
+            attachment=data["attachments"][i % len(data["attachments"])] if data["attachments"] else 0,
+            upload=data["uploads"][i % len(data["uploads"])] if data["uploads"] else "none",
+        )
+        start = time.perf_counter()
+        status, n = driver.request(method, path, {} if method == "POST" else None)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if status >= 500:
+            raise RuntimeError(f"{method} {path} -> {status}")
+        if n is not None:
+            queries.append(n)
+    return latencies, queries
+
+
+def _summary(latencies, queries, elapsed=None):
+    latencies.sort()
+    out = {
+        "n": len(latencies),
+        "p50": round(percentile(latencies, 0.50), 3),
+        "p95": round(percentile(latencies, 0.95), 3),
+        "p99": round(percentile(latencies, 0.99), 3),
+        "queries": round(sum(queries) / len(queries), 2) if queries else None,
+    }
+    if elapsed:
+        out["rps"] = round(len(latencies) / elapsed, 1)
+    return out
+
+
+def run_wsgi(app, data, scenarios, requests, export_requests):
+    results = {}
+    applicants = data["applicants"][: APPLICANTS // 4]
+    for name in scenarios:
+        count = export_requests if SCENARIOS[name][3] else requests
+        driver = WsgiDriver(app)
+        _run_share(driver, name, min(2, count), data, applicants[-1:], 0)  # warm-up (caches, first connection)
+        latencies, queries = _run_share(driver, name, count, data, applicants[:-1], 0)
+        results[name] = _summary(latencies, queries)
+    return results
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_gunicorn(db_path, data, scenarios, requests, export_requests, workers, concurrency):
+    port = _free_port()
+    env = dict(
+        os.environ,
+        DB_PATH=db_path,
+        SEED_ON_FIRST_RUN="0",
+        PROMETHEUS_MULTIPROC_DIR=os.path.join(os.path.dirname(db_path), "metrics"),
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}", "--log-level", "warning", "wsgi:app"],
+        cwd=ROOT, env=env,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                urllib.request.urlopen(base + "/about", timeout=1).read()
+                break
+            except (OSError, urllib.error.URLError):
+                if proc.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("gunicorn did not start")
+                time.sleep(0.2)
+        results = {}
+        pool = data["applicants"][APPLICANTS // 4:]
+        for name in scenarios:
+            count = export_requests if SCENARIOS[name][3] else requests
+            threads = max(1, min(concurrency, count))
+            shares = [count // threads + (1 if t < count % threads else 0) for t in range(threads)]
+            drivers = [HttpDriver(base) for _ in range(threads)]
+            lock = threading.Lock()
+            latencies, queries = [], []
+
+            def work(t):
+                lat, q = _run_share(drivers[t], name, shares[t], data, pool[t::threads], t)
+                with lock:
+                    latencies.extend(lat)
+                    queries.extend(q)
+
+            for t in range(threads):  # warm-up: every thread logs in once
+                _run_share(drivers[t], name, 0, data, pool[t::threads], t)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(threads) as ex:
+                list(ex.map(work, range(threads)))
+            results[name] = _summary(latencies, queries, time.perf_counter() - start)
+        return results
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# --- reporting and baseline ---
+
+def print_results(mode, scale, results):
+    print(f"\n[{mode}] {scale} applications")
+    print(f"{'scenario':<27} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'SQL/req':>8} {'req/s':>8}")
+    for name, r in results.items():
+        q = "-" if r["queries"] is None else f"{r['queries']:.1f}"
+        rps = f"{r['rps']:.1f}" if "rps" in r else "-"
+        print(f"{name:<27} {r['n']:>5} {r['p50']:>9.2f} {r['p95']:>9.2f} {r['p99']:>9.2f} {q:>8} {rps:>8}")
+
+
+def compare(baseline, current, tolerance, min_ms):
+    """Return a list of regressions of `current` against `baseline` (same nesting)."""
+    problems = []
+    for mode, scales in current.items():
+        for scale, scenarios in scales.items():
+            for name, r in scenarios.items():
+                base = baseline.get(mode, {}).get(scale, {}).get(name)
+                if not base:
+                    continue
+                where = f"[{mode}] {scale} {name}"
+                if base.get("queries") is not None and r["queries"] is not None and r["queries"] > base["queries"] + 0.5:
+                    problems.append(f"{where}: {r['queries']} SQL statements per request, baseline {base['queries']}")
+                if r["p95"] > base["p95"] * (1 + tolerance) and r["p95"] - base["p95"] > min_ms:
+                    problems.append(f"{where}: p95 {r['p95']:.2f} ms, baseline {base['p95']:.2f} ms")
+    return problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.bench")
+    parser.add_argument("--scales", nargs="+", default=["1k", "100k"], help="applications per run, e.g. 1k 100k 1m")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--export-requests", type=int, default=3, help="requests for the full-export scenarios")
+    parser.add_argument("--gunicorn", action="store_true", help="also run against a local gunicorn over HTTP")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads against gunicorn")
+    parser.add_argument("--baseline", help="JSON file with a stored run to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="write this run into --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed p95 growth (0.5 = +50%%)")
+    parser.add_argument("--min-ms", type=float, default=2.0, help="ignore p95 growth below this many ms")
+    args = parser.parse_args(argv)
+
+    from app import create_app
+    current = {}
+    for text in args.scales:
+        n = parse_scale(text)
+        label = scale_label(n)
+        tmp = tempfile.mkdtemp(prefix=f"greenlink-bench-{label}-")
+        db_path = os.path.join(tmp, "app.db")
+        app = create_app({"DB_PATH": db_path, "SEED_ON_FIRST_RUN": True, "TESTING": True})
+        started = time.perf_counter()
+        data = generate(app, n)
+        print(f"\n{label}: generated in {time.perf_counter() - started:.1f}s: "
+              + ", ".join(f"{k}={v}" for k, v in data["counts"].items()))
+        results = run_wsgi(app, data, args.scenarios, args.requests, args.export_requests)
+        print_results("wsgi", label, results)
+        current.setdefault("wsgi", {})[label] = results
+        if args.gunicorn:
+            results = run_gunicorn(
+                db_path, data, args.scenarios, args.requests, args.export_requests, args.workers, args.concurrency
+            )
+            print_results("gunicorn", label, results)
+            current.setdefault("gunicorn", {})[label] = results
+
+    if not args.baseline:
+        return 0
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    if args.save_baseline:
+        for mode, scales in current.items():
+            baseline.setdefault(mode, {}).update(scales)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}.")
+        return 0
+    problems = compare(baseline, current, args.tolerance, args.min_ms)
+    for p in problems:
+        print(p)
+    print(f"\n{len(problems)} regression(s) against {args.baseline}." if problems else f"\nNo regressions against {args.baseline}.")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
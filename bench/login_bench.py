@@ -0,0 +1,175 @@
+"""Login throughput benchmark for the password hash settings.
+
+For each --methods entry (werkzeug method string, i.e. PASSWORD_HASH_METHOD)
+it first times check_password_hash alone on one thread, then starts a local
+gunicorn the way it is deployed (gunicorn.conf.py: threaded workers, with
+--workers processes and --threads threads each) and drives POST /login over
+HTTP from each --concurrency number of client threads. Printed per run:
+successful logins per second, the same per busy core (min of CPUs, hashing
+threads of all workers and client threads), p50/p95 latency and how many
+logins were turned away with 503 because a worker's PASSWORD_HASH_QUEUE was
+full.
+
+Run:  python -m bench.login_bench --methods scrypt:32768:8:1 scrypt:16384:8:1 pbkdf2:sha256:600000
+      python -m bench.login_bench --concurrency 1 8 32 --workers 2 --threads 8 --hash-workers 2 --queue 4
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from .bench import ROOT, HttpDriver, _free_port, percentile
+
+PASSWORD = "bench"
+
+
+def raw_rate(method: str, seconds: float) -> float:
+    """Password verifications per second on one thread, outside the app."""
+    hash_ = generate_password_hash(PASSWORD, method)
+    done, started = 0, time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        check_password_hash(hash_, PASSWORD)
+        done += 1
+    return done / (time.perf_counter() - started)
+
+
+def make_db(method: str, users: int) -> str:
+    """Create a database with `users` volunteers whose hashes use `method`; return its path."""
+    from app import create_app
+    from app.db import get_db, now_iso
+    db_path = os.path.join(tempfile.mkdtemp(prefix="greenlink-login-bench-"), "app.db")
+    app = create_app({"DB_PATH": db_path, "SEED_ON_FIRST_RUN": False, "TESTING": True})
+    pw = generate_password_hash(PASSWORD, method)  # the served method, so no login triggers a rehash
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO users(username,password_hash,role,created_at) VALUES(?,?,'volunteer',?)",
+            ((f"bench_login{i}", pw, now_iso()) for i in range(users)),
+        )
+        db.commit()
+    return db_path
+
+
+def start_gunicorn(db_path: str, method: str, args):
+    """Run gunicorn with the project's gunicorn.conf.py; return (process, base URL)."""
+    port = _free_port()
+    env = dict(
+        os.environ,
+        DB_PATH=db_path,
+        SEED_ON_FIRST_RUN="0",
+        PROMETHEUS_MULTIPROC_DIR=os.path.join(os.path.dirname(db_path), "metrics"),
+        GUNICORN_THREADS=str(args.threads),
+        PASSWORD_HASH_METHOD=method,
+        PASSWORD_HASH_WORKERS=str(args.hash_workers),
+        PASSWORD_HASH_QUEUE=str(args.queue),
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(args.workers), "-b", f"127.0.0.1:{port}",
+         "--log-level", "warning", "wsgi:app"],
+        cwd=ROOT, env=env,
+    )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            urllib.request.urlopen(base + "/about", timeout=1).read()
+            return proc, base
+        except (OSError, urllib.error.URLError):
+            if proc.poll() is not None or time.monotonic() > deadline:
+                proc.kill()
+                raise RuntimeError("gunicorn did not start")
+            time.sleep(0.2)
+
+
+def stop(proc):
+    proc.terminate()
+    try:
+        proc.wait(10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def run_logins(base: str, users: int, logins: int, concurrency: int) -> dict:
+    latencies, busy, failed = [], [0], [0]
+    lock = threading.Lock()
+
+    def client(worker: int, count: int):
+        driver = HttpDriver(base)
+        for i in range(count):
+            driver._refresh_csrf("/login")
+            username = f"bench_login{(worker + i * concurrency) % users}"
+            started = time.perf_counter()
+            status, _ = driver.request("POST", "/login", {"username": username, "password": PASSWORD})
+            elapsed = time.perf_counter() - started
+            with lock:
+                if status == 302:
+                    latencies.append(elapsed)
+                elif status == 503:
+                    busy[0] += 1
+                else:
+                    failed[0] += 1
+            driver.request("GET", "/logout")
+
+    share = [logins // concurrency + (1 if n < logins % concurrency else 0) for n in range(concurrency)]
+    threads = [threading.Thread(target=client, args=(n, share[n])) for n in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "ok": len(latencies),
+        "busy": busy[0],
+        "failed": failed[0],
+        "rate": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.5) * 1000,
+        "p95": percentile(latencies, 0.95) * 1000,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.login_bench")
+    parser.add_argument("--methods", nargs="+", default=["scrypt:32768:8:1", "scrypt:16384:8:1", "pbkdf2:sha256:600000"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="client threads per run")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=8, help="threads per gunicorn worker (GUNICORN_THREADS)")
+    parser.add_argument("--logins", type=int, default=100, help="logins per run")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--hash-workers", type=int, default=2, help="PASSWORD_HASH_WORKERS")
+    parser.add_argument("--queue", type=int, default=4, help="PASSWORD_HASH_QUEUE")
+    parser.add_argument("--raw-seconds", type=float, default=2.0, help="duration of the bare hash timing")
+    args = parser.parse_args(argv)
+
+    cpus = os.cpu_count() or 1
+    print(f"{cpus} CPU(s), gunicorn {args.workers} worker(s) x {args.threads} threads, "
+          f"PASSWORD_HASH_WORKERS={args.hash_workers}, PASSWORD_HASH_QUEUE={args.queue}")
+    failed = 0
+    for method in args.methods:
+        print(f"\n{method}: {raw_rate(method, args.raw_seconds):.1f} verifications/s on one thread (no app)")
+        print(f"{'threads':>8} {'logins':>7} {'503':>5} {'logins/s':>9} {'per core':>9} {'p50 ms':>8} {'p95 ms':>8}")
+        proc, base = start_gunicorn(make_db(method, args.users), method, args)
+        try:
+            for concurrency in args.concurrency:
+                r = run_logins(base, args.users, args.logins, concurrency)
+                cores = max(1, min(cpus, args.workers * args.hash_workers, concurrency))
+                print(f"{concurrency:>8} {r['ok']:>7} {r['busy']:>5} {r['rate']:>9.1f} {r['rate'] / cores:>9.1f} "
+                      f"{r['p50']:>8.1f} {r['p95']:>8.1f}")
+                failed += r["failed"]
+        finally:
+            stop(proc)
+    if failed:
+        print(f"\n{failed} login(s) failed with an unexpected status.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
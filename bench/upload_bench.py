@@ -0,0 +1,141 @@
+"""Download-authorization benchmark for report media.
+
+Fills a temporary database with N reports (for each N in --sizes), then times
+authorized downloads through the Flask test client: legacy /uploads/<name>
+(media_path looked up via the basename expression index) and
+/attachments/<id>. For comparison it also times the old
+"media_path = ? OR media_path LIKE '%/name'" query directly. Latency of the two
+routes should stay flat as N grows; the LIKE column shows what it replaced.
+
+Run:  python -m bench.upload_bench --sizes 1000 10000 100000 --requests 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+LEGACY_LIKE_SQL = """
+SELECT r.user_id as owner_id, e.created_by as created_by
+FROM event_reports r JOIN events e ON e.id=r.event_id
+WHERE r.media_path = ? OR r.media_path LIKE ?
+UNION ALL
+SELECT r.user_id as owner_id, t.created_by as created_by
+FROM task_reports r JOIN tasks t ON t.id=r.task_id
+WHERE r.media_path = ? OR r.media_path LIKE ?
+LIMIT 1
+"""
+
+
+def _populate(app, n):
+    """Insert n event reports and n task reports; return (owner, sample names, attachment ids)."""
+    from app.auth import hash_password
+    from app.db import get_db, now_iso
+    from app.storage import blob_path
+    uploads = os.path.join(os.path.dirname(app.config["DB_PATH"]), "uploads")
+    os.makedirs(uploads, exist_ok=True)
+    now = now_iso()
+    with app.app_context():
+        db = get_db()
+        owner = db.execute(
+            "INSERT INTO users(username,password_hash,role,created_at) VALUES('bench_vol',?,'volunteer',?)",
+            (hash_password("bench"), now),
+        ).lastrowid
+        org = db.execute("SELECT id FROM users WHERE role='organizer' ORDER BY id LIMIT 1").fetchone()["id"]
+        db.executemany(
+            "INSERT INTO events(id,name,created_by,created_at) VALUES(?,?,?,?)",
+            ((1000 + i, f"bench event {i}", org, now) for i in range(n)),
+        )
+        db.executemany(
+            "INSERT INTO tasks(id,name,created_by,created_at) VALUES(?,?,?,?)",
+            ((1000 + i, f"bench task {i}", org, now) for i in range(n)),
+        )
+        db.executemany(
+            "INSERT INTO attachments(id,sha256,size,mime,original_name,created_at) VALUES(?,?,1,'image/png',?,?)",
+            ((1000 + i, f"{i:064x}", f"a{i}.png", now) for i in range(n)),
+        )
+        db.executemany(
+            "INSERT INTO event_reports(event_id,user_id,report_text,media_path,attachment_id,created_at) VALUES(?,?,?,?,?,?)",
+            ((1000 + i, owner, "bench", os.path.join(uploads, f"event_{1000 + i}_user_{owner}_f{i}.png"), 1000 + i, now) for i in range(n)),
+        )
+        db.executemany(
+            "INSERT INTO task_reports(task_id,user_id,report_text,media_path,created_at) VALUES(?,?,?,?,?)",
+            ((1000 + i, owner, "bench", f"task_{1000 + i}_user_{owner}_f{i}.png", now) for i in range(n)),
+        )
+        db.commit()
+    # Only the sampled files need to exist on disk.
+    picks = sorted({0, n // 2, n - 1})
+    names = [f"event_{1000 + i}_user_{owner}_f{i}.png" for i in picks] + [f"task_{1000 + i}_user_{owner}_f{i}.png" for i in picks]
+    for name in names:
+        with open(os.path.join(uploads, name), "wb") as f:
+            f.write(b"\x89PNG bench")
+    for i in picks:
+        path = blob_path(uploads, f"{i:064x}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"\x89PNG bench")
+    return names, [1000 + i for i in picks]
+
+
+def _timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def bench(n, requests):
+    from app import create_app
+    from app.db import get_db
+    tmp = tempfile.mkdtemp(prefix="greenlink-uploads-")
+    app = create_app({"DB_PATH": os.path.join(tmp, "app.db"), "SEED_ON_FIRST_RUN": True, "TESTING": True})
+    names, att_ids = _populate(app, n)
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s["csrf_token"] = "bench"
+    client.post("/login", data={"username": "bench_vol", "password": "bench", "_csrf": "bench"})
+
+    def get(path):
+        resp = client.get(path)
+        resp.get_data()
+        resp.close()
+        if resp.status_code != 200:
+            raise RuntimeError(f"{path} -> {resp.status_code}")
+
+    per = max(1, requests // len(names))
+    legacy = _timed(lambda: [get(f"/uploads/{name}") for name in names], per)
+    per_att = max(1, requests // len(att_ids))
+    attach = _timed(lambda: [get(f"/attachments/{i}") for i in att_ids], per_att)
+    with app.app_context():
+        db = get_db()
+        name = names[len(names) // 2]
+        like = _timed(lambda: db.execute(LEGACY_LIKE_SQL, (name, f"%/{name}", name, f"%/{name}")).fetchone(), 20)
+    return {
+        "uploads": tuple(v / len(names) for v in legacy),
+        "attachments": tuple(v / len(att_ids) for v in attach),
+        "like_query": like,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.upload_bench")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    print(f"{'reports/table':>13} | {'/uploads p50/p95 ms':>20} | {'/attachments p50/p95 ms':>24} | {'old LIKE query p50 ms':>21}")
+    for n in args.sizes:
+        r = bench(n, args.requests)
+        print(
+            f"{n:>13} | {r['uploads'][0]:>9.2f} / {r['uploads'][1]:<8.2f} | "
+            f"{r['attachments'][0]:>11.2f} / {r['attachments'][1]:<10.2f} | {r['like_query'][0]:>21.2f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,34 @@
+"""gunicorn settings, loaded automatically when gunicorn starts in this directory.
+
+Workers share Prometheus metrics through PROMETHEUS_MULTIPROC_DIR (see
+app/metrics.py). It must be set before the workers import the app, and be
+emptied when the master starts, or totals of a previous run would be added in.
+
+Workers are threaded (gthread): each process serves GUNICORN_THREADS requests
+at once. The per-process limits in the app assume this; in particular
+PASSWORD_HASH_QUEUE (app/passwords.py) must stay below the thread count, or
+no login could ever be turned away with 503 and the hash pool would only ever
+see one hash at a time with the sync worker.
+"""
+import os
+import shutil
+
+_data_dir = os.path.dirname(os.path.abspath(os.environ.get("DB_PATH") or os.path.join("data", "app.db")))
+metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(_data_dir, "metrics"))
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+
+
+def on_starting(server):
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Drop the dead worker's live gauges (requests in flight); its counters stay in the totals.
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,179 @@
+"""Shared fixtures: a seeded app driven once through every route.
+
+The `walked` fixture records each SQL statement the routes execute (with the
+endpoint that ran it; PRAGMAs and transaction control left out) and how many
+statements every request of the walk ran.
+"""
+import io
+import os
+
+import pytest
+from flask import g, request
+
+from app import create_app
+from app.db import get_db
+
+_SKIP = ("PRAGMA", "BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "EXPLAIN")
+
+
+def route_walk():
+    """(method, path, data, username) for every route, in an order that builds on earlier writes."""
+    from app.routes import _encode_cursor
+    by_start = _encode_cursor(["2026-01-15T10:00:00", 2])
+    by_id = _encode_cursor([2])
+    return [
+        ("GET", f"/events?after={by_start}", None, None),
+        ("GET", f"/tasks?before={by_start}", None, None),
+        ("GET", f"/manage/applications?status=all&e_after={by_id}&t_before={by_id}", None, "admin"),
+        ("GET", f"/manage/reports?status=all&e_after={by_id}&t_after={by_id}", None, "org1"),
+        ("GET", f"/admin?u_after={by_id}&er_before={by_id}&tr_after={by_id}", None, "admin"),
+        ("GET", "/", None, None),
+        ("GET", "/about", None, None),
+        ("GET", "/events", None, None),
+        ("GET", "/events/1", None, None),
+        ("GET", "/tasks", None, None),
+        ("GET", "/tasks/1", None, None),
+        ("GET", "/register", None, None),
+        ("POST", "/register", {"username": "planvol", "password": "planvol"}, None),
+        ("GET", "/events/1", None, "vol1"),
+        ("POST", "/events/1/apply", {"needs_release": "1"}, "vol1"),
+        ("POST", "/tasks/1/apply", {}, "vol1"),
+        ("POST", "/events/1/apply", {}, "vol2"),
+        ("POST", "/tasks/1/apply", {}, "vol2"),
+        ("GET", "/manage", None, "org1"),
+        ("GET", "/manage/applications", None, "org1"),
+        ("GET", "/manage/applications?status=all", None, "org1"),
+        ("POST", "/manage/applications/event/1/approve", {}, "org1"),
+        ("POST", "/manage/applications/task/1/approve", {}, "org1"),
+        ("POST", "/manage/applications/event/2/reject", {}, "org1"),
+        ("POST", "/manage/applications/task/2/reject", {}, "org1"),
+        ("POST", "/manage/applications/bulk", {"action": "approve", "ids": ["event:1", "event:2", "task:2"]}, "org1"),
+        ("POST", "/manage/applications/bulk", {"action": "reject", "ids": ["event:2"]}, "admin"),
+        ("GET", "/reports/event/1", None, "vol1"),
+        ("POST", "/reports/event/1", {"report_text": "план", "media": (io.BytesIO(b"img"), "plan.png")}, "vol1"),
+        ("POST", "/reports/task/1", {"report_text": "план"}, "vol1"),
+        ("POST", "/manage/reports/bulk", {"action": "approve", "ids": ["event:1", "task:1"]}, "org1"),
+        ("POST", "/manage/reports/bulk", {"action": "reject", "ids": ["task:1"]}, "admin"),
+        ("GET", "/profile", None, "vol1"),
+        ("POST", "/profile", {"full_name": "Vol One", "age": "21"}, "vol1"),
+        ("GET", "/attachments/1", None, "org1"),
+        ("GET", "/attachments/1", None, "vol2"),
+        ("GET", "/attachments/1/thumb", None, "org1"),
+        ("GET", "/uploads/event_1_user_3_plan.png", None, "org1"),
+        ("GET", "/manage/reports", None, "org1"),
+        ("GET", "/manage/reports?status=approved", None, "org1"),
+        ("GET", "/manage/reports?status=rejected", None, "org1"),
+        ("GET", "/manage/reports?status=all", None, "org1"),
+        ("POST", "/manage/reports/event/1/approve", {}, "org1"),
+        ("POST", "/manage/reports/task/1/reject", {}, "org1"),
+        ("POST", "/manage/reports/event/1/delete_file", {}, "org1"),
+        ("POST", "/manage/reports/task/1/delete_file", {}, "org1"),
+        ("POST", "/manage/events/new", {"name": "План", "points": "1", "max_participants": "3"}, "org1"),
+        ("POST", "/manage/events/3/edit", {"name": "План 2", "points": "1"}, "org1"),
+        ("POST", "/manage/events/3/delete", {}, "org1"),
+        ("POST", "/manage/tasks/new", {"name": "План", "points": "1"}, "org1"),
+        ("POST", "/manage/tasks/3/edit", {"name": "План 2", "points": "1"}, "org1"),
+        ("POST", "/manage/tasks/3/delete", {}, "org1"),
+        ("GET", "/manage", None, "admin"),
+        ("GET", "/manage/applications", None, "admin"),
+        ("GET", "/manage/applications?status=all", None, "admin"),
+        ("GET", "/manage/reports?status=all", None, "admin"),
+        ("GET", "/admin", None, "admin"),
+        ("GET", "/admin?q=vol", None, "admin"),
+        ("GET", "/search?q=парк", None, None),
+        ("GET", "/search?q=уборка&kind=events&page=2", None, None),
+        ("GET", "/search?q=план", None, "org1"),
+        ("GET", "/search?q=vol&kind=users", None, "admin"),
+        ("GET", "/search?q=план&kind=reports", None, "admin"),
+        ("POST", "/admin/universities/add", {"name": "План-универ"}, "admin"),
+        ("POST", "/admin/universities/4/delete", {}, "admin"),
+        ("POST", "/admin/users/4/warn", {}, "admin"),
+        ("POST", "/admin/users/4/toggle_block", {}, "admin"),
+        ("POST", "/admin/users/4/role", {"role": "organizer"}, "admin"),
+        ("POST", "/admin/reports/event/1/approve", {}, "admin"),
+        ("POST", "/admin/reports/task/1/approve", {}, "admin"),
+        ("POST", "/admin/reports/event/1/reject", {}, "admin"),
+        ("POST", "/admin/reports/task/1/reject", {}, "admin"),
+        ("GET", "/admin/audit", None, "admin"),
+        ("GET", "/admin/audit?actor=admin", None, "admin"),
+        ("GET", "/admin/audit?action=export_users&a_before=" + by_id, None, "admin"),
+        ("GET", "/admin/audit?from=2020-01-01&to=2099-12-31", None, "admin"),
+        ("GET", "/admin/export/users.csv?async=1", None, "admin"),
+        ("GET", "/admin/jobs", None, "admin"),
+        ("GET", "/admin/jobs?status=queued&name=export_csv", None, "admin"),
+        ("GET", "/admin/perf", None, "admin"),
+        ("GET", "/metrics", None, None),
+        ("GET", "/admin/perf?route=main.events", None, "admin"),
+        ("POST", "/admin/perf/reset", {}, "admin"),
+        ("GET", "/admin/export/users.csv", None, "admin"),
+        ("GET", "/admin/export/events.csv", None, "admin"),
+        ("GET", "/admin/export/reports.csv", None, "admin"),
+        ("GET", "/admin/export/users.csv?since_id=2", None, "admin"),
+        ("GET", "/admin/export/events.csv?since_id=1&from=2020-01-01&to=2099-12-31", None, "admin"),
+        ("GET", "/admin/export/reports.csv?kind=task&since_id=1", None, "admin"),
+    ]
+
+
+def _counted(sql):
+    head = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+    return bool(head) and head not in _SKIP and not head.startswith("--")
+
+
+def collect_statements(app, counts=None):
+    """Run the walk and return [(endpoint, sql)] in execution order.
+
+    If `counts` is a dict, it is filled with {(method, path, username): statements}.
+    """
+    seen = []
+
+    @app.before_request
+    def _trace_queries():
+        endpoint = request.endpoint
+        get_db().set_trace_callback(lambda sql: seen.append((endpoint, sql)))
+
+    @app.teardown_request
+    def _untrace_queries(error=None):
+        db = g.get("db")
+        if db is not None:
+            db.set_trace_callback(None)
+
+    client = app.test_client()
+    logged_in = None
+    for method, path, data, username in route_walk():
+        if username != logged_in:
+            client.get("/logout")
+            if username:
+                _post(client, "/login", {"username": username, "password": username})
+            logged_in = username
+        before = len(seen)
+        if method == "GET":
+            resp = client.get(path, follow_redirects=False)
+        else:
+            resp = _post(client, path, data or {})
+        # Drain streamed bodies (CSV exports) so their generators finish now.
+        resp.get_data()
+        resp.close()
+        if counts is not None:
+            counts[(method, path, username)] = sum(1 for _, sql in seen[before:] if _counted(sql))
+        if resp.status_code >= 500:
+            raise RuntimeError(f"{method} {path} -> {resp.status_code}")
+    return seen
+
+
+def _post(client, path, data):
+    with client.session_transaction() as s:
+        token = s.setdefault("csrf_token", "tests")
+    return client.post(path, data={**data, "_csrf": token}, content_type="multipart/form-data")
+
+
+@pytest.fixture(scope="session")
+def walked(tmp_path_factory):
+    """(app, [(endpoint, sql)], {(method, path, username): statements}) for the whole walk."""
+    # User cache off: every request runs the session lookup, so counts do not depend on cache state.
+    app = create_app({
+        "DB_PATH": os.path.join(tmp_path_factory.mktemp("walk"), "app.db"),
+        "SEED_ON_FIRST_RUN": True, "TESTING": True, "USER_CACHE_TTL": 0,
+    })
+    counts = {}
+    statements = [(endpoint, sql) for endpoint, sql in collect_statements(app, counts) if _counted(sql)]
+    return app, statements, counts
@@ -0,0 +1,136 @@
+"""Capacity stress test for application/approval races.
+
+Starts several worker processes (each with its own create_app() and connection
+pool, like gunicorn workers) against one shared SQLite file. They fire
+concurrent applies at an event and a task with a small max_participants, then
+race to approve everything after the limit has been lowered. Each item must
+end up exactly at capacity: more is overbooking, fewer means requests failed
+for some other reason. The trigger-maintained counters must not drift.
+"""
+import multiprocessing as mp
+import random
+
+import pytest
+
+from app import create_app
+from app.auth import hash_password
+from app.db import get_db, now_iso, recount_application_counters
+
+PROCS = 8
+VOLUNTEERS = 80
+CAPACITY = 10
+
+
+def _client(db_path):
+    app = create_app({"DB_PATH": db_path, "SEED_ON_FIRST_RUN": False, "TESTING": True})
+    return app.test_client()
+
+
+def _post(client, path, data=None):
+    with client.session_transaction() as s:
+        token = s.setdefault("csrf_token", "stress")
+    return client.post(path, data={**(data or {}), "_csrf": token})
+
+
+def _login(client, username):
+    client.get("/logout")
+    resp = _post(client, "/login", {"username": username, "password": "stress"})
+    if resp.status_code != 302:
+        raise RuntimeError(f"login failed for {username}")
+
+
+def _apply_worker(db_path, usernames, event_id, task_id, barrier):
+    client = _client(db_path)
+    barrier.wait()
+    for username in usernames:
+        _login(client, username)
+        _post(client, f"/events/{event_id}/apply")
+        _post(client, f"/tasks/{task_id}/apply")
+
+
+def _approve_worker(db_path, organizer, event_app_ids, task_app_ids, barrier):
+    client = _client(db_path)
+    _login(client, organizer)
+    ids = [("event", i) for i in event_app_ids] + [("task", i) for i in task_app_ids]
+    random.shuffle(ids)
+    barrier.wait()
+    for kind, app_id in ids:
+        _post(client, f"/manage/applications/{kind}/{app_id}/approve")
+
+
+def _setup(db_path, volunteers, capacity):
+    app = create_app({"DB_PATH": db_path, "SEED_ON_FIRST_RUN": False})
+    with app.app_context():
+        db = get_db()
+        pw = hash_password("stress")
+        db.execute(
+            "INSERT INTO users(username,password_hash,role,created_at) VALUES(?,?,?,?)",
+            ("stress_org", pw, "organizer", now_iso()),
+        )
+        org_id = db.execute("SELECT id FROM users WHERE username='stress_org'").fetchone()["id"]
+        db.executemany(
+            "INSERT INTO users(username,password_hash,role,created_at) VALUES(?,?,'volunteer',?)",
+            [(f"stress_vol{i}", pw, now_iso()) for i in range(volunteers)],
+        )
+        event_id = db.execute(
+            "INSERT INTO events(name,max_participants,created_by,created_at) VALUES(?,?,?,?)",
+            ("stress event", capacity, org_id, now_iso()),
+        ).lastrowid
+        task_id = db.execute(
+            "INSERT INTO tasks(name,max_participants,created_by,created_at) VALUES(?,?,?,?)",
+            ("stress task", capacity, org_id, now_iso()),
+        ).lastrowid
+        db.commit()
+    return app, event_id, task_id
+
+
+def _run(target, args_per_proc):
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(len(args_per_proc))
+    procs = [ctx.Process(target=target, args=(*args, barrier)) for args in args_per_proc]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    failed = [p.exitcode for p in procs if p.exitcode != 0]
+    assert not failed, f"{len(failed)} worker process(es) failed"
+
+
+@pytest.mark.slow
+def test_capacity_holds_under_concurrent_load(tmp_path):
+    db_path = str(tmp_path / "app.db")
+    app, event_id, task_id = _setup(db_path, VOLUNTEERS, CAPACITY)
+    usernames = [f"stress_vol{i}" for i in range(VOLUNTEERS)]
+
+    # Phase 1: concurrent applies; pending + approved must never exceed the limit.
+    chunks = [usernames[i::PROCS] for i in range(PROCS)]
+    _run(_apply_worker, [(db_path, chunk, event_id, task_id) for chunk in chunks])
+
+    with app.app_context():
+        db = get_db()
+        event_app_ids = [r["id"] for r in db.execute("SELECT id FROM event_applications WHERE event_id=?", (event_id,))]
+        task_app_ids = [r["id"] for r in db.execute("SELECT id FROM task_applications WHERE task_id=?", (task_id,))]
+        # Phase 2: lower the limit, then race approvals from every process.
+        approve_cap = max(1, CAPACITY // 2)
+        db.execute("UPDATE events SET max_participants=? WHERE id=?", (approve_cap, event_id))
+        db.execute("UPDATE tasks SET max_participants=? WHERE id=?", (approve_cap, task_id))
+        db.commit()
+
+    _run(_approve_worker, [(db_path, "stress_org", event_app_ids, task_app_ids)] * PROCS)
+
+    errors = []
+    for label, n_active in (("event applies", len(event_app_ids)), ("task applies", len(task_app_ids))):
+        # Exactly CAPACITY: more is overbooking, fewer means applies failed for another reason.
+        if n_active != CAPACITY:
+            errors.append(f"{label}: {n_active} accepted, expected {CAPACITY}")
+    with app.app_context():
+        db = get_db()
+        for table, fk, item_id in (("event_applications", "event_id", event_id), ("task_applications", "task_id", task_id)):
+            approved = db.execute(f"SELECT COUNT(1) c FROM {table} WHERE {fk}=? AND status='подтверждена'", (item_id,)).fetchone()["c"]
+            if approved != approve_cap:
+                errors.append(f"{table}: {approved} approved, expected {approve_cap}")
+        drift = recount_application_counters(db)
+        db.rollback()
+        if drift:
+            errors.append(f"counters drifted on {drift} item(s)")
+    assert not errors, "\n".join(errors)
@@ -0,0 +1,28 @@
+"""Query-count budget test.
+
+Pins how many SQL statements some pages run per request, so an N+1 loop or an
+extra lookup shows up as a failing case. Counts come from the route walk in
+conftest.py and include the session lookup and the counter queries.
+"""
+import pytest
+
+# Statements per request for pages whose query count must not drift:
+# (method, path, username) -> count. Session lookup and counters included.
+QUERY_BUDGETS = {
+    ("GET", "/manage", "org1"): 5,
+    ("GET", "/manage", "admin"): 5,
+    ("GET", "/manage/applications", "org1"): 5,
+    ("GET", "/manage/applications?status=all", "admin"): 5,
+    ("GET", "/manage/reports", "org1"): 5,
+    ("GET", "/manage/reports?status=all", "admin"): 5,
+}
+
+
+@pytest.mark.parametrize(
+    ("method", "path", "username", "expected"),
+    [(*key, expected) for key, expected in QUERY_BUDGETS.items()],
+    ids=[f"{method} {path} as {username}" for method, path, username in QUERY_BUDGETS],
+)
+def test_query_budget(walked, method, path, username, expected):
+    _app, _statements, counts = walked
+    assert counts.get((method, path, username)) == expected
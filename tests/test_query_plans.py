@@ -0,0 +1,100 @@
+"""Query-plan regression test.
+
+Runs EXPLAIN QUERY PLAN on every statement the route walk (conftest.py)
+executed. Fails if a statement falls back to a full SCAN of one of the large
+tables, or if a streamed CSV export sorts its rows in a temp b-tree.
+"""
+import re
+
+from app.db import get_db
+
+# Tables that grow with usage. A plain "SCAN <table>" over any of them is a regression.
+LARGE_TABLES = {
+    "users",
+    "subscribers",
+    "events",
+    "tasks",
+    "event_applications",
+    "task_applications",
+    "event_reports",
+    "task_reports",
+    "audit_events",
+}
+
+# Full scans we accept on purpose: (endpoint, table) -> reason.
+ALLOWED_SCANS = {
+    ("main.admin_export_users", "users"): "CSV export reads the whole table",
+    ("main.admin_export_events", "events"): "CSV export reads the whole table",
+}
+
+# CSV exports stream with fetchmany(); a temp b-tree for ORDER BY would hold
+# the whole result in memory before the first row is sent.
+STREAMED_ENDPOINTS = {"main.admin_export_users", "main.admin_export_events", "main.admin_export_reports"}
+
+_SCAN_RE = re.compile(r"^SCAN (\w+)(?: AS \w+)?(.*)$")
+# The only SCAN accepted without ALLOWED_SCANS: the first page of an
+# unfiltered listing, i.e. no WHERE (or the builders' "WHERE 1=1"), ordered by
+# the scanned table's id and cut by LIMIT, with every other table looked up by
+# primary key. SQLite walks the rowid b-tree and stops after LIMIT rows.
+_ROWID_PAGE_RE = re.compile(
+    r"(?:WHERE 1=1 )?ORDER BY (?:(\w+)\.)?id(?: ASC| DESC)? LIMIT [?\d]+(?: OFFSET [?\d]+)?$", re.IGNORECASE
+)
+_PK_LOOKUP_RE = re.compile(r"^SEARCH \w+ USING INTEGER PRIMARY KEY \(rowid=\?\)(?: LEFT-JOIN)?$")
+
+
+def _rowid_page_scan(sql, details, scanned):
+    """True if the SCAN of alias `scanned` is a LIMITed walk in rowid order."""
+    flat = " ".join(sql.split())
+    m = _ROWID_PAGE_RE.search(flat)
+    if not m or flat.upper().count("SELECT") != 1:
+        return False
+    if " WHERE " in flat[: m.start() + 1].upper():
+        return False
+    if m.group(1) not in (None, scanned):
+        return False
+    scans = [d for d in details if _SCAN_RE.match(d)]
+    others = [d for d in details if d not in scans]
+    return len(scans) == 1 and all(_PK_LOOKUP_RE.match(d) for d in others)
+
+
+def plan_problems(db, endpoint, sql):
+    """Return a list of human-readable problems for one statement."""
+    try:
+        rows = db.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+    except Exception as e:
+        return [f"cannot EXPLAIN: {e}"]
+    details = [r[3] for r in rows]
+    problems = []
+    if endpoint in STREAMED_ENDPOINTS and any("TEMP B-TREE FOR ORDER BY" in d for d in details):
+        problems.append("streamed export sorts in a temp b-tree")
+    for d in details:
+        m = _SCAN_RE.match(d)
+        if not m or "INDEX" in m.group(2):
+            continue
+        table = _table_for_alias(sql, m.group(1))
+        if table not in LARGE_TABLES:
+            continue
+        if (endpoint, table) in ALLOWED_SCANS:
+            continue
+        if _rowid_page_scan(sql, details, m.group(1)):
+            continue
+        problems.append(f"full scan of {table}: {d}")
+    return problems
+
+
+def _table_for_alias(sql, name):
+    if name in LARGE_TABLES:
+        return name
+    m = re.search(r"\b(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?" + re.escape(name) + r"\b", sql, re.IGNORECASE)
+    return m.group(1) if m else name
+
+
+def test_no_unexpected_full_scans(walked):
+    app, statements, _counts = walked
+    failures = []
+    with app.app_context():
+        db = get_db()
+        for endpoint, sql in sorted(set(statements), key=statements.index):
+            for problem in plan_problems(db, endpoint, sql):
+                failures.append(f"[{endpoint}] {' '.join(sql.split())}\n    {problem}")
+    assert not failures, "\n".join(failures)